@@ -63,9 +63,12 @@ APP_KEYMAPS_DIR			= os.path.join(APP_DATA_DIR, "keymaps")
 APP_THEMES_DIR			= os.path.join(APP_DATA_DIR, "themes")
 APP_LOCALES_DIR			= os.path.join(APP_DATA_DIR, "locales")
 APP_SNIPPETS_DIR		= os.path.join(APP_DATA_DIR, "snippets")
+APP_JOURNAL_DIR			= os.path.join(APP_DATA_DIR, "journal")
 
 PROJECT_SETTINGS_DIR_NAME  = ".ash-editor"
 PROJECT_SETTINGS_FILE_NAME = "settings.json"
+PROJECT_FILE_INDEX_NAME    = "fileindex.dat"
+PROJECT_TRIGRAM_INDEX_NAME = "trigrams.dat"
 
 TEMP_OUTPUT_FILE		= os.path.join(APP_DATA_DIR, "temp.output")
 LOG_FILE 				= os.path.join(APP_DATA_DIR, "log.txt")
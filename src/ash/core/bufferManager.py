@@ -12,61 +12,159 @@ from ash.core.logger import *
 from ash.gui.cursorPosition import *
 from ash.core.editHistory import *
 from ash.core.sessionStorage import *
+from ash.core.textStorage import *
+from ash.core.fileWatcher import *
+from ash.core.fileIndex import *
+from ash.core.searchEngine import *
+from ash.core.trigramIndex import *
+from ash.core.diskWriter import *
+from ash.core.editJournal import *
 from ash.formatting.syntaxHighlighting import *
 from ash.formatting.formatting import *
 
 import time
+import functools
+import concurrent.futures
 
 LARGE_FILE_THRESHOLD	= 1024 * 1024		# large file if size > 1 MB
-BACKUP_FREQUENCY_SIZE	= 16				# backup after every 16 edits
 HISTORY_FREQUENCY_SIZE	= 8					# undo: every 8 edit operations
+LOADER_POLL_INTERVAL	= 0.05				# seconds between progress reports/cancel checks when loading a project
 
-# Buffer class: encapsulates a single buffer/file
+# Buffer class: encapsulates a single buffer/file; a buffer created with lazy=True is only a stub
+# (recording the file's size and modification time) until it is loaded (see load())
 class Buffer:
-	def __init__(self, manager, id, filename = None, encoding = None, has_backup = False):
+	def __init__(self, manager, id, filename = None, encoding = None, has_backup = False, lazy = False):
 		self.manager = manager
 		self.id = id
 		self.filename = normalized_path(filename)
 		self.encoding = encoding
 		self.editors = list()
 		self.display_name = None
+		self.lines = None
+		self.history = None
+		self.formatter = None
+		self.blank_line_count = 0			# kept up to date on every edit, for get_loc()
+		self.loaded = True
+		self.read_only = False				# set for files viewed through a MappedStorage, see set_mapped_lines()
+		self.pending_data = None			# persistent data (see set_persistent_data()) to be restored when a stub is loaded
+		self.modified_externally = False	# set if the file changed on disk while the buffer was not shown in any editor
+		self.edit_version = 0				# incremented on every edit, to tell if a snapshot is still up to date
+		self.save_request = None			# the WriteRequest of the save running in the background, see save_in_background()
+		self.save_error = None				# the exception raised by the last save in the background, if it failed
+		self.journal = None					# the EditJournal of the unsaved edits, see read_file_from_disk()
 		
-		self.backup_edit_count = 0
 		self.undo_edit_count = 0
 		self.last_curpos = CursorPosition(0,0)
 		self.last_called = None
 
 		self.last_read_time = None
 		self.last_write_time = None
-		self.last_backup_time = None
 		
 		if(self.filename == None):
-			self.lines = list()
-			self.lines.append("")
+			self.set_lines([""])
 			self.save_status = False
-			self.backup_file = None
 			self.display_name = "untitled-" + str(self.id + 1)
-			self.formatter = SyntaxHighlighter(self.display_name)
+			self.formatter = self.manager.create_formatter(self.display_name)
 			self.git_diff_lines = set()
+		elif(lazy and not has_backup):
+			stat = os.stat(self.filename)
+			self.file_size = stat.st_size
+			self.file_mtime = stat.st_mtime
+			self.loaded = False
+			self.save_status = True
+			self.git_diff_lines = set()
+			return
 		else:
 			self.git_diff_lines = get_added_lines_from_git_diff(self.filename)
-			if(has_backup):
-				self.backup_file = os.path.dirname(self.filename) + "/.ash.b-" + get_file_title(self.filename)
-				self.read_file_from_disk(True)
-			else:
-				self.read_file_from_disk()			
-			self.formatter = SyntaxHighlighter(self.filename)
+			self.read_file_from_disk()
+			if(has_backup): self.recover_from_journal()
+			self.formatter = self.manager.create_formatter(self.filename, self.read_only)
 		
-		self.history = EditHistory(self.lines, CursorPosition(0,0))
+		self.create_history()
 		if(self.encoding == None): self.encoding = self.manager.app.settings_manager.get_setting("default_encoding")
 
+	# wraps a list of lines in the storage engine selected in the settings
+	def create_storage(self, lines):
+		return create_text_storage(lines, self.manager.app.settings_manager.get_setting("text_storage_engine"))
+
+	# replaces the contents of the buffer with the given list of lines
+	def set_lines(self, lines):
+		if(self.lines == None or self.read_only):
+			if(self.lines != None): self.lines.close()
+			self.read_only = False
+			self.lines = self.create_storage(lines)
+			self.lines.add_listener(self.on_lines_changed)
+			self.blank_line_count = self.count_blank_lines(self.lines)
+		else:
+			self.lines.set_lines(lines)
+
+	# shows the file read-only through a MappedStorage, which reads the lines from disk as they are needed
+	def set_mapped_lines(self, storage):
+		if(self.lines != None): self.lines.close()
+		self.lines = storage
+		self.read_only = True
+		self.blank_line_count = 0
+		if(self.formatter != None): self.formatter = self.manager.create_formatter(self.filename, True)
+
+	# starts a new (empty) edit history
+	def create_history(self):
+		self.set_history(EditHistory(CursorPosition(0,0)))
+
+	# replaces the edit history (e.g. with one restored from a session), and binds it
+	# to the memory limits set in the settings
+	def set_history(self, history):
+		limit, total_limit = self.manager.get_undo_memory_limits()
+		self.manager.undo_budget.limit = total_limit
+		if(self.history != None): self.history.set_budget(None)
+		self.history = history
+		self.history.set_limit(limit)
+		self.history.set_budget(self.manager.undo_budget)
+
+	# called by the text storage after every edit made to the buffer
+	def on_lines_changed(self, start, old_lines, new_lines):
+		self.edit_version += 1
+		if(self.journal != None): self.journal.record(self.edit_version, start, len(old_lines), new_lines)
+		if(self.history != None): self.history.record(start, old_lines, new_lines)
+		if(self.formatter != None): self.formatter.notify_lines_changed(start, len(old_lines), len(new_lines))
+		self.blank_line_count += self.count_blank_lines(new_lines) - self.count_blank_lines(old_lines)
+		for ed in self.editors:
+			ed.notify_lines_changed(start, len(old_lines), len(new_lines))
+
 	# set the text encoding for the buffer
 	def set_encoding(self, encoding):
 		self.encoding = encoding
 
+	# reads the file of a stub buffer (does nothing if the buffer has already been loaded); raises AshException
+	# if the file has been deleted, or can no longer be read as a text file, since the stub was created
+	def load(self, preread = None):
+		if(self.loaded): return
+		if(preread != None):
+			# (encoding, git_diff_lines, lines) already read off the UI thread by the project loader
+			self.encoding, self.git_diff_lines, lines = preread
+			self.read_file_from_disk(lines=lines)
+		else:
+			if(not os.path.isfile(self.filename)): raise(AshException("File no longer exists: " + self.filename))
+			if(self.encoding == None): self.encoding = predict_file_encoding(self.filename)
+			if(self.encoding == None): self.encoding = self.manager.app.settings_manager.get_setting("default_encoding")
+
+			self.git_diff_lines = get_added_lines_from_git_diff(self.filename)
+			self.read_file_from_disk()
+		if(self.manager.file_index != None): self.manager.file_index.set_encoding(self.filename, self.encoding)
+		self.formatter = self.manager.create_formatter(self.filename, self.read_only)
+		self.create_history()
+		self.loaded = True
+
+		if(self.pending_data != None):
+			self.restore_persistent_data(self.pending_data)
+			self.pending_data = None
+
 	# attach an editor to the list of editors mapped to this buffer
 	def attach_editor(self, editor):
+		self.load()
 		if(editor not in self.editors): self.editors.append(editor)
+		if(self.modified_externally):
+			self.modified_externally = False
+			self.check_if_modified_externally()
 		
 	# remove an attached editor from the list of editors
 	def detach_editor(self, editor):
@@ -81,49 +179,41 @@ class Buffer:
 		return (False if self.filename == None else True)
 
 	def add_change(self, curpos):
-		self.history.add_change(self.lines, curpos)
+		self.history.add_change(curpos)
 		self.undo_edit_count = 0
 		self.last_curpos = curpos
 
 	# revert the buffer to its previous state
 	def do_undo(self):
-		if(self.undo_edit_count > 0): 		# add the latest change forcefully
-			self.history.add_change(self.lines, self.last_curpos)
-			self.undo_edit_count = 0
+		# add the latest change forcefully
+		self.history.add_change(self.last_curpos)
+		self.undo_edit_count = 0
 
-		hdata = self.history.undo()
-		if(hdata == None):
+		curpos = self.history.undo(self.lines)
+		if(curpos == None):
 			beep()
 		else:
-			self.lines = copy.copy(hdata.data)
 			for ed in self.editors:
-				ed.curpos = copy.copy(hdata.curpos)
+				ed.curpos = copy.copy(curpos)
 				ed.notify_update()
 
 	# revert the buffer to its previous state by cancelling the last do_undo() operation
 	def do_redo(self):
-		hdata = self.history.redo()
-		if(hdata == None):
+		curpos = self.history.redo(self.lines)
+		if(curpos == None):
 			beep()
 		else:
-			self.lines = copy.copy(hdata.data)
 			for ed in self.editors:
-				ed.curpos = copy.copy(hdata.curpos)
+				ed.curpos = copy.copy(curpos)
 				ed.notify_update()
 
 	# keeps track of the number of edit operations performed on the buffer
 	# this is called after every edit by the editor
 	def update(self, curpos, caller):
 		self.save_status = False
-		
-		if(self.backup_file != None and self.backup_edit_count >= BACKUP_FREQUENCY_SIZE):
-			self.make_backup()
-			self.backup_edit_count = 0
-		else:
-			self.backup_edit_count += 1
 
 		if(self.undo_edit_count >= HISTORY_FREQUENCY_SIZE):
-			self.history.add_change(self.lines, curpos)
+			self.history.add_change(curpos)
 			self.undo_edit_count = 0
 		else:
 			self.undo_edit_count += 1
@@ -133,19 +223,11 @@ class Buffer:
 		
 		self.last_curpos = curpos
 		self.last_caller = caller
-		self.check_if_modified_externally()
 
-	# same as update() but forces the buffer to save changes to its edit-history,
-	# and to make a backup if desired
-	def major_update(self, curpos, caller, make_backup = False):
+	# same as update() but forces the buffer to save changes to its edit-history
+	def major_update(self, curpos, caller):
 		self.save_status = False
-		if(make_backup): 
-			self.make_backup()
-			self.backup_edit_count = 0
-		else:
-			self.backup_edit_count += 1
-		
-		self.history.add_change(self.lines, curpos)
+		self.history.add_change(curpos)
 		self.undo_edit_count = 0
 		
 		for ed in self.editors:
@@ -153,11 +235,19 @@ class Buffer:
 
 		self.last_curpos = curpos
 		self.last_caller = caller
-		self.check_if_modified_externally()
+
+	# called when the file watcher reports that the file has been changed, created or deleted on disk:
+	# buffers not shown in any editor are checked when they are next shown
+	def on_file_changed(self):
+		if(not self.loaded): return			# stubs are read afresh when loaded
+		if(len(self.editors) > 0):
+			self.check_if_modified_externally()
+		else:
+			self.modified_externally = True
 	
 	# check if the file has been modified externally or has been deleted
 	def check_if_modified_externally(self):
-		if(self.filename == None): return
+		if(self.filename == None or self.is_saving()): return		# the change is the buffer being saved
 		last_time = max([self.last_read_time, self.last_write_time])
 		if(os.path.isfile(self.filename)):
 			last_mod_time = BufferManager.get_last_modified(self.filename)
@@ -166,64 +256,107 @@ class Buffer:
 					self.reload_from_disk()
 				else:
 					self.last_read_time = last_mod_time
-		else:
-			self.make_backup()
+					if(self.journal != None): self.journal.set_text(self.lines, self.edit_version)		# the file no longer matches the buffer
+		elif(not self.read_only):			# a mapped file can still be viewed after it has been deleted
+			if(self.journal != None): self.journal.set_text(self.lines, self.edit_version)
 			if(self.manager.app.ask_question("FILE DELETED", "This file no longer exists on disk.\nDo you want to recreate it?")):
 				# recreate the file
 				self.write_to_disk(self.filename)
 			else:
 				# treat as unsaved buffer
 				self.filename = None
-				self.backup_file = None
+				self.discard_journal()
 				self.display_name = "untitled-" + str(self.id + 1)
 				self.last_read_time = None
 				self.last_write_time = None
-				self.last_backup_time = None
 				self.save_status = False
 				for ed in self.editors:
 					ed.notify_update()
 
 	def decode_unicode(self):
-		if(self.undo_edit_count > 0): 		# add the latest change forcefully
-			self.history.add_change(self.lines, self.last_curpos)
-			self.undo_edit_count = 0
+		# add the latest change forcefully
+		self.history.add_change(self.last_curpos)
+		self.undo_edit_count = 0
 
-		for index, line in enumerate(self.lines):
+		# walk backwards so that splitting a line does not shift the lines yet to be visited
+		for index in range(len(self.lines)-1, -1, -1):
+			line = self.lines[index]
 			dec_line = get_unicode_encoded_line(line)
+			if(dec_line == line): continue
 			sub_lines = dec_line.splitlines()			# if they contained newlines
-			self.lines.pop(index)
-			for i in range(len(sub_lines)-1, -1, -1):
-				self.lines.insert(index, sub_lines[i])
-			self.encoding = self.manager.app.settings_manager.get_setting("default_encoding")
+			if(len(sub_lines) == 0): sub_lines = [""]
+			self.lines.replace_lines(index, index + 1, sub_lines)
+		self.encoding = self.manager.app.settings_manager.get_setting("default_encoding")
+		self.history.add_change(self.last_curpos)
 
 		for ed in self.editors:
 			ed.notify_update()
 	
-	# write out a copy
+	# write out a copy (atomically, see write_text_lines())
 	def write_a_copy(self, filename, encoding = None):
 		if(encoding == None): encoding = self.manager.app.settings_manager.get_setting("default_encoding")
-		textFile = codecs.open(filename, "w", encoding)
-		for line in self.lines:
-			textFile.write(line + "\n")
-		textFile.close()
+		write_text_lines(filename, self.lines, encoding)
 
 	# writes out the buffer to a file on disk
 	def write_to_disk(self, filename = None):
 		if(self.filename == None and filename == None): raise(AshException("Error 1: buffer.write_to_disk()"))
-		if(filename != None): self.filename = normalized_path(filename)		# update filename even if filename has changed
+		if(filename != None): 
+			self.filename = normalized_path(filename)		# update filename even if filename has changed
+			self.manager.file_watcher.watch_directory(os.path.dirname(self.filename))
 		
-		self.formatter = SyntaxHighlighter(self.filename)
+		# an older snapshot being saved in the background must not overwrite this one
+		self.manager.disk_writer.cancel(self.filename)
+		self.save_request = None
+		self.save_error = None
+		self.write_a_copy(self.filename, self.encoding)
+		return self.on_written()
+
+	# saves the buffer to its file on the background writer (see DiskWriter) instead of waiting for the file to be
+	# written; the buffer is marked saved when the save completes, see on_write_completed()
+	def save_in_background(self):
+		if(self.filename == None): raise(AshException("Error 1: buffer.save_in_background()"))
+		self.save_request = WriteRequest(self, self.filename, self.lines.to_list(), self.encoding)
+		self.save_error = None
+		self.manager.disk_writer.submit(self.save_request)
+
+	# checks if a save is running in the background
+	def is_saving(self):
+		return (self.save_request != None)
+
+	# called from the event-loop when a snapshot of this buffer has been saved by the background writer
+	def on_write_completed(self, request):
+		if(request is not self.save_request): return			# superseded by a later save
+		self.save_request = None
+		if(request.error != None):
+			self.save_error = request.error
+			log_error(f"unable to save {request.filename}: {request.error}")
+		else:
+			self.on_written(request.stat, request.version)
+		for ed in self.editors:
+			ed.notify_update()
+
+	# updates the state of the buffer after it has been written out to its file: st and version (the os.stat_result
+	# of the file and the edit the lines written were taken at) default to the current ones; if the buffer has
+	# been edited since the lines were taken, it remains unsaved and its journal keeps those edits
+	def on_written(self, st = None, version = None):
+		if(st == None): st = os.stat(self.filename)
+		if(version == None): version = self.edit_version
+		# the lexer (and with it the styles cached by the formatter) only changes if the file has been renamed
+		if(self.formatter == None or self.formatter.filename != self.filename): self.formatter = self.manager.create_formatter(self.filename, self.read_only)
 		self.display_name = None
 
-		self.write_a_copy(self.filename, self.encoding)
+		if(self.manager.trigram_index != None): self.manager.trigram_index.reindex_file(self.filename)
 		
 		self.last_write_time = time.time()
 		if(self.last_read_time == None): self.last_read_time = self.last_write_time
 
-		self.save_status = True
-		self.backup_file = os.path.dirname(self.filename) + "/.ash.b-" + get_file_title(self.filename)
+		self.save_status = (version == self.edit_version)
+		if(self.journal == None or self.journal.filename != self.filename):
+			self.discard_journal()
+			self.journal = EditJournal(self.filename, st)
+		else:
+			self.journal.rebase(st, version, self.lines)
 
-		self.backup_edit_count = 0
 		self.undo_edit_count = 0
 		if(self.manager.app.app_mode != APP_MODE_PROJECT): 
 			self.manager.app.session_storage.add_opened_file_to_record(self.filename)
@@ -239,6 +372,7 @@ class Buffer:
 			self.manager.app.settings_manager.reload_settings()
 			self.manager.app.theme_manager.refresh_theme()
 			self.manager.app.localisation_manager.refresh_locale()
+			self.manager.apply_undo_memory_limits()
 			self.reload_from_disk()		# this is needed if bogus theme/language set then it will revert to default: this change will be missed by ash unless this function is called
 			
 			aed = self.manager.app.main_window.get_active_editor()
@@ -253,21 +387,25 @@ class Buffer:
 		else:
 			return False
 
-	# returns the number of non-empty lines in the buffer
+	# returns the number of lines containing only whitespace
+	def count_blank_lines(self, lines):
+		count = 0
+		for x in lines:
+			if(len(x.strip()) == 0): count += 1
+		return count
+
+	# returns the number of lines, and the number of non-empty lines in the buffer (None if not known)
 	def get_loc(self):
 		nlines = len(self.lines)
-		sloc = 0
-		
-		for x in self.lines:
-			if(len(x.strip()) == 0):
-				sloc += 1
-
-		return (nlines, nlines - sloc)
+		return (nlines, (None if self.read_only else nlines - self.blank_line_count))
 
 	# reloads the file from disk
 	def reload_from_disk(self):
 		if(self.filename != None):
+			# the reload is recorded as a separate edit, so that it can be undone
+			self.history.add_change(self.last_curpos)
 			self.read_file_from_disk()
+			self.history.add_change(self.last_curpos)
 			self.display_name = None
 			self.git_diff_lines = get_added_lines_from_git_diff(self.filename)
 
@@ -287,6 +425,10 @@ class Buffer:
 	def format_code(self, text):
 		return self.formatter.format_code(text)
 
+	# returns the syntax-highlighting of the given line, in the context of the lines before it
+	def get_line_styles(self, line_index):
+		return self.formatter.get_line_styles(self.lines, line_index)
+
 	# checks if buffer can be safely destroyed without prompting the user about saving changes
 	def can_destroy(self):
 		if(self.save_status): return True
@@ -294,44 +436,73 @@ class Buffer:
 		if(self.is_empty()): return True
 		return False
 	
-	# removes any backup files if they exist, called when user deliberately discards unsaved changes
+	# releases the journal when the buffer is destroyed: it is only deleted once the buffer has been saved, so that
+	# edits which could not be saved can still be recovered (see BufferManager.discard_unsaved_changes())
 	def destroy(self):
-		if(self.backup_file != None and os.path.isfile(self.backup_file)): 
-			os.remove(self.backup_file)
+		if(self.save_status):
+			self.discard_journal()
+		elif(self.journal != None):
+			self.journal.close()
+
+	# deletes the journal of the buffer, if any
+	def discard_journal(self):
+		if(self.journal == None): return
+		self.journal.discard()
+		self.journal = None
+
+	# recovers the edits which had not been saved when the editor last exited abnormally (see EditJournal)
+	def recover_from_journal(self):
+		if(self.journal == None): return
+		lines = self.journal.replay(self.lines)
+		if(lines == None): return
+		journal, self.journal = self.journal, None			# the recovered edits are in the journal already
+		self.set_lines(lines)
+		self.journal = journal
+		self.edit_version = max([self.edit_version, journal.last_version])
+		self.save_status = False
 
 	def get_persistent_data(self):
-		return ProjectBufferData(self.filename, self.backup_edit_count, self.undo_edit_count, self.history, max([self.last_read_time, self.last_write_time]))
+		if(not self.loaded): return self.pending_data
+		if(self.read_only): return None
+		self.history.add_change(self.last_curpos)
+		self.history.set_fingerprint(self.lines)
+		return ProjectBufferData(self.filename, self.undo_edit_count, self.history, max([self.last_read_time, self.last_write_time]))
+
+	# restores the persistent data (of a previous session), unless the file has been modified since
+	def restore_persistent_data(self, buffer_data):
+		last_mod_time = BufferManager.get_last_modified(self.filename)
+		if(last_mod_time > buffer_data.last_write_time): return			# ignore undo history since file modified externally
+		if(not isinstance(buffer_data.history, EditHistory) or not buffer_data.history.is_applicable_to(self.lines)): return
+
+		self.undo_edit_count = buffer_data.undo_edit_count
+		self.set_history(buffer_data.history)
 		
 	# <------------------- private functions ---------------------->
 
-	# makes a backup of the data
-	def make_backup(self):
-		if(self.backup_file == None): return
-		self.write_a_copy(self.backup_file, self.encoding)
-		self.last_backup_time = time.time()
-
-	# reads data from the assigned file on disk; optionally from a backup file instead
-	def read_file_from_disk(self, read_from_backup = False):
-		filename = (self.backup_file if read_from_backup else self.filename)
+	# reads data from the assigned file on disk (lines if already read); the edits made from then on are journalled
+	def read_file_from_disk(self, lines = None):
+		filename = self.filename
+		self.discard_journal()				# the buffer no longer holds unsaved edits
 
-		if(self.manager.is_binary(filename, self.manager.app)): raise(AshException("Error: buffer: attempting to read binary file"))
+		if(lines == None):
+			if(self.manager.is_binary(filename, self.manager.app)): raise(AshException("Error: buffer: attempting to read binary file"))
 
-		if(not os.path.isfile(filename)):
-			textFile = codecs.open(filename, "w", self.encoding)
-			textFile.close()
+			if(not os.path.isfile(filename)):
+				textFile = codecs.open(filename, "w", self.encoding)
+				textFile.close()
 
 		try:
-			if(int(os.stat(filename).st_size) > LARGE_FILE_THRESHOLD):
-				self.lines = self.manager.app.load_file(filename, self.encoding)
-				if(self.lines == None): raise(AshFileReadAbortedException(filename))
+			st = os.stat(filename)			# taken before reading, so that a change made while reading is noticed
+			if(lines != None):
+				self.set_lines(lines)
+			elif(self.manager.should_map_file(filename, self.encoding)):
+				self.set_mapped_lines(MappedStorage(filename, self.encoding))
+			elif(int(st.st_size) > LARGE_FILE_THRESHOLD):
+				lines = self.manager.app.load_file(filename, self.encoding)
+				if(lines == None): raise(AshFileReadAbortedException(filename))
+				self.set_lines(lines)
 			else:
-				self.lines = list()
-				textFile = codecs.open(filename, "r", self.encoding)
-				data  = " "
-				while(len(data) > 0):
-					data = textFile.readline()
-					self.lines.append(data[:-1])
-				textFile.close()
+				self.set_lines(BufferManager.read_lines(filename, self.encoding))
 
 			self.last_read_time = time.time()
 			if(self.last_write_time == None): self.last_write_time = self.last_read_time
@@ -340,70 +511,34 @@ class Buffer:
 		except:			
 			raise(AshException("error reading file: " + filename))
 
-		if(not read_from_backup): 
-			self.backup_file = os.path.dirname(self.filename) + "/.ash.b-" + get_file_title(self.filename)
-			self.save_status = True
-		else:
-			self.save_status = False
-
-		self.backup_edit_count = 0
+		if(not self.read_only): self.journal = EditJournal(filename, st)
+		self.save_status = True
 		self.undo_edit_count = 0
 		
-		if(not read_from_backup and self.manager.app.app_mode != APP_MODE_PROJECT): 
+		if(self.manager.app.app_mode != APP_MODE_PROJECT): 
 			self.manager.app.session_storage.add_opened_file_to_record(self.filename)
 		return 0
 
 	# splits the raw-data (read from a file) into separate lines
 	def render_data_to_lines(self, text):
-		self.lines = list()
 		if(len(text) == 0):
-			self.lines.append("")
+			lines = [""]
 		else:
 			lines = text.splitlines()
-			for line in lines:
-				self.lines.append(line)
-			if(text.endswith("\n")): self.lines.append("")
-
-	def find_all(self, search_text, match_case, whole_words, is_regex):
-		# return a list of tuples(line_index, pos)
-		search_results = list()
-		for line_index, line in enumerate(self.lines):
-			lower_text = line.lower()
-			lower_stext = search_text.lower()
-			
-			corpus = (line if match_case else lower_text)
-			
-			if(is_regex or match_case):
-				search = search_text
-			else:
-				search = lower_stext
-
-			pos = -1
-			while(True):
-				if(is_regex):
-					pos = find_regex(corpus[pos+1:], search)
-				elif(whole_words):
-					pos = find_whole_word(corpus[pos+1:], search)
-				else:
-					pos = corpus.find(search, pos+1)
-
-				if(pos >= 0):
-					search_results.append( (line_index, pos) )
-				else:
-					break
-		return search_results
-
-	def replace_all(self, search_result, length, replace_text):
-		count = 0
-		for result in search_result:
-			line_index = result[0]
-			pos = result[1]
-			data = self.lines[line_index]
-			self.lines[line_index] = data[0:pos] + replace_text + data[pos+length:]
-			self.save_status = False
-			count += 1
-		self.major_update(self.last_curpos, None, True)
-		return count
+			if(text.endswith("\n")): lines.append("")
+		self.set_lines(lines)
+		self.create_history()
+
+	# replaces the matches found by find_all() with replace_text, rewriting each affected line once;
+	# the replacements make up a single undo step, returns the number of replacements made
+	def replace_all(self, search_results, replace_text, curpos = None, caller = None):
+		if(len(search_results) == 0): return 0
+		if(curpos == None): curpos = self.last_curpos
+		self.history.add_change(curpos)			# keep earlier edits out of the undo step
+		for line_index, line in replace_matches(self.lines, search_results, replace_text).items():
+			self.lines[line_index] = line
+		self.major_update(curpos, caller)
+		return len(search_results)
 
 # Buffer Manager class: for keeping track of the list of all active buffers
 class BufferManager:
@@ -411,10 +546,109 @@ class BufferManager:
 		self.app = app
 		self.buffers = dict()
 		self.buffer_count = 0
+		self.undo_budget = UndoMemoryBudget()
+		self.highlight_worker = HighlightWorker()
+		self.disk_writer = DiskWriter()
+		self.file_index = None				# FileIndex of the active project, see AshEditorApp.open_project()
+		self.trigram_index = None			# TrigramIndex of the active project (optional), see set_trigram_index()
+		self.file_watcher = FileWatcher()
+		self.file_tree_version = 0			# incremented whenever files/directories are created or deleted in the project
+
+	# creates the syntax-highlighter for a buffer, which lexes in the background if enabled in the settings
+	# read-only (mapped) files are not highlighted, as lexing a line requires the lines before it
+	def create_formatter(self, filename, read_only = False):
+		if(read_only):
+			return SyntaxHighlighter(None)
+		elif(self.app.settings_manager.get_setting("background_highlighting")):
+			return SyntaxHighlighter(filename, self.highlight_worker)
+		else:
+			return SyntaxHighlighter(filename)
+
+	# applies the styles lexed in the background to the buffers (called from the event-loop);
+	# returns True if the screen needs to be repainted
+	def apply_highlighting_results(self):
+		repaint = False
+		for bid, buffer in self.buffers.items():
+			if(buffer != None and buffer.formatter != None and buffer.formatter.apply_results()): repaint = True
+		return repaint
+
+	# hands the files written in the background over to their buffers (called from the event-loop);
+	# returns True if the screen needs to be repainted
+	def apply_write_results(self):
+		results = self.disk_writer.get_results()
+		for request in results:
+			buffer = request.buffer
+			if(self.buffers.get(buffer.id) is buffer): buffer.on_write_completed(request)
+		return (len(results) > 0)
+
+	# waits for the files being written in the background, and hands them over to their buffers
+	def wait_for_writes(self):
+		self.disk_writer.flush()
+		self.apply_write_results()
 	
-	# creates a new buffer: either blank or from a file on disk
-	def create_new_buffer(self, filename = None, encoding = None, has_backup = False):
+	# handles the changes on disk reported by the file watcher (called from the event-loop):
+	# buffers are checked for external modification, and files created in the project get stub buffers;
+	# returns True if the screen needs to be repainted
+	def process_file_events(self):
+		events = self.file_watcher.get_events()
+		if(len(events) == 0): return False
+
+		changed_files = dict()
+		for event_type, path in events:
+			if(event_type == FILES_UNKNOWN):
+				# some events were lost: check everything
+				for bid, buffer in self.buffers.items():
+					if(buffer != None and buffer.filename != None): changed_files[buffer.filename] = FILE_MODIFIED
+				self.file_tree_version += 1
+			elif(event_type != FILE_MODIFIED or path not in changed_files):
+				changed_files[path] = event_type
+
+		for filename, event_type in changed_files.items():
+			buffer = self.get_buffer_by_filename(filename)
+			if(buffer != None):
+				buffer.on_file_changed()
+			elif(event_type != FILE_MODIFIED and self.file_index != None and self.file_index.accepts(filename)):
+				self.file_tree_version += 1
+				if(event_type == FILE_CREATED): self.add_to_project(filename)
+		return True
+
+	# creates stub buffers for a file or a directory created in the project, and watches new directories
+	def add_to_project(self, path):
+		if(os.path.isdir(path)):
+			new_index = FileIndex(path).scan()
+			for dirname in new_index.dirs: self.file_watcher.watch_directory(dirname)
+			new_files = new_index.get_files()
+		elif(os.path.isfile(path)):
+			new_files = [ path ]
+		else:
+			return
+
+		for f in new_files:
+			if(self.does_file_have_its_own_buffer(f) or BufferManager.is_binary(f, self.app)): continue
+			self.create_new_buffer(filename=f, has_backup=BufferManager.backup_exists(f), lazy=True)
+
+	# returns a tuple(per-buffer limit, total limit) of the memory (in bytes) which can be used by edit histories
+	def get_undo_memory_limits(self):
+		limit = self.app.settings_manager.get_setting("undo_memory_limit_mb")
+		total_limit = self.app.settings_manager.get_setting("total_undo_memory_limit_mb")
+		return (int(limit * 1024 * 1024), int(total_limit * 1024 * 1024))
+
+	# applies the memory limits set in the settings to the edit histories of all buffers
+	def apply_undo_memory_limits(self):
+		limit, total_limit = self.get_undo_memory_limits()
+		self.undo_budget.limit = total_limit
+		for bid, buffer in self.buffers.items():
+			if(buffer != None and buffer.history != None): buffer.history.set_limit(limit)
+
+	# creates a new buffer: either blank or from a file on disk; if lazy is True, the file is not read until
+	# the buffer is loaded (see load_buffer())
+	def create_new_buffer(self, filename = None, encoding = None, has_backup = False, lazy = False):
 		if(self.does_file_have_its_own_buffer(filename)): raise(AshException("Error 5: buffermanager.create_new_buffer()"))
+		if(filename != None): self.file_watcher.watch_directory(os.path.dirname(normalized_path(filename)))
+		if(lazy and filename != None and not has_backup):
+			self.buffers[self.buffer_count] = Buffer(self, self.buffer_count, filename, encoding, has_backup, True)
+			self.buffer_count += 1
+			return (self.buffer_count - 1, self.buffers[self.buffer_count - 1])
 		if(encoding == None):
 			if(filename == None or not os.path.isfile(filename)):
 				encoding = self.app.settings_manager.get_setting("default_encoding")
@@ -435,6 +669,74 @@ class BufferManager:
 		self.buffer_count += 1
 		return (self.buffer_count - 1, self.buffers[self.buffer_count - 1])
 
+	# reads the file of a stub buffer if required; returns False (after showing the error if show_error is True)
+	# if it could not be read
+	def load_buffer(self, buffer, show_error = True, preread = None):
+		try:
+			buffer.load(preread)
+			return True
+		except (AshException, AshFileReadAbortedException) as e:
+			if(show_error): self.app.show_error(str(e))
+			return False
+
+	# checks if a file is large enough to be viewed read-only through a MappedStorage, instead of being read into memory
+	def should_map_file(self, filename, encoding):
+		size_limit = self.app.settings_manager.get_setting("read_only_file_size_mb")
+		if(size_limit == None or size_limit <= 0 or not os.path.isfile(filename)): return False
+		if(os.stat(filename).st_size <= size_limit * 1024 * 1024): return False
+		return (encoding == None or MappedStorage.supports_encoding(encoding))
+
+	# reads the file of a stub buffer: runs on the project loader's worker threads, so it
+	# must not touch the buffer or the UI; returns None if the file can no longer be opened
+	def read_for_loading(self, filename, encoding):
+		if(not os.path.isfile(filename) or BufferManager.is_binary(filename, self.app)): return None
+		if(encoding == None): encoding = predict_file_encoding(filename)
+		if(encoding == None): encoding = self.app.settings_manager.get_setting("default_encoding")
+		if(self.should_map_file(filename, encoding)): return (encoding, set(), None)		# mapped when the buffer is loaded
+		return (encoding, get_added_lines_from_git_diff(filename), BufferManager.read_lines(filename, encoding))
+
+	# materialises all stub buffers, reading them on a pool of worker threads; completed reads
+	# are streamed back and turned into buffers here, on the UI thread, in order of completion
+	# returns False if cancel_handler() reported a cancellation: buffers loaded so far are kept
+	def load_all(self, progress_handler = None, cancel_handler = None):
+		stubs = [ buffer for buffer in self.buffers.values() if buffer != None and not buffer.loaded ]
+		if(len(stubs) == 0): return True
+
+		executor = concurrent.futures.ThreadPoolExecutor(thread_name_prefix="ash-loader")
+		pending = { executor.submit(self.read_for_loading, buffer.filename, buffer.encoding): buffer for buffer in stubs }
+		start_time = time.time()
+		last_report = 0
+		files_done = 0
+		bytes_done = 0
+		cancelled = False
+
+		while(len(pending) > 0):
+			if(cancel_handler != None and cancel_handler()):
+				cancelled = True
+				break
+
+			completed, not_completed = concurrent.futures.wait(pending, timeout=LOADER_POLL_INTERVAL, return_when=concurrent.futures.FIRST_COMPLETED)
+			for future in completed:
+				buffer = pending.pop(future)
+				files_done += 1
+				bytes_done += buffer.file_size
+				try:
+					preread = future.result()
+				except Exception as e:
+					log_error(f"cannot load {buffer.filename}: {e}")
+					continue
+				if(preread != None): self.load_buffer(buffer, False, preread)
+
+			now = time.time()
+			if(progress_handler != None and (now - last_report >= LOADER_POLL_INTERVAL or len(pending) == 0)):
+				last_report = now
+				elapsed = max(now - start_time, 0.001)
+				progress_handler(f"Loading {files_done}/{len(stubs)} files: {files_done / elapsed:.0f} files/s, {bytes_done / elapsed / 1048576:.1f} MB/s", (files_done / len(stubs)) * 100)
+
+		for future in pending: future.cancel()
+		executor.shutdown(wait=False)
+		return not cancelled
+
 	# map an editor to a buffer specified by its buffer ID
 	def attach_editor(self, buffer_id, editor):
 		if(buffer_id >= self.buffer_count):
@@ -506,7 +808,8 @@ class BufferManager:
 	def write_all_wherever_possible(self):
 		return self.write_all(True)
 						
-	# writes all buffers to disk
+	# writes all buffers to disk: the files are saved in the background (see Buffer.save_in_background()),
+	# and any errors are reported by the buffers when the saves complete
 	def write_all(self, ignore_errors=False):
 		counter=0
 		for bid, buffer in self.buffers.items():
@@ -516,23 +819,39 @@ class BufferManager:
 					if(not ignore_errors): 
 						raise(AshException("Error 4.1: buffermanager.write_all()"))
 				else:
-					try:
-						buffer.write_to_disk()
-					except:
-						if(not ignore_errors): raise(AshException("Error 4.2: buffermanager.write_all()"))
+					buffer.save_in_background()
 		return counter
 
+	# removes the journals of the unsaved edits of all buffers, called when user deliberately discards unsaved changes
+	def discard_unsaved_changes(self):
+		for bid, buffer in self.buffers.items():
+			if(buffer != None): buffer.discard_journal()
+
+	# returns the files whose last save (in the background) failed, and which remain unsaved
+	def get_failed_saves(self):
+		return [ buffer.filename for buffer in self.buffers.values() if buffer != None and not buffer.save_status and buffer.save_error != None ]
+
 	# destroy all buffers, reset counter
 	def destroy(self):
+		self.disk_writer.flush()
 		for bid, buffer in self.buffers.items():
 			buffer.destroy()
 
+		if(self.file_index != None): self.file_index.save()
+		if(self.trigram_index != None):
+			self.trigram_index.stop_building()
+			self.trigram_index.save()
+
 		self.buffer_count = 0
 		self.buffers = dict()
+		self.undo_budget = UndoMemoryBudget()
 
 	# destroy a specific buffer
 	def destroy_buffer(self, bid):
 		if(bid in self.buffers):
+			if(self.buffers[bid] != None and self.buffers[bid].history != None): self.buffers[bid].history.set_budget(None)
+			if(self.buffers[bid] != None and self.buffers[bid].lines != None): self.buffers[bid].lines.close()
+			if(self.buffers[bid] != None and self.buffers[bid].journal != None): self.buffers[bid].journal.close()
 			del self.buffers[bid]
 			self.buffer_count -= 1
 
@@ -562,7 +881,9 @@ class BufferManager:
 				ed.notify_merge(child_id, parent_buffer)
 			# attach the editors
 			parent_buffer.editors.extend(self.buffers[mid].editors)
-			# delete the buffer
+			# delete the buffer, its journal is superseded by the file just saved
+			if(self.buffers[mid].history != None): self.buffers[mid].history.set_budget(None)
+			self.buffers[mid].discard_journal()
 			del self.buffers[mid]
 
 		return True
@@ -574,53 +895,137 @@ class BufferManager:
 			buffer_list.append( (bid, buffer.save_status, buffer.get_name()) )
 		return buffer_list
 
-	def find_all(self, search_text, match_case, whole_words, is_regex):
-		search_results = dict()
+	# returns all buffers as targets for a SearchJob (see searchEngine.py): loaded buffers are searched
+	# in memory, so that unsaved changes are found, and stubs are read from disk without being loaded;
+	# given the SearchPattern, stubs which the trigram index rules out are left out
+	def get_search_targets(self, pattern = None):
+		candidates = (None if pattern == None or self.trigram_index == None else self.trigram_index.get_candidates(pattern))
+		targets = list()
 		for bid, buffer in self.buffers.items():
-			search_results[bid] = buffer.find_all(search_text, match_case, whole_words, is_regex)
-		return search_results
-
+			if(buffer.loaded):
+				targets.append( (bid, buffer.lines, None) )
+			elif(candidates == None or buffer.filename in candidates or not self.trigram_index.is_indexed(buffer.filename)):
+				targets.append( (bid, functools.partial(self.read_for_search, buffer.filename, buffer.encoding), None) )
+		return targets
+
+	# reads the file of a stub buffer to be searched: runs on a search thread (see get_search_targets()),
+	# so it must not touch the buffer or the UI; returns None if the file cannot be read
+	def read_for_search(self, filename, encoding):
+		try:
+			if(encoding == None): encoding = predict_file_encoding(filename)
+			if(encoding == None): encoding = self.app.settings_manager.get_setting("default_encoding")
+			if(self.should_map_file(filename, encoding)): return MappedStorage(filename, encoding, False)
+			return BufferManager.read_lines(filename, encoding)
+		except Exception as e:
+			log_error(f"unable to search {filename}: {e}")
+			return None
+
+	# reads a file for the trigram index: runs on the index builder's thread, only the text matters here
+	# returns tuple(lines, os.stat_result) or None if the file cannot be read
+	def read_for_index(self, filename):
+		try:
+			st = os.stat(filename)
+			encoding = (None if self.file_index == None else self.file_index.get_encoding(filename))
+			if(self.should_map_file(filename, encoding)): return None		# too large to be read into memory
+			if(encoding == None): encoding = predict_file_encoding(filename)
+			if(encoding == None): encoding = self.app.settings_manager.get_setting("default_encoding")
+			with open(filename, "r", encoding=encoding, errors="replace") as fp:
+				return (fp.read().split("\n"), st)
+		except Exception as e:
+			log_error(f"unable to index {filename}: {e}")
+			return None
+
+	# sets the trigram index of the project, which is kept up to date by the file watcher,
+	# and starts indexing the files which are not in it yet in the background
+	def set_trigram_index(self, trigram_index, files = None):
+		if(self.trigram_index != None):
+			self.trigram_index.stop_building()
+			self.file_watcher.remove_listener(self.trigram_index.on_file_event)
+			self.trigram_index.save()
+		self.trigram_index = trigram_index
+		if(trigram_index != None):
+			self.file_watcher.add_listener(trigram_index.on_file_event)
+			if(files != None): trigram_index.start_building(files, self.read_for_index)
+
+	# replaces all matches of a search in all buffers: the buffers are searched like in a project search (see
+	# get_search_targets()), and only the stubs with a match are loaded; each buffer gets a single undo step
+	# read-only buffers are left out, as are stubs which turn out to be read-only when loaded
+	# returns tuple(replacement count, list of modified buffers)
 	def replace_all(self, search_text, replace_text, match_case, whole_words, is_regex):
-		search_results = self.find_all(search_text, search_text, match_case, whole_words, is_regex)
+		pattern = compile_search(search_text, match_case, whole_words, is_regex)
+		if(pattern == None): return (0, [])
+
+		targets = [ target for target in self.get_search_targets(pattern) if not self.buffers[target[0]].read_only ]
+		job = SearchJob(pattern, targets, sys.maxsize)
+		job.thread.join()
+
 		count = 0
-		buffer_count = 0
-		for bid, buffer in self.buffers.items():
-			info = search_results.get(bid)
-			if(info != None): 
-				x = buffer.replace_all(info, len(search_text), replace_text)
+		modified_buffers = list()
+		for bid, search_results in job.get_results():
+			buffer = self.buffers[bid]
+			if(not buffer.loaded):
+				if(not self.load_buffer(buffer, False) or buffer.read_only): continue
+				search_results = pattern.find_all(buffer.lines)
+			x = buffer.replace_all(search_results, replace_text)
+			if(x > 0):
 				count += x
-				if(x > 0): buffer_count += 1
-		return(count, buffer_count)
+				modified_buffers.append(buffer)
+		return (count, modified_buffers)
+
+	# saves the given buffers, writing their files on a pool of threads; returns the list of files which could not be saved
+	def save_buffers(self, buffers):
+		for buffer in buffers:
+			# an older snapshot being saved in the background must not overwrite this one
+			self.disk_writer.cancel(buffer.filename)
+			buffer.save_request = None
+			buffer.save_error = None
+
+		executor = concurrent.futures.ThreadPoolExecutor(thread_name_prefix="ash-writer")
+		futures = [ (executor.submit(buffer.write_a_copy, buffer.filename, buffer.encoding), buffer) for buffer in buffers ]
+		executor.shutdown(wait=True)
+
+		failed = list()
+		for future, buffer in futures:
+			try:
+				future.result()
+				buffer.on_written()
+			except Exception as e:
+				log_error(f"unable to save {buffer.filename}: {e}")
+				failed.append(buffer.filename)
+		return failed
 
 	def get_persistent_data(self, project_dir):
 		pdata = list()
 		for bid, buffer in self.buffers.items():
 			if(buffer.filename != None and buffer.filename.startswith(project_dir + "/")):
-				pdata.append(buffer.get_persistent_data())
+				data = buffer.get_persistent_data()
+				if(data != None): pdata.append(data)
 		return pdata
 
 	def set_persistent_data(self, buffer_data_list):
 		for buffer_data in buffer_data_list:
 			filename = buffer_data.filename
 			buffer = self.get_buffer_by_filename(filename)
+			if(buffer == None or not os.path.isfile(filename)): continue
+			if(buffer.loaded):
+				buffer.restore_persistent_data(buffer_data)
+			else:
+				buffer.pending_data = buffer_data
 
-			last_mod_time = BufferManager.get_last_modified(filename)
-			if(last_mod_time > buffer_data.last_write_time): continue			# ignore undo history since file modified externally
-
-			buffer.backup_edit_count = buffer_data.backup_edit_count
-			buffer.undo_edit_count = buffer_data.undo_edit_count
-			buffer.history = buffer_data.history
-
-	# checks to see if a backup file for a given filename exists
-	# backup files start with a ".ash.b-" prefix and reside in the same directory as its
-	# parent file
+	# checks to see if unsaved edits to a given file can be recovered, i.e. if it has a journal left behind
+	# by a session which did not end normally (see EditJournal)
 	@staticmethod
 	def backup_exists(filename):
-		if(os.path.isfile(os.path.dirname(filename) + "/.ash.b-" + get_file_title(filename))):
+		if(os.path.isfile(get_journal_file(normalized_path(filename)))):
 			return True
 		else:
 			return False
 
+	# reads a text file into a list of lines, the way buffers expect it
+	@staticmethod
+	def read_lines(filename, encoding):
+		return read_text_lines(filename, encoding)
+
 	# checks to see if a specified file is a text file
 	@staticmethod
 	def is_binary(filename, app_ref):
@@ -0,0 +1,255 @@
+# SPDX-License-Identifier: GPL-2.0-only
+#
+# /src/ash/core/chunkedList.py
+#
+# Copyright (C) 2022-2022  Akash Nag
+
+# This module implements a chunked list: a sequence stored as a list of small chunks,
+# indexed by Fenwick trees, so that positional access, inserts and deletes run in O(log n)
+
+import itertools
+
+CHUNK_SIZE			= 512					# preferred number of items in a chunk
+MAX_CHUNK_SIZE		= 2 * CHUNK_SIZE		# chunks larger than this are split
+MIN_CHUNK_SIZE		= CHUNK_SIZE // 4		# chunks smaller than this are merged with their neighbour
+
+# FenwickTree class: maintains prefix sums over a list of integers
+class FenwickTree:
+	def __init__(self, values = None):
+		self.build(list() if values == None else values)
+
+	# (re)builds the tree from a list of values in O(n)
+	def build(self, values):
+		n = len(values)
+		tree = [0] * (n + 1)
+		for i in range(n):
+			j = i + 1
+			tree[j] += values[i]
+			k = j + (j & -j)
+			if(k <= n): tree[k] += tree[j]
+		self.tree = tree
+		self.n = n
+		self.sum = sum(values)
+		self.top_bit = (1 << (n.bit_length() - 1)) if n > 0 else 0
+
+	# returns the number of values in the tree
+	def __len__(self):
+		return self.n
+
+	# adds delta to the value at the given index
+	def add(self, index, delta):
+		self.sum += delta
+		i = index + 1
+		while(i <= self.n):
+			self.tree[i] += delta
+			i += i & -i
+
+	# returns the sum of the values in [0, index)
+	def prefix_sum(self, index):
+		s = 0
+		i = index
+		while(i > 0):
+			s += self.tree[i]
+			i -= i & -i
+		return s
+
+	# returns the sum of all values
+	def total(self):
+		return self.sum
+
+	# returns a tuple(index, offset): the index of the value which contains the unit k (0-based),
+	# and the offset of k within that value; index = n if k lies beyond the total
+	def find(self, k):
+		pos = 0
+		bit = self.top_bit
+		tree = self.tree
+		while(bit > 0):
+			nxt = pos + bit
+			if(nxt <= self.n and tree[nxt] <= k):
+				pos = nxt
+				k -= tree[nxt]
+			bit >>= 1
+		return (pos, k)
+
+# ChunkedList class: a list-like sequence of items, optionally with an integer weight per item
+# (e.g. the number of rendered rows of a line) which can be summed and searched in O(log n)
+class ChunkedList:
+	def __init__(self, items = None, weight_func = None):
+		self.weight_func = weight_func
+		self.build(list() if items == None else items)
+
+	# (re)builds the chunks from a list of items
+	def build(self, items):
+		items = list(items)
+		self.chunks = [ items[i:i+CHUNK_SIZE] for i in range(0, len(items), CHUNK_SIZE) ]
+		if(self.weight_func == None):
+			self.weights = None
+		else:
+			wf = self.weight_func
+			self.weights = [ [ wf(x) for x in chunk ] for chunk in self.chunks ]
+		self.reindex()
+
+	# rebuilds the Fenwick trees over the chunks
+	def reindex(self):
+		self.lengths = FenwickTree([ len(chunk) for chunk in self.chunks ])
+		if(self.weights != None): self.chunk_weights = FenwickTree([ sum(w) for w in self.weights ])
+		self.size = self.lengths.total()
+		self.cache_index = -1
+		self.cache_start = 0
+
+	# returns the number of items
+	def __len__(self):
+		return self.size
+
+	# iterates over all the items
+	def __iter__(self):
+		return itertools.chain.from_iterable(list(self.chunks))
+
+	# returns a tuple(chunk_index, offset) for the item at the given index (0 <= index <= size)
+	def locate(self, index):
+		ci = self.cache_index
+		if(ci >= 0):
+			offset = index - self.cache_start
+			if(offset >= 0 and offset < len(self.chunks[ci])): return (ci, offset)
+
+		if(index >= self.size):
+			ci = len(self.chunks) - 1
+			return (ci, len(self.chunks[ci]))
+
+		ci, offset = self.lengths.find(index)
+		self.cache_index = ci
+		self.cache_start = index - offset
+		return (ci, offset)
+
+	# returns the item at the given index
+	def __getitem__(self, index):
+		if(isinstance(index, slice)): return self.get_range(*index.indices(self.size))
+		if(index < 0): index += self.size
+		if(index < 0 or index >= self.size): raise IndexError("chunked list index out of range")
+		ci, offset = self.locate(index)
+		return self.chunks[ci][offset]
+
+	# replaces the item at the given index
+	def __setitem__(self, index, item):
+		if(index < 0): index += self.size
+		if(index < 0 or index >= self.size): raise IndexError("chunked list assignment index out of range")
+		ci, offset = self.locate(index)
+		self.chunks[ci][offset] = item
+		if(self.weights != None):
+			w = self.weight_func(item)
+			delta = w - self.weights[ci][offset]
+			if(delta != 0):
+				self.weights[ci][offset] = w
+				self.chunk_weights.add(ci, delta)
+
+	# returns a list of the items in range(start, stop, step)
+	def get_range(self, start, stop, step = 1):
+		if(step != 1): return [ self[i] for i in range(start, stop, step) ]
+		if(start >= stop): return list()
+		ci, offset = self.locate(start)
+		result = list()
+		count = stop - start
+		while(count > 0):
+			chunk = self.chunks[ci]
+			part = chunk[offset:offset+count]
+			result.extend(part)
+			count -= len(part)
+			ci += 1
+			offset = 0
+		return result
+
+	# returns all items as a plain list
+	def to_list(self):
+		return list(itertools.chain.from_iterable(self.chunks))
+
+	# replaces the items in [start, end) with the given items
+	def replace(self, start, end, items):
+		items = list(items)
+		if(start == end and len(items) == 0): return
+
+		if(len(self.chunks) == 0):
+			self.build(items)
+			return
+
+		cs, offset_s = self.locate(start)
+		ce, offset_e = self.locate(end)
+
+		chunks = self.chunks
+		merged = chunks[cs][:offset_s] + items + chunks[ce][offset_e:]
+		if(self.weights != None):
+			wf = self.weight_func
+			merged_weights = self.weights[cs][:offset_s] + [ wf(x) for x in items ] + self.weights[ce][offset_e:]
+
+		# avoid fragmentation: absorb the next chunk if the merged chunk is too small
+		if(len(merged) < MIN_CHUNK_SIZE and ce + 1 < len(chunks)):
+			ce += 1
+			merged += chunks[ce]
+			if(self.weights != None): merged_weights += self.weights[ce]
+
+		if(len(merged) == 0):
+			pieces = list()
+		elif(len(merged) <= MAX_CHUNK_SIZE):
+			pieces = [ merged ]
+		else:
+			pieces = [ merged[i:i+CHUNK_SIZE] for i in range(0, len(merged), CHUNK_SIZE) ]
+
+		if(len(pieces) == 1 and cs == ce):
+			# structure unchanged: update the indices in O(log n)
+			delta = len(merged) - len(chunks[cs])
+			chunks[cs] = merged
+			if(delta != 0): self.lengths.add(cs, delta)
+			self.size += delta
+			if(self.weights != None):
+				wdelta = sum(merged_weights) - sum(self.weights[cs])
+				self.weights[cs] = merged_weights
+				if(wdelta != 0): self.chunk_weights.add(cs, wdelta)
+			if(delta != 0): self.cache_index = -1
+		else:
+			chunks[cs:ce+1] = pieces
+			if(self.weights != None):
+				weight_pieces = list()
+				pos = 0
+				for p in pieces:
+					weight_pieces.append(merged_weights[pos:pos+len(p)])
+					pos += len(p)
+				self.weights[cs:ce+1] = weight_pieces
+			self.reindex()
+
+	# inserts an item before the given index
+	def insert(self, index, item):
+		if(index < 0): index = max([0, index + self.size])
+		index = min([index, self.size])
+		self.replace(index, index, [item])
+
+	# appends an item at the end
+	def append(self, item):
+		self.replace(self.size, self.size, [item])
+
+	# removes and returns the item at the given index
+	def pop(self, index = -1):
+		if(index < 0): index += self.size
+		item = self[index]
+		self.replace(index, index + 1, [])
+		return item
+
+	# returns the sum of the weights of all the items
+	def total_weight(self):
+		return self.chunk_weights.total()
+
+	# returns the sum of the weights of the items in [0, index)
+	def weight_before(self, index):
+		if(index <= 0): return 0
+		if(index >= self.size): return self.chunk_weights.total()
+		ci, offset = self.locate(index)
+		return self.chunk_weights.prefix_sum(ci) + sum(self.weights[ci][:offset])
+
+	# returns a tuple(index, offset): the index of the item which contains the weight-unit w (0-based),
+	# and the offset of w within that item's weight; index = size if w lies beyond the total weight
+	def locate_weight(self, w):
+		ci, rem = self.chunk_weights.find(w)
+		if(ci >= len(self.chunks)): return (self.size, 0)
+		start = self.lengths.prefix_sum(ci)
+		for j, x in enumerate(self.weights[ci]):
+			if(rem < x): return (start + j, rem)
+			rem -= x
+		return (start + len(self.weights[ci]), 0)
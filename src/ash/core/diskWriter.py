@@ -0,0 +1,83 @@
+# SPDX-License-Identifier: GPL-2.0-only
+#
+# /src/ash/core/diskWriter.py
+#
+# Copyright (C) 2022-2022  Akash Nag
+
+# This module implements the background writer, which saves buffers off the UI thread
+
+from ash.core import *
+
+import collections
+import threading
+
+# WriteRequest class: a snapshot of the lines of a buffer, to be written to a file by the DiskWriter;
+# once written, error holds the exception raised (or None) and stat the os.stat_result of the file
+class WriteRequest:
+	def __init__(self, buffer, filename, lines, encoding):
+		self.buffer = buffer
+		self.filename = filename
+		self.lines = lines
+		self.encoding = encoding
+		self.version = buffer.edit_version		# the edit of the buffer the snapshot was taken at
+		self.error = None
+		self.stat = None
+
+# DiskWriter class: writes files on a background thread, one at a time in the order they were requested.
+# A request for a file which is still waiting to be written takes the place of the waiting request, as it holds
+# a later snapshot: the replaced request is dropped without being reported. Written requests are collected by
+# the event-loop with get_results(), so that buffers are only ever updated on the UI thread
+class DiskWriter:
+	def __init__(self):
+		self.condition = threading.Condition()
+		self.pending = collections.OrderedDict()		# filename -> WriteRequest waiting to be written
+		self.active = None								# the request being written
+		self.results = collections.deque()
+		self.thread = None
+
+	# queues a request, replacing the one waiting for the same file (if any)
+	def submit(self, request):
+		with self.condition:
+			self.pending[request.filename] = request
+			if(self.thread == None):
+				self.thread = threading.Thread(target=self.run, name="ash-writer", daemon=True)
+				self.thread.start()
+			self.condition.notify_all()
+
+	# drops the request waiting for a file, and waits for the file to be written if it is being written
+	def cancel(self, filename):
+		with self.condition:
+			self.pending.pop(filename, None)
+			while(self.active != None and self.active.filename == filename): self.condition.wait()
+
+	# waits until all the requests have been written
+	def flush(self):
+		with self.condition:
+			while(len(self.pending) > 0 or self.active != None): self.condition.wait()
+
+	# returns the requests written since the last call, in the order they were written
+	def get_results(self):
+		results = list()
+		while(len(self.results) > 0): results.append(self.results.popleft())
+		return results
+
+	# <------------------- private functions ---------------------->
+
+	# body of the writer thread
+	def run(self):
+		while(True):
+			with self.condition:
+				while(len(self.pending) == 0): self.condition.wait()
+				filename, request = self.pending.popitem(last=False)
+				self.active = request
+
+			try:
+				write_text_lines(request.filename, request.lines, request.encoding)
+				request.stat = os.stat(request.filename)
+			except Exception as e:
+				request.error = e
+			self.results.append(request)
+
+			with self.condition:
+				self.active = None
+				self.condition.notify_all()
@@ -4,111 +4,277 @@
 #
 # Copyright (C) 2022-2022  Akash Nag
 
-# This module implements the edit history of a document to realize the undo/redo operations
+# This module implements the edit history of a document to realize the undo/redo operations:
+# instead of storing snapshots of the whole document, the history stores the edits (deltas)
+# themselves, so that recording a change costs O(edit size) and undo/redo costs O(delta)
 
 from ash.core import *
 
-# define the maximum size of the history to be stored (in bytes)
-MAX_HISTORY_SIZE	=	65536
-
-# HistoricalData class: encapsulates an editor-state containing:
-# (1) data	(2) cursor-position
-class HistoricalData:
-	def __init__(self, data, curpos):
-		self.data = copy.copy(data)
-		self.curpos = copy.copy(curpos)
-
-	def size(self):
-		return sys.getsizeof(self.data)
-
-# StackNode class: implements a node in a linked-stack
-class StackNode:
-	def __init__(self, data, link = None, parent = None):
-		self.data = data
-		self.link = link
-		self.parent = parent
-
-# Stack class: implements a standard linked-stack with drop feature (to drop one or more nodes)
-class Stack:
-	def __init__(self):
-		self.top = None
-		self.__size = 0
-
-	# pushes data onto the stack
-	def push(self, hdata):
-		temp = StackNode(hdata, self.top, None)
-		if(self.top != None): self.top.parent = temp
-		self.top = temp
-		self.__size += 1
-
-	# pops the most recently pushed data from the stack
-	def pop(self):
-		if(self.__size == 0):
-			return None
-		else:
-			data = self.top.data
-			self.top = self.top.link
-			if(self.top != None): self.top.parent = None
-			self.__size -= 1
-			return data
-
-	# returns the number of items in the stack
-	def length(self):
-		return self.__size
-
-	# returns the total memory being used by the stack (in bytes)
-	def size(self):
-		temp = self.top
-		s = 0
-		while(temp != None):
-			s += temp.data.size()
-			temp = temp.link
+import hashlib
+import heapq
+import itertools
+import time
+import weakref
+from collections import deque
+
+# default memory limits for the edit history (in bytes): per buffer, and for all buffers together
+DEFAULT_UNDO_MEMORY_LIMIT			= 16 * 1024 * 1024
+DEFAULT_TOTAL_UNDO_MEMORY_LIMIT		= 64 * 1024 * 1024
+
+# the sequence number given to the last transaction, see next_sequence()
+last_sequence = 0
+
+# the largest delta (in lines) that consecutive edits are merged into
+MAX_COALESCE_LINES	=	64
+
+# version of the edit history format (histories restored from a session must match)
+EDIT_HISTORY_VERSION	= 4
+
+# returns the sequence number of a new transaction, used to find the oldest transaction across all buffers: it is
+# the time of creation (in ns), so that transactions restored from a session stay older than those made since
+def next_sequence():
+	global last_sequence
+	last_sequence = max([ time.time_ns(), last_sequence + 1 ])
+	return last_sequence
+
+# returns a fingerprint of the document, used to verify that a restored history applies to it
+def compute_fingerprint(lines):
+	digest = hashlib.md5()
+	for line in lines:
+		digest.update(line.encode("utf-8", "surrogatepass"))
+		digest.update(b"\n")
+	return digest.hexdigest()
+
+# Transaction class: a group of edits which are undone/redone together, along with the
+# cursor-positions before and after them; each edit (delta) is a tuple(start, old_lines, new_lines)
+# which means that the lines old_lines beginning at index start were replaced by new_lines
+class Transaction:
+	def __init__(self, curpos_before):
+		self.deltas = list()
+		self.curpos_before = copy.copy(curpos_before)
+		self.curpos_after = copy.copy(curpos_before)
+		self.seq = next_sequence()
+		self.size = 0
+
+	# records an edit, merging it into the previous one if it only touches the lines produced by it
+	# (e.g. successive keystrokes on the same line)
+	def add(self, start, old_lines, new_lines):
+		if(len(self.deltas) > 0):
+			last_start, last_old, last_new = self.deltas[-1]
+			offset = start - last_start
+			if(len(last_new) <= MAX_COALESCE_LINES and offset >= 0 and offset + len(old_lines) <= len(last_new)):
+				merged = last_new[0:offset] + list(new_lines) + last_new[offset+len(old_lines):]
+				self.deltas[-1] = (last_start, last_old, merged)
+				return
+		self.deltas.append( (start, list(old_lines), list(new_lines)) )
+
+	# checks if the transaction contains any edits
+	def is_empty(self):
+		return (len(self.deltas) == 0)
+
+	# reverts the edits on the given text storage
+	def undo(self, lines):
+		for start, old_lines, new_lines in reversed(self.deltas):
+			lines.replace_lines(start, start + len(new_lines), old_lines)
+
+	# re-applies the edits on the given text storage
+	def redo(self, lines):
+		for start, old_lines, new_lines in self.deltas:
+			lines.replace_lines(start, start + len(old_lines), new_lines)
+
+	# computes the memory used by the transaction (in bytes), including the text it holds
+	def compute_size(self):
+		s = sys.getsizeof(self) + sys.getsizeof(self.deltas)
+		for delta in self.deltas:
+			s += sys.getsizeof(delta)
+			for lines in delta[1:]:
+				s += sys.getsizeof(lines)
+				for line in lines:
+					s += sys.getsizeof(line)
+		self.size = s
 		return s
 
-	# removes the oldest 'count' items from the stack
-	def drop(self, count = 1):
-		if(count < 1): return
-		count = min([count, self.__size])
-		temp = self.top
-		for i in range(self.__size - count - 1):
-			temp = temp.link
-		temp.link = None
-		self.__size -= count
-
-# EditHistory class: emcapsulates an interface to implement undo-redo operations
+# UndoMemoryBudget class: keeps track of the memory used by the edit histories of all the buffers,
+# and evicts the oldest transactions (across all buffers) whenever the total exceeds the limit.
+# The histories are kept in a heap ordered by the sequence number of their oldest transaction: the entry
+# of a history (its queued_seq) is never newer than its oldest transaction, and is brought up to date
+# lazily, when it reaches the top of the heap; entries which are no longer the history's are skipped
+class UndoMemoryBudget:
+	def __init__(self, limit = DEFAULT_TOTAL_UNDO_MEMORY_LIMIT):
+		self.limit = limit
+		self.total = 0
+		self.histories = weakref.WeakSet()
+		self.queue = list()						# heap of tuple(seq, tie-breaker, weakref to the history)
+		self.tie_breaker = itertools.count()
+
+	def register(self, history):
+		if(history in self.histories): return
+		self.histories.add(history)
+		self.total += history.size
+		history.queued_seq = None
+		self.update(history)
+
+	def unregister(self, history):
+		if(history not in self.histories): return
+		self.histories.discard(history)
+		self.total -= history.size
+		history.queued_seq = None
+
+	# records a change in the memory used by one of the histories
+	def charge(self, delta):
+		self.total += delta
+
+	# called when the oldest transaction of a history may have become older than its entry in the heap
+	def update(self, history):
+		seq = history.get_oldest_sequence()
+		if(seq == None or (history.queued_seq != None and history.queued_seq <= seq)): return
+		self.push(history, seq)
+
+	# evicts the oldest transactions until the total is within the limit
+	def enforce_limit(self):
+		while(self.total > self.limit and len(self.queue) > 0):
+			seq, tie, ref = heapq.heappop(self.queue)
+			history = ref()
+			if(history == None or history not in self.histories or history.queued_seq != seq): continue
+			history.queued_seq = None
+			oldest = history.get_oldest_sequence()
+			if(oldest == seq): history.evict_oldest()
+			self.update(history)
+
+	# <------------------- private functions ---------------------->
+
+	# adds an entry for a history to the heap
+	def push(self, history, seq):
+		history.queued_seq = seq
+		heapq.heappush(self.queue, (seq, next(self.tie_breaker), weakref.ref(history)))
+
+# EditHistory class: encapsulates an interface to implement undo-redo operations;
+# edits are recorded as they happen (see record()) and grouped into transactions at every
+# checkpoint (see add_change())
 class EditHistory:
-	def __init__(self, data, curpos):
-		self.stack = Stack()
-		self.stack.push(HistoricalData(data, curpos))
-		self.present = self.stack.top
-		self.depth_from_top = 0
-	
-	# records a change/edit
-	def add_change(self, data, curpos):
-		while(self.depth_from_top > 0):
-			self.stack.pop()
-			self.depth_from_top -= 1
-		
-		self.stack.push(HistoricalData(data, curpos))
-		self.present = self.stack.top
-
-		while(self.stack.size() > MAX_HISTORY_SIZE):
-			self.stack.drop()
-
-	# reverts to previous state and returns a copy of the last edit performed
-	def undo(self):
-		if(self.depth_from_top == self.stack.length() - 1):
-			return None
-		else:
-			self.present = self.present.link
-			self.depth_from_top += 1
-			return copy.copy(self.present.data)
-
-	# cancels the last undo() performed and returns a copy of the data after redo()
-	def redo(self):
-		if(self.depth_from_top == 0):
-			return None
+	def __init__(self, curpos, limit = DEFAULT_UNDO_MEMORY_LIMIT, budget = None):
+		self.version = EDIT_HISTORY_VERSION
+		self.undo_list = deque()
+		self.redo_list = deque()
+		self.pending = None
+		self.replaying = False
+		self.last_curpos = copy.copy(curpos)
+		self.fingerprint = None
+		self.size = 0					# running total of the memory used by all transactions (in bytes)
+		self.limit = limit
+		self.budget = None
+		self.queued_seq = None			# the sequence number of the entry of this history in the budget's heap
+		self.set_budget(budget)
+
+	# the shared budget is not persisted along with the history
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		state["budget"] = None
+		state["queued_seq"] = None
+		return state
+
+	# attaches the history to a shared memory budget (or detaches it if budget is None)
+	def set_budget(self, budget):
+		if(self.budget != None): self.budget.unregister(self)
+		self.budget = budget
+		if(self.budget != None): 
+			self.budget.register(self)
+			self.budget.enforce_limit()
+
+	# sets the memory limit for this history (in bytes)
+	def set_limit(self, limit):
+		self.limit = limit
+		self.enforce_limit()
+
+	# adds delta bytes to the running total
+	def charge(self, delta):
+		self.size += delta
+		if(self.budget != None): self.budget.charge(delta)
+
+	# returns the sequence number of the oldest transaction, or None if there are none
+	def get_oldest_sequence(self):
+		if(len(self.undo_list) > 0): return self.undo_list[0].seq
+		if(len(self.redo_list) > 0): return self.redo_list[0].seq
+		return None
+
+	# drops the oldest transaction: redo entries are dropped only after all undo entries are gone
+	def evict_oldest(self):
+		if(len(self.undo_list) > 0):
+			t = self.undo_list.popleft()
+		elif(len(self.redo_list) > 0):
+			t = self.redo_list.popleft()
 		else:
-			self.present = self.present.parent
-			self.depth_from_top -= 1
-			return copy.copy(self.present.data)
\ No newline at end of file
+			return
+		self.charge(-t.size)
+
+	# evicts the oldest transactions until the history is within its own limit and the shared budget
+	def enforce_limit(self):
+		while(self.size > self.limit and self.get_oldest_sequence() != None):
+			self.evict_oldest()
+		if(self.budget != None): self.budget.enforce_limit()
+
+	# discards all the redo entries
+	def clear_redo(self):
+		for t in self.redo_list:
+			self.charge(-t.size)
+		self.redo_list.clear()
+
+	# records an edit as it is made to the document
+	def record(self, start, old_lines, new_lines):
+		if(self.replaying): return
+		if(self.pending == None): self.pending = Transaction(self.last_curpos)
+		self.pending.add(start, old_lines, new_lines)
+		if(len(self.redo_list) > 0): self.clear_redo()
+
+	# closes the ongoing transaction (if any), curpos is the cursor-position after the edits
+	def add_change(self, curpos):
+		if(self.pending != None and not self.pending.is_empty()):
+			self.pending.curpos_after = copy.copy(curpos)
+			self.undo_list.append(self.pending)
+			self.charge(self.pending.compute_size())
+			self.pending = None
+			if(self.budget != None): self.budget.update(self)
+			self.enforce_limit()
+		self.pending = None
+		self.last_curpos = copy.copy(curpos)
+
+	# returns a tuple(undo-count, redo-count, memory used in bytes)
+	def get_stats(self):
+		return (len(self.undo_list), len(self.redo_list), self.size)
+
+	# reverts the last transaction on the given text storage and returns the cursor-position before it
+	def undo(self, lines):
+		if(len(self.undo_list) == 0): return None
+		t = self.undo_list.pop()
+		self.replaying = True
+		try:
+			t.undo(lines)
+		finally:
+			self.replaying = False
+		self.redo_list.append(t)
+		self.last_curpos = copy.copy(t.curpos_before)
+		return copy.copy(t.curpos_before)
+
+	# cancels the last undo() performed and returns the cursor-position after the redo
+	def redo(self, lines):
+		if(len(self.redo_list) == 0): return None
+		t = self.redo_list.pop()
+		self.replaying = True
+		try:
+			t.redo(lines)
+		finally:
+			self.replaying = False
+		self.undo_list.append(t)
+		if(self.budget != None): self.budget.update(self)			# the redone transaction may be the oldest now
+		self.last_curpos = copy.copy(t.curpos_after)
+		return copy.copy(t.curpos_after)
+
+	# stores the fingerprint of the document (called before the history is persisted)
+	def set_fingerprint(self, lines):
+		self.fingerprint = compute_fingerprint(lines)
+
+	# checks if this history (restored from a session) can be applied to the given document
+	def is_applicable_to(self, lines):
+		if(getattr(self, "version", None) != EDIT_HISTORY_VERSION): return False
+		if(self.fingerprint == None): return False
+		return (self.fingerprint == compute_fingerprint(lines))
@@ -0,0 +1,194 @@
+# SPDX-License-Identifier: GPL-2.0-only
+#
+# /src/ash/core/editJournal.py
+#
+# Copyright (C) 2022-2022  Akash Nag
+
+# This module implements the edit journal used to recover unsaved changes after a crash: every edit made to a
+# buffer is appended to a journal file (under APP_JOURNAL_DIR) as soon as it is made, and the journal is replayed
+# on top of the file on disk when the file is next opened; the journal is cleared whenever the buffer is saved
+
+from ash.core import *
+from ash.core.ashException import *
+from ash.core.logger import *
+
+import hashlib
+import pickle
+
+JOURNAL_VERSION			= 1
+JOURNAL_COMPACT_RECORDS	= 4096			# records appended before the journal is first compacted
+JOURNAL_COALESCE_LINES	= 64			# the largest record (in lines) that successive records are merged into
+
+# returns the journal file kept for a file
+def get_journal_file(filename):
+	digest = hashlib.md5(filename.encode("utf-8", "surrogatepass")).hexdigest()
+	return os.path.join(APP_JOURNAL_DIR, get_file_title(filename) + "-" + digest[0:16] + ".journal")
+
+# merges each record into the previous one if it only touches the lines produced by it (e.g. successive keystrokes on the same line)
+def coalesce_records(records):
+	merged = list()
+	for record in records:
+		first_version, last_version, start, old_count, new_lines = record
+		if(len(merged) > 0):
+			prev_first, prev_last, prev_start, prev_old_count, prev_new = merged[-1]
+			offset = start - prev_start
+			if(len(prev_new) <= JOURNAL_COALESCE_LINES and offset >= 0 and offset + old_count <= len(prev_new)):
+				merged[-1] = (prev_first, last_version, prev_start, prev_old_count, prev_new[0:offset] + list(new_lines) + prev_new[offset+old_count:])
+				continue
+		merged.append(record)
+	return merged
+
+# EditJournal class: the append-only journal of the edits made to a buffer since its file was last read or saved.
+# The journal starts with a header giving the size and mtime of the file the edits apply to (its base), or None if
+# the journal holds the whole text instead; each record is a tuple(first_version, last_version, start, old_count,
+# new_lines), which means that the old_count lines beginning at index start were replaced by new_lines in the
+# edits first_version to last_version of the buffer (see Buffer.edit_version). The file is only created when the
+# first edit is recorded, and is compacted (by coalescing records) every time its number of records doubles
+class EditJournal:
+	def __init__(self, filename, st):
+		self.filename = filename
+		self.journal_file = get_journal_file(filename)
+		self.base = (None if st == None else (st.st_size, st.st_mtime))
+		self.fd = None					# the journal file, open for appending
+		self.count = 0					# number of records in the file
+		self.compact_at = JOURNAL_COMPACT_RECORDS
+		self.last_version = 0
+		self.failed = False				# set if the journal could not be written, it is then no longer kept
+
+	# appends an edit: old_count lines at index start were replaced by new_lines, in the edit numbered version
+	def record(self, version, start, old_count, new_lines):
+		if(self.failed): return
+		try:
+			if(self.fd == None): self.rewrite([])
+			os.write(self.fd, pickle.dumps( (version, version, start, old_count, new_lines), pickle.HIGHEST_PROTOCOL ))
+			self.count += 1
+			self.last_version = version
+			if(self.count >= self.compact_at): self.compact()
+		except Exception as e:
+			self.fail(e)
+
+	# checks if any edits have been recorded
+	def has_records(self):
+		return (self.count > 0)
+
+	# applies the edits found in the journal file (left behind by a session which did not end normally) to the
+	# lines read from the file, and goes on appending to it; returns the recovered lines as a list, or None
+	# (after discarding the journal) if it cannot be applied to them
+	def replay(self, lines):
+		try:
+			header, records, end = self.read()
+			if(not isinstance(header, dict) or header.get("version") != JOURNAL_VERSION or header.get("filename") != self.filename):
+				raise(AshException("not a journal of this file"))
+			base = header.get("base")
+			if(base != None and base != self.base): raise(AshException("the file has changed since the journal was written"))
+
+			text = (list() if base == None else lines.to_list())
+			for first_version, last_version, start, old_count, new_lines in records:
+				if(start < 0 or old_count < 0 or start + old_count > len(text)): raise(AshException("invalid record"))
+				text[start:start+old_count] = new_lines
+				self.last_version = last_version
+			if(len(text) == 0): text = [""]
+
+			self.base = base
+			os.truncate(self.journal_file, end)			# drop a record cut short by the crash
+			self.fd = os.open(self.journal_file, os.O_WRONLY | os.O_APPEND)
+			self.count = len(records)
+			self.compact_at = max(JOURNAL_COMPACT_RECORDS, 2 * self.count)
+			return text
+		except Exception as e:
+			log_error(f"unable to recover {self.filename} from its journal: {e}")
+			self.discard()
+			return None
+
+	# makes the file just saved (st is its os.stat_result), holding the edits up to version, the new base of the journal:
+	# only the records of later edits are kept; if a record also holds earlier edits, the journal takes the whole text instead
+	def rebase(self, st, version, lines):
+		if(self.last_version <= version):
+			self.reset(st)
+			return
+		if(self.failed): return
+		try:
+			header, records, end = self.read()
+			if(header.get("base") == None): return			# the whole text does not depend on the file
+			later = [ record for record in records if record[1] > version ]
+			if(any(record[0] <= version for record in later)):
+				self.set_text(lines, self.last_version)
+			else:
+				self.base = (st.st_size, st.st_mtime)
+				self.rewrite(later)
+		except Exception as e:
+			self.fail(e)
+
+	# replaces the journal with the whole text, e.g. when the file on disk no longer matches the buffer
+	def set_text(self, lines, version):
+		if(self.failed): return
+		try:
+			self.base = None
+			self.rewrite([ (version, version, 0, 0, lines.to_list()) ])
+			self.last_version = version
+		except Exception as e:
+			self.fail(e)
+
+	# empties the journal, the edits now apply to the file as it is at st (an os.stat_result)
+	def reset(self, st):
+		self.discard()
+		self.base = (st.st_size, st.st_mtime)
+
+	# deletes the journal file
+	def discard(self):
+		self.close()
+		self.count = 0
+		self.compact_at = JOURNAL_COMPACT_RECORDS
+		self.last_version = 0
+		try:
+			if(os.path.isfile(self.journal_file)): os.remove(self.journal_file)
+		except OSError as e:
+			log_error(f"unable to remove journal {self.journal_file}: {e}")
+
+	# closes the journal file, leaving it on disk
+	def close(self):
+		if(self.fd == None): return
+		os.close(self.fd)
+		self.fd = None
+
+	# <------------------- private functions ---------------------->
+
+	# returns the header, the records and the offset of the end of the last complete record of the journal file
+	def read(self):
+		records = list()
+		with open(self.journal_file, "rb") as f:
+			header = pickle.load(f)
+			end = f.tell()
+			while(True):
+				try:
+					record = pickle.load(f)
+				except Exception:
+					break			# end of the journal, or a record cut short
+				records.append(record)
+				end = f.tell()
+		return (header, records, end)
+
+	# writes a journal file with the given records, which replaces the current one
+	def rewrite(self, records):
+		self.close()
+		os.makedirs(APP_JOURNAL_DIR, exist_ok=True)
+		header = { "version": JOURNAL_VERSION, "filename": self.filename, "base": self.base }
+		temp_file = self.journal_file + ".tmp"
+		with open(temp_file, "wb") as f:
+			pickle.dump(header, f, pickle.HIGHEST_PROTOCOL)
+			for record in records: pickle.dump(record, f, pickle.HIGHEST_PROTOCOL)
+		os.replace(temp_file, self.journal_file)
+		self.fd = os.open(self.journal_file, os.O_WRONLY | os.O_APPEND)
+		self.count = len(records)
+		self.compact_at = max(JOURNAL_COMPACT_RECORDS, 2 * self.count)
+
+	# coalesces the records of the journal file
+	def compact(self):
+		header, records, end = self.read()
+		self.rewrite(coalesce_records(records))
+
+	# stops keeping the journal after an error
+	def fail(self, e):
+		log_error(f"unable to write journal {self.journal_file}: {e}")
+		self.failed = True
+		self.close()
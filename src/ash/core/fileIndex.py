@@ -0,0 +1,204 @@
+# SPDX-License-Identifier: GPL-2.0-only
+#
+# /src/ash/core/fileIndex.py
+#
+# Copyright (C) 2022-2022  Akash Nag
+
+# This module implements the file-system scanner shared by the project loader,
+# the project explorer and the file dialogs
+
+from ash.core import *
+from ash.core.logger import *
+
+import pickle
+
+FILE_INDEX_VERSION		= 1
+
+# returns True if a directory entry should not be listed: hidden entries are skipped
+# (like glob does), as are ignored directories and files with ignored extensions
+def should_skip_entry(name, is_dir):
+	if(name.startswith(".")): return True
+	if(is_dir):
+		return (name in ash.SETTINGS.get("ignored_directories"))
+	else:
+		pos = name.rfind(".")
+		return (pos > -1 and name[pos:] in ash.SETTINGS.get("ignored_file_extensions"))
+
+# lists a single directory without descending into it
+# returns a list of tuple(path, is_dir) sorted by path
+def list_directory(dirname):
+	entries = list()
+	try:
+		with os.scandir(dirname) as it:
+			for entry in it:
+				is_dir = entry.is_dir()
+				if(not is_dir and not entry.is_file()): continue
+				if(should_skip_entry(entry.name, is_dir)): continue
+				entries.append( (entry.path, is_dir) )
+	except OSError:
+		pass
+	entries.sort()
+	return entries
+
+# FileIndex class: the files and directories under a root directory, found in a single pass
+# the index can be saved to disk and revalidated on the next run, so that only directories whose
+# mtime has changed are listed again, and files keep their encoding and binary/text classification
+# for as long as their size and mtime do not change
+class FileIndex:
+	def __init__(self, root_dir, index_file = None):
+		self.root_dir = root_dir
+		self.index_file = index_file
+		self.dirs = dict()			# directory -> tuple(mtime, list of sub-directories, list of files), both sorted
+		self.files = dict()			# file -> list[size, mtime, encoding, is_binary], the last two are None until known
+		self.ignored = None			# the ignore-settings the index was built with
+		self.modified = False
+
+	# loads a saved index, an empty index is returned if it does not exist or cannot be used
+	@staticmethod
+	def load(root_dir, index_file):
+		file_index = FileIndex(root_dir, index_file)
+		if(not os.path.isfile(index_file)): return file_index
+
+		try:
+			with open(index_file, "rb") as ifp:
+				data = pickle.load(ifp)
+			if(data.get("version") == FILE_INDEX_VERSION and data.get("root_dir") == root_dir):
+				file_index.ignored = data["ignored"]
+				file_index.dirs = data["dirs"]
+				file_index.files = data["files"]
+		except Exception as e:
+			log_error("unable to load file index: " + str(e))
+		return file_index
+
+	# writes the index to its file, if anything has changed since it was loaded
+	def save(self):
+		if(self.index_file == None or not self.modified): return
+		data = {
+			"version": FILE_INDEX_VERSION,
+			"root_dir": self.root_dir,
+			"ignored": self.ignored,
+			"dirs": self.dirs,
+			"files": self.files
+		}
+		try:
+			temp_file = self.index_file + ".tmp"
+			with open(temp_file, "wb") as ifp:
+				pickle.dump(data, ifp, pickle.HIGHEST_PROTOCOL)
+			os.replace(temp_file, self.index_file)
+			self.modified = False
+		except Exception as e:
+			log_error("unable to save file index: " + str(e))
+
+	# walks the tree with os.scandir(), pruning ignored directories before descending into them
+	# directories whose mtime is unchanged since the last scan are not listed again, only their files are stat-ed;
+	# the stat data of each DirEntry is reused for the size and mtime of the files
+	def scan(self):
+		ignored = (tuple(ash.SETTINGS.get("ignored_directories")), tuple(ash.SETTINGS.get("ignored_file_extensions")))
+		old_dirs = (self.dirs if ignored == self.ignored else dict())
+		old_files = self.files
+		self.dirs = dict()
+		self.files = dict()
+		self.ignored = ignored
+		visited = set()
+		pending = [ self.root_dir ]
+
+		while(len(pending) > 0):
+			dirname = pending.pop()
+			try:
+				st = os.stat(dirname)
+				if((st.st_dev, st.st_ino) in visited): continue		# symlink loop
+				visited.add( (st.st_dev, st.st_ino) )
+			except OSError:
+				continue
+
+			old = old_dirs.get(dirname)
+			if(old != None and old[0] == st.st_mtime):
+				sub_dirs = old[1]
+				files = list()
+				for f in old[2]:
+					try:
+						fst = os.stat(f)
+					except OSError:
+						continue
+					files.append(f)
+					self.add_file(f, fst, old_files)
+			else:
+				try:
+					with os.scandir(dirname) as it:
+						entries = sorted(it, key=lambda entry: entry.name)
+				except OSError:
+					continue
+
+				sub_dirs = list()
+				files = list()
+				for entry in entries:
+					try:
+						if(entry.is_dir()):
+							if(should_skip_entry(entry.name, True)): continue
+							sub_dirs.append(entry.path)
+						elif(entry.is_file()):
+							if(should_skip_entry(entry.name, False)): continue
+							files.append(entry.path)
+							self.add_file(entry.path, entry.stat(), old_files)
+					except OSError:
+						continue
+				self.modified = True
+
+			self.dirs[dirname] = (st.st_mtime, sub_dirs, files)
+			pending.extend(reversed(sub_dirs))
+
+		if(len(self.files) != len(old_files)): self.modified = True
+		return self
+
+	# adds a file to the index, keeping what is known about it if it has not changed since the last scan
+	def add_file(self, filename, st, old_files):
+		entry = old_files.get(filename)
+		if(entry == None or entry[0] != st.st_size or entry[1] != st.st_mtime):
+			entry = [ st.st_size, st.st_mtime, None, None ]
+			self.modified = True
+		self.files[filename] = entry
+
+	# returns the sub-directories and the files directly under a directory in the index
+	def get_children(self, dirname):
+		entry = self.dirs.get(dirname)
+		return (([], []) if entry == None else (entry[1], entry[2]))
+
+	# checks if a path under the root directory would be indexed, i.e. is not hidden or ignored
+	def accepts(self, path):
+		if(not path.startswith(self.root_dir + "/")): return False
+		names = path[len(self.root_dir)+1:].split("/")
+		for name in names[:-1]:
+			if(should_skip_entry(name, True)): return False
+		return not should_skip_entry(names[-1], os.path.isdir(path))
+
+	# returns all indexed files, in the order they were found
+	def get_files(self):
+		return list(self.files)
+
+	# returns all indexed directories, except the root
+	def get_directories(self):
+		return [ d for d in self.dirs if d != self.root_dir ]
+
+	# checks if a file is binary, classifying it only if it is not known from a previous scan
+	def is_binary(self, filename, app_ref):
+		entry = self.files.get(filename)
+		if(entry == None): return app_ref.buffers.is_binary(filename, app_ref)
+		if(entry[3] == None):
+			entry[3] = app_ref.buffers.is_binary(filename, app_ref)
+			self.modified = True
+		return entry[3]
+
+	# returns the encoding detected for a file the last time it was read, or None
+	def get_encoding(self, filename):
+		entry = self.files.get(filename)
+		return (None if entry == None else entry[2])
+
+	# records the encoding a file was read with
+	def set_encoding(self, filename, encoding):
+		entry = self.files.get(filename)
+		if(entry == None or entry[2] == encoding): return
+		entry[2] = encoding
+		self.modified = True
+
+	def __len__(self):
+		return len(self.files)
@@ -0,0 +1,208 @@
+# SPDX-License-Identifier: GPL-2.0-only
+#
+# /src/ash/core/fileWatcher.py
+#
+# Copyright (C) 2022-2022  Akash Nag
+
+# This module implements the file watcher which reports external changes to files:
+# it uses inotify (through ctypes) where available, and falls back to a polling thread
+
+from ash.core import *
+from ash.core.logger import *
+
+import ctypes
+import ctypes.util
+import queue
+import select
+import struct
+import threading
+import time
+
+FILE_CREATED			= 1
+FILE_MODIFIED			= 2
+FILE_DELETED			= 3
+FILES_UNKNOWN			= 4			# events were lost: anything under the watched directories may have changed
+
+POLL_INTERVAL			= 2			# seconds between scans of the watched directories, when inotify is unavailable
+
+# inotify(7) constants
+IN_MODIFY				= 0x00000002
+IN_ATTRIB				= 0x00000004
+IN_CLOSE_WRITE			= 0x00000008
+IN_MOVED_FROM			= 0x00000040
+IN_MOVED_TO				= 0x00000080
+IN_CREATE				= 0x00000100
+IN_DELETE				= 0x00000200
+IN_DELETE_SELF			= 0x00000400
+IN_Q_OVERFLOW			= 0x00004000
+IN_IGNORED				= 0x00008000
+IN_ONLYDIR				= 0x01000000
+IN_CLOEXEC				= 0o2000000
+IN_NONBLOCK				= 0o4000
+
+IN_WATCH_MASK			= IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR
+IN_EVENT_HEADER			= struct.Struct("iIII")		# wd, mask, cookie, len
+
+# FileWatcher class: watches directories for files being created, modified or deleted
+# events are queued as tuple(event_type, path) by a daemon thread, and read by the main loop;
+# listeners are called with each event as soon as it happens, on the watcher thread
+class FileWatcher:
+	def __init__(self):
+		self.events = queue.Queue()
+		self.listeners = list()
+		self.watched = dict()			# directory -> inotify watch descriptor (or None when polling)
+		self.paths = dict()				# inotify watch descriptor -> directory
+		self.snapshots = dict()			# directory -> dict(name -> (mtime, size)), when polling
+		self.lock = threading.Lock()
+		self.fd = -1
+
+		try:
+			self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+			self.fd = self.libc.inotify_init1(IN_CLOEXEC | IN_NONBLOCK)
+		except (OSError, AttributeError):
+			self.fd = -1
+
+		if(self.fd >= 0):
+			self.thread = threading.Thread(target=self.read_inotify_events, name="ash-watcher", daemon=True)
+		else:
+			self.thread = threading.Thread(target=self.poll_directories, name="ash-watcher", daemon=True)
+		self.thread.start()
+
+	# returns True if inotify is being used, False if the directories are polled
+	def is_native(self):
+		return (self.fd >= 0)
+
+	# starts watching a directory (non-recursively) for changes to the files directly under it
+	def watch_directory(self, dirname):
+		if(dirname in self.watched or not os.path.isdir(dirname)): return
+		if(self.fd >= 0):
+			wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dirname), IN_WATCH_MASK)
+			if(wd < 0):
+				log_error(f"cannot watch {dirname}: {os.strerror(ctypes.get_errno())}")
+				return
+			with self.lock:
+				self.watched[dirname] = wd
+				self.paths[wd] = dirname
+		else:
+			snapshot = self.take_snapshot(dirname)
+			with self.lock:
+				self.watched[dirname] = None
+				self.snapshots[dirname] = snapshot
+
+	# adds a function to be called with (event_type, path) for every event, on the watcher thread
+	def add_listener(self, listener):
+		with self.lock:
+			self.listeners.append(listener)
+
+	def remove_listener(self, listener):
+		with self.lock:
+			if(listener in self.listeners): self.listeners.remove(listener)
+
+	# returns the pending events as a list of tuple(event_type, path) with duplicates removed, oldest first
+	def get_events(self):
+		events = dict()
+		while(True):
+			try:
+				event = self.events.get_nowait()
+			except queue.Empty:
+				break
+			events.pop(event, None)
+			events[event] = True
+		return list(events)
+
+	# <------------------- private functions ---------------------->
+
+	# queues an event and passes it on to the listeners
+	def post_event(self, event_type, path):
+		self.events.put( (event_type, path) )
+		with self.lock:
+			listeners = list(self.listeners)
+		for listener in listeners:
+			try:
+				listener(event_type, path)
+			except Exception as e:
+				log_error("file watcher listener failed: " + str(e))
+
+	# body of the watcher thread when inotify is available
+	def read_inotify_events(self):
+		while(True):
+			try:
+				select.select([self.fd], [], [])
+				data = os.read(self.fd, 65536)
+			except BlockingIOError:
+				continue
+			except OSError as e:
+				log_error("file watcher stopped: " + str(e))
+				return
+
+			pos = 0
+			while(pos + IN_EVENT_HEADER.size <= len(data)):
+				wd, mask, cookie, length = IN_EVENT_HEADER.unpack_from(data, pos)
+				pos += IN_EVENT_HEADER.size
+				name = os.fsdecode(data[pos:pos+length].rstrip(b"\0"))
+				pos += length
+
+				if(mask & IN_Q_OVERFLOW):
+					self.post_event(FILES_UNKNOWN, None)
+					continue
+
+				with self.lock:
+					dirname = self.paths.get(wd)
+					if(mask & IN_IGNORED):
+						# the directory has been deleted or unmounted
+						self.paths.pop(wd, None)
+						if(dirname != None): self.watched.pop(dirname, None)
+						continue
+				if(dirname == None): continue
+
+				if(mask & IN_DELETE_SELF):
+					self.post_event(FILE_DELETED, dirname)
+				elif(mask & (IN_CREATE | IN_MOVED_TO)):
+					self.post_event(FILE_CREATED, os.path.join(dirname, name))
+				elif(mask & (IN_DELETE | IN_MOVED_FROM)):
+					self.post_event(FILE_DELETED, os.path.join(dirname, name))
+				elif(len(name) > 0):
+					self.post_event(FILE_MODIFIED, os.path.join(dirname, name))
+
+	# body of the watcher thread when inotify is not available
+	def poll_directories(self):
+		while(True):
+			time.sleep(POLL_INTERVAL)
+			with self.lock:
+				watched = list(self.snapshots.items())
+
+			for dirname, old_snapshot in watched:
+				if(not os.path.isdir(dirname)):
+					with self.lock:
+						self.watched.pop(dirname, None)
+						self.snapshots.pop(dirname, None)
+					self.post_event(FILE_DELETED, dirname)
+					continue
+
+				snapshot = self.take_snapshot(dirname)
+				for name, stat in snapshot.items():
+					old_stat = old_snapshot.get(name)
+					if(old_stat == None):
+						self.post_event(FILE_CREATED, os.path.join(dirname, name))
+					elif(old_stat != stat):
+						self.post_event(FILE_MODIFIED, os.path.join(dirname, name))
+				for name in old_snapshot:
+					if(name not in snapshot): self.post_event(FILE_DELETED, os.path.join(dirname, name))
+
+				with self.lock:
+					if(dirname in self.snapshots): self.snapshots[dirname] = snapshot
+
+	# returns the mtime and size of every entry in a directory
+	def take_snapshot(self, dirname):
+		snapshot = dict()
+		try:
+			with os.scandir(dirname) as it:
+				for entry in it:
+					try:
+						st = entry.stat()
+						snapshot[entry.name] = (st.st_mtime, st.st_size)
+					except OSError:
+						pass
+		except OSError:
+			pass
+		return snapshot
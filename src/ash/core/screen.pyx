@@ -10,7 +10,14 @@ from ash.formatting.colors import *
 from ash.gui.cursorPosition import *
 from ash.utils.utils import *
 from ash.gui import *
+from ash.core.chunkedList import *
+from ash.core.searchEngine import *
 import datetime
+from array import array
+
+# returns the number of rendered lines occupied by a line, given its col-spans
+def get_rendered_height(col_spans):
+	return max([1, len(col_spans)])
 
 cdef class Screen:
 	cdef bint show_line_numbers, show_scrollbars, show_git_diff
@@ -20,11 +27,20 @@ cdef class Screen:
 	cdef int col_start, col_end
 	cdef buffer
 	cdef win
-	cdef dict all_col_spans
-	cdef dict mapping_real_line_to_rendered_line
-	cdef dict mapping_rendered_line_to_real_line
-	cdef list screen_buffer
-	cdef list style_buffer
+	cdef object spans				# ChunkedList of col-spans of each line, weighted by the number of rendered lines
+	cdef object layout_lines		# the text storage from which spans were computed
+	cdef bint unwrapped_layout		# True if wrapping is off: every line is exactly 1 rendered line and spans are not stored
+	cdef list screen_buffer			# text of each row
+	cdef object style_buffer		# style of each cell: array of height*width styles (row-major), reused across frames
+	cdef long long[:] styles		# typed view of style_buffer
+	cdef list front_screen_buffer	# the screen-buffer and style-buffer last drawn on the window: swapped with the
+	cdef object front_style_buffer	# screen-buffer and style-buffer after every draw()
+	cdef long long[:] front_styles
+	cdef bint front_valid			# False if the window may no longer be showing the front buffers
+	cdef object front_origin		# position at which the front buffers were drawn
+	cdef list blank_rows			# a cleared screen-buffer
+	cdef object blank_styles		# a cleared style-buffer (and the background style it is filled with)
+	cdef long long blank_style
 	cdef set git_diff_lines
 	cdef int real_line_start_index_visible, real_line_end_index_visible
 	cdef int last_gutter_width
@@ -35,7 +51,13 @@ cdef class Screen:
 	# initialize the screen buffer
 	def __init__(self, supports_colors, win, buffer, int height, int width, show_line_numbers, show_scrollbars, show_gdiff):
 		self.supports_colors = 1 if supports_colors else 0
-		self.all_col_spans = None
+		self.spans = None
+		self.layout_lines = None
+		self.unwrapped_layout = False
+		self.buffer = None
+		self.win = None
+		self.front_valid = False
+		self.front_origin = None
 		self.show_line_numbers = show_line_numbers
 		self.show_scrollbars = show_scrollbars
 		self.show_git_diff = show_gdiff
@@ -61,17 +83,57 @@ cdef class Screen:
 		self.col_start = 0
 		self.col_end = self.width - self._get_gutter_width(self.line_end)
 		self.last_gutter_width = self._get_gutter_width(self.line_end)
+		self.allocate_buffers()
 		self.clear()
+		self.invalidate()
 
 	# update the window and buffer
 	def update(self, win, buffer):
+		if(win is not self.win): self.invalidate()
 		self.win = win
+		if(buffer is not self.buffer): 
+			self.spans = None
+			self.unwrapped_layout = False
 		self.buffer = buffer
 
-	# clear the screen buffer
+	# updates the layout after the lines [start, start+removed) have been replaced by 'inserted' new lines:
+	# only the new lines are reflowed, the rest of the layout is left untouched
+	def mark_dirty(self, start, removed, inserted):
+		if(self.buffer == None): return
+		lines = self.buffer.lines
+		if(self.unwrapped_layout):
+			self.total_rendered_lines = len(lines)
+			return
+		if(self.spans == None): return
+		if(lines is not self.layout_lines or len(self.spans) - removed + inserted != len(lines)):
+			self.spans = None
+		elif(inserted > 1024 and inserted > len(lines) // 2):
+			self.spans = None				# mostly new document: defer to a full reflow on the next render
+		else:
+			new_spans = [ self.reflow(self.last_text_area_width, line, self.last_tab_size, self.last_word_wrap, self.last_hard_wrap) for line in lines[start:start+inserted] ]
+			self.spans.replace(start, start + removed, new_spans)
+			self.total_rendered_lines = self.spans.total_weight()
+
+	# allocate the screen buffers (and the front buffers) for the current size
+	cdef allocate_buffers(self):
+		self.blank_style = gc("editor-background")
+		self.blank_styles = array("q", [ self.blank_style ]) * (self.height * self.width)
+		self.blank_rows = [ " " * self.width ] * self.height
+		self.screen_buffer = list(self.blank_rows)
+		self.front_screen_buffer = list(self.blank_rows)
+		self.style_buffer = array("q", self.blank_styles)
+		self.front_style_buffer = array("q", self.blank_styles)
+		self.styles = self.style_buffer
+		self.front_styles = self.front_style_buffer
+
+	# clear the screen buffer: the buffers are reset in bulk, without allocating new ones
 	cdef clear(self):
-		self.screen_buffer = [ " " * self.width for y in range(self.height) ]
-		self.style_buffer = [ [ gc("editor-background") for x in range(self.width) ] for y in range(self.height) ]
+		cdef long long style = gc("editor-background")
+		if(style != self.blank_style):
+			self.blank_style = style
+			self.blank_styles = array("q", [ style ]) * (self.height * self.width)
+		self.screen_buffer[:] = self.blank_rows
+		self.style_buffer[:] = self.blank_styles
 
 	# put a string in a position
 	cdef putstr(self, int y, int x, s):
@@ -84,10 +146,7 @@ cdef class Screen:
 
 	# show the fake cursor in the specified location
 	cdef put_cursor(self, int y, int x):
-		try:
-			self.style_buffer[y][x] = gc("cursor") | (0 if(self.supports_colors==1) else curses.A_REVERSE)
-		except:
-			pass
+		self.set_style(y, x, x + 1, gc("cursor") | (0 if(self.supports_colors==1) else curses.A_REVERSE))
 
 	# highlight a line
 	cdef highlight_line(self, int y, int gutter_width):
@@ -99,17 +158,14 @@ cdef class Screen:
 			self.set_style(y, 0, gutter_width, gc("line-number"))
 
 	# set the style of a portion in the screen buffer from [x_start = inclusive, x_end = exclusive)
-	cdef set_style(self, int y, int x_start, int x_end, style):
+	cdef set_style(self, int y, int x_start, int x_end, long long style):
+		cdef int x
+		cdef int offset = y * self.width
+		if(y < 0 or y >= self.height): return
+		x_start = max([x_start, 0])
+		x_end = min([x_end, self.width])
 		for x in range(x_start, x_end):
-			self.style_buffer[y][x] = style
-
-	# set the style of a particular location in the screen buffer
-	cdef set_style_single(self, pos, style):
-		try:
-			self.style_buffer[pos.y][pos.x] = style
-			return True
-		except:
-			return False
+			self.styles[offset + x] = style
 
 	# determine the space to be reserved for the gutter (left, to show line number) = 1 space on either side and linenumber in middle
 	cdef _get_gutter_width(self, int line_end):
@@ -133,39 +189,58 @@ cdef class Screen:
 		return sorted(pos)
 
 	# reflows a document containing multiple lines depending on wrap settings and after expansion of tabs
+	# the rendered line index of a real line is the sum of the weights of the lines before it, and vice versa
 	def reflow_all(self, width, lines, tab_size, word_wrap, hard_wrap):
-		self.all_col_spans = dict()
-		self.mapping_real_line_to_rendered_line = dict()		# only the 1st rendered line
-		self.mapping_rendered_line_to_real_line = dict()		# contains tuple(real_line_index, subline_offset)
-		
-		self.total_rendered_lines = 0
-		rendered_counter = 0
-		
-		for i, line in enumerate(lines):
-			self.all_col_spans[i] = self.reflow(width, line, tab_size, word_wrap, hard_wrap)
-			self.mapping_real_line_to_rendered_line[i] = rendered_counter
-			
-			k = len(self.all_col_spans[i])
-			for j in range(k):
-				self.mapping_rendered_line_to_real_line[rendered_counter+j] = (i,j)
-
-			if(k == 0):
-				self.total_rendered_lines += 1
-				self.mapping_rendered_line_to_real_line[rendered_counter] = (i,0)
-				rendered_counter += 1
-			else:
-				self.total_rendered_lines += k
-				rendered_counter += k
+		self.spans = ChunkedList([ self.reflow(width, line, tab_size, word_wrap, hard_wrap) for line in lines ], get_rendered_height)
+		self.layout_lines = lines
+		self.total_rendered_lines = self.spans.total_weight()
+
+	# makes sure that the layout is up to date with the given parameters, reflows everything if not;
+	# when wrapping is off, no layout is stored at all: the rendered line index is the real line index
+	cdef ensure_layout(self, int text_area_width, int tab_size, bint word_wrap, bint hard_wrap):
+		lines = self.buffer.lines
+		if(not word_wrap):
+			self.spans = None
+			self.layout_lines = lines
+			self.unwrapped_layout = True
+			self.last_text_area_width = text_area_width
+			self.last_tab_size = tab_size
+			self.last_word_wrap = word_wrap
+			self.last_hard_wrap = hard_wrap
+			self.total_rendered_lines = len(lines)
+			return
+
+		if(self.unwrapped_layout or self.spans == None or self.layout_lines is not lines or len(self.spans) != len(lines) or self.last_text_area_width != text_area_width or self.last_tab_size != tab_size or self.last_word_wrap != word_wrap or self.last_hard_wrap != hard_wrap):
+			self.unwrapped_layout = False
+			self.last_text_area_width = text_area_width
+			self.last_tab_size = tab_size
+			self.last_word_wrap = word_wrap
+			self.last_hard_wrap = hard_wrap
+			self.reflow_all(text_area_width, lines, tab_size, word_wrap, hard_wrap)
+		self.total_rendered_lines = self.spans.total_weight()
+
+	# returns the col-spans of the given line
+	cdef get_col_spans(self, lines, int line_index, int width, int tab_size, bint word_wrap, bint hard_wrap):
+		if(self.spans == None): return self.reflow(width, lines[line_index], tab_size, word_wrap, hard_wrap)
+		return self.spans[line_index]
+
+	# returns the index of the 1st rendered line of the given real line
+	cdef int get_rendered_line_index(self, int line_index):
+		if(self.unwrapped_layout): return line_index
+		return self.spans.weight_before(line_index)
+
+	# returns a tuple(real_line_index, subline_offset) for the given rendered line index
+	cdef locate_rendered_line(self, int rendered_line_index):
+		if(self.unwrapped_layout): return (rendered_line_index, 0)
+		return self.spans.locate_weight(rendered_line_index)
 
 	# reflow a line of text (depending on wrap settings and tab-size) and return a list of column-spans (after tab-expansion)
 	cdef reflow(self, int width, line, int tab_size, bint word_wrap, bint hard_wrap):
 		text = line.expandtabs(tab_size)
 		col_spans = list()
-		separators = set(" ,.()[]{}:;\'\"?")
-		pos = self.get_delimiter_positions_list(text, separators)
 		
 		cdef int pos_start = 0
-		cdef int len_pos = len(pos)
+		cdef int len_pos
 		cdef int col_start = 0
 		cdef int col_end = 0
 		cdef int col_width
@@ -189,6 +264,9 @@ cdef class Screen:
 			return col_spans
 	
 		# soft wrap is ON
+		separators = set(" ,.()[]{}:;\'\"?")
+		pos = self.get_delimiter_positions_list(text, separators)
+		len_pos = len(pos)
 		while(col_start < w):
 			flag = False
 			for i in range(pos_start, len_pos):
@@ -211,60 +289,80 @@ cdef class Screen:
 		
 		return col_spans
 
+	# returns a tuple(real_line_start, line_start_col_spans, line_start_offset) for the first visible line
 	cdef _get_line_start(self, int nlines, lines):
-		cdef int rendered_line_index = -1
-		cdef int i, real_line_start, line_start_offset, j
-
-		for i in range(nlines):
-			col_spans = self.all_col_spans[i]
-			if(len(col_spans) == 0): 
-				rendered_line_index += 1
-				if(rendered_line_index == self.line_start):
-					real_line_start = i
-					line_start_col_spans = col_spans			# col positions are AFTER tab expansion
-					line_start_offset = 0
-					return (real_line_start, line_start_col_spans, line_start_offset)
-			else:
-				for j in range(len(col_spans)):
-					rendered_line_index += 1
-					if(rendered_line_index == self.line_start):
-						real_line_start = i
-						line_start_col_spans = col_spans			# col positions are AFTER tab expansion
-						line_start_offset = j
-						return (real_line_start, line_start_col_spans, line_start_offset)
+		cdef int real_line_start, line_start_offset
+		real_line_start, line_start_offset = self.locate_rendered_line(self.line_start)
+		if(real_line_start >= nlines): 
+			real_line_start = nlines - 1
+			line_start_offset = 0
+		line_start_col_spans = self.get_col_spans(lines, real_line_start, self.last_text_area_width, self.last_tab_size, self.last_word_wrap, self.last_hard_wrap)			# col positions are AFTER tab expansion
+		return (real_line_start, line_start_col_spans, line_start_offset)
 	
+	# returns a list mapping each column of a line (and the position after its end) to the rendered column
+	# after tab expansion, or None if the line has no tabs (in which case the mapping is the identity)
+	cdef get_rendered_column_map(self, line, int tab_size):
+		if("\t" not in line): return None
+		cdef int x = 0
+		col_map = list()
+		for c in line:
+			col_map.append(x)
+			x += (tab_size - (x % tab_size)) if(c == "\t") else 1
+		col_map.append(x)
+		return col_map
+
+	# styles the rendered columns [rendered_start, rendered_end) of a line whose 1st rendered line is rendered_line_index,
+	# splitting the range across its wrapped sub-lines and clipping it to the visible area
+	cdef paint_span(self, int rendered_line_index, col_spans, int rendered_start, int rendered_end, int text_area_width, style):
+		cdef int gutter_width = self.width - text_area_width
+		cdef int k, y, x_start, x_end
+		if(rendered_start >= rendered_end): return
+
+		for k, cs in enumerate(col_spans):
+			if(cs[0] >= rendered_end): break
+			y = rendered_line_index + k - self.line_start
+			if(y >= self.height): break
+			if(y < 0 or cs[1] < rendered_start): continue
+			
+			x_start = max([rendered_start, cs[0]]) - cs[0] - self.col_start
+			x_end = min([rendered_end, cs[1] + 1]) - cs[0] - self.col_start
+			x_start = max([x_start, 0])
+			x_end = min([x_end, text_area_width])
+			if(x_start >= x_end): continue
+
+			self.set_style(y, gutter_width + x_start, gutter_width + x_end, style)
+
+	# styles the (real) columns [start, end) of the given line
+	cdef paint_line_range(self, lines, int line_index, col_map, col_spans, int start, int end, int text_area_width, style):
+		cdef int n = len(lines[line_index])
+		start = min([max([start, 0]), n])
+		end = min([max([end, 0]), n])
+		if(start >= end): return
+		if(col_map != None):
+			start = col_map[start]
+			end = col_map[end]
+		self.paint_span(self.get_rendered_line_index(line_index), col_spans, start, end, text_area_width, style)
+
 	cdef perform_syntax_highlighting(self, lines, int text_area_width, real_curpos, int tab_size, bint word_wrap, bint hard_wrap):
 		cdef int start_line_index, end_line_index
 		start_line_index, end_line_index = self.real_line_start_index_visible, self.real_line_end_index_visible
-		cdef int gutter_width = self.width - text_area_width
-		cdef int line_index, visible_line_index
+		cdef int line_index, start_index
 
 		if(self.buffer.formatter.lexer == None): return
 
 		# cannot use join as it will mess up the lexer indices with the insertion of newline characters
 		for line_index in range(start_line_index, end_line_index):
-			temp = CursorPosition(line_index, 0)
-			visible_line_index = self.mapping_real_line_to_rendered_line[line_index] - 1
-
 			data = lines[line_index]
+			col_map = self.get_rendered_column_map(data, tab_size)
+			col_spans = self.get_col_spans(lines, line_index, text_area_width, tab_size, word_wrap, hard_wrap)
+			
 			# lex-data contains a list of tuples(index, style, text)
-			lex_data = self.buffer.format_code(data)
+			lex_data = self.buffer.get_line_styles(line_index)
+			if(lex_data == None): continue			# not yet lexed (in the background)
 			for style_info in lex_data:
 				start_index = style_info[0]
-				style = style_info[1]
-				text = style_info[2]
-				temp.x = start_index
-				
-				rendered_pos, _ = self.translate_real_curpos_to_rendered_curpos(lines, temp, text_area_width, tab_size, word_wrap, hard_wrap, visible_line_index)
-				if(rendered_pos.x >= self.col_end): break
-
-				for index in range(len(text)):
-					temp.x = start_index + index
-					rendered_pos, _ = self.translate_real_curpos_to_rendered_curpos(lines, temp, text_area_width, tab_size, word_wrap, hard_wrap, visible_line_index)
-					if(rendered_pos.x >= self.col_end): continue
-
-					visual_pos = self.translate_rendered_to_visual_pos(rendered_pos, gutter_width)
-					self.set_style_single(visual_pos, style)
+				if(start_index >= len(data)): break
+				self.paint_line_range(lines, line_index, col_map, col_spans, start_index, start_index + len(style_info[2]), text_area_width, style_info[1])
 
 	cdef is_start_before_end(self, start, end):
 		if(start.y == end.y and start.x < end.x): return True
@@ -273,42 +371,17 @@ cdef class Screen:
 
 	cdef perform_selection_highlighting(self, lines, int text_area_width, real_curpos, rendered_curpos, int tab_size, bint word_wrap, bint hard_wrap, selection_info):
 		sel_start, sel_end = self.get_selection_endpoints(selection_info["start"], selection_info["end"])
-		cdef int max_start_x = len(lines[sel_start.y])
-		temp = copy.copy(sel_start)
-		cdef int gutter_width = self.width - text_area_width
-		cdef int y, x
-		cdef int visible_line_index = self.get_pre_translation_parameters(lines, temp, text_area_width, tab_size, word_wrap, hard_wrap)
-		if(sel_start.y != sel_end.y):
-			for x in range(sel_start.x, max_start_x):
-				temp.x = x
-				rendered_temp, _ = self.translate_real_curpos_to_rendered_curpos(lines, temp, text_area_width, tab_size, word_wrap, hard_wrap, visible_line_index)
-				visual = self.translate_rendered_to_visual_pos(rendered_temp, gutter_width)
-				self.set_style_single(visual, gc("selection") | (0 if(self.supports_colors==1) else curses.A_REVERSE))
-		else:
-			for x in range(sel_start.x, sel_end.x):
-				temp.x = x
-				rendered_temp, _ = self.translate_real_curpos_to_rendered_curpos(lines, temp, text_area_width, tab_size, word_wrap, hard_wrap, visible_line_index)
-				visual = self.translate_rendered_to_visual_pos(rendered_temp, gutter_width)
-				self.set_style_single(visual, gc("selection") | (0 if(self.supports_colors==1) else curses.A_REVERSE))
-
-		for y in range(sel_start.y + 1, sel_end.y):
-			temp.y = y
-			visible_line_index = self.get_pre_translation_parameters(lines, temp, text_area_width, tab_size, word_wrap, hard_wrap)
-			max_start_x = len(lines[y])
-			for x in range(max_start_x):
-				temp.x = x
-				rendered_temp, _ = self.translate_real_curpos_to_rendered_curpos(lines, temp, text_area_width, tab_size, word_wrap, hard_wrap, visible_line_index)
-				visual = self.translate_rendered_to_visual_pos(rendered_temp, gutter_width)
-				self.set_style_single(visual, gc("selection") | (0 if(self.supports_colors==1) else curses.A_REVERSE))
-		
-		if(sel_start.y != sel_end.y):
-			temp.y = sel_end.y
-			visible_line_index = self.get_pre_translation_parameters(lines, temp, text_area_width, tab_size, word_wrap, hard_wrap)
-			for x in range(sel_end.x):
-				temp.x = x
-				rendered_temp, _ = self.translate_real_curpos_to_rendered_curpos(lines, temp, text_area_width, tab_size, word_wrap, hard_wrap, visible_line_index)
-				visual = self.translate_rendered_to_visual_pos(rendered_temp, gutter_width)
-				self.set_style_single(visual, gc("selection") | (0 if(self.supports_colors==1) else curses.A_REVERSE))
+		style = gc("selection") | (0 if(self.supports_colors==1) else curses.A_REVERSE)
+		cdef int y, start, end
+
+		# only the visible portion of the selection needs to be painted
+		for y in range(max([sel_start.y, self.real_line_start_index_visible]), min([sel_end.y + 1, self.real_line_end_index_visible])):
+			line = lines[y]
+			start = (sel_start.x if y == sel_start.y else 0)
+			end = (sel_end.x if y == sel_end.y else len(line))
+			col_map = self.get_rendered_column_map(line, tab_size)
+			col_spans = self.get_col_spans(lines, y, text_area_width, tab_size, word_wrap, hard_wrap)
+			self.paint_line_range(lines, y, col_map, col_spans, start, end, text_area_width, style)
 
 	cdef translate_rendered_to_visual_pos(self, rendered_pos, int gutter_width):
 		if(self.line_start > rendered_pos.y or self.col_start > rendered_pos.x):
@@ -332,44 +405,24 @@ cdef class Screen:
 		cdef bint whole_words = highlight_info["whole_words"]
 		cdef bint is_regex = highlight_info["is_regex"]
 
-		if(search_text == None): return
+		pattern = compile_search(search_text, match_case, whole_words, is_regex)
+		if(pattern == None): return
 		
-		cdef int gutter_width = self.width - text_area_width
-		lower_stext = search_text.lower()
-		cdef int n = len(search_text)
 		cdef int start_line_index, end_line_index
 		start_line_index, end_line_index = self.real_line_start_index_visible, self.real_line_end_index_visible
-		cdef int y, i, pos, visible_line_index
+		cdef int y
+		style = gc("highlight") | (0 if(self.supports_colors==1) else curses.A_REVERSE)
 
 		for y in range(start_line_index, end_line_index):
 			vtext = lines[y]
-			lower_vtext = vtext.lower()			
+			col_map = None
+			col_spans = None
 
-			corpus = (vtext if match_case else lower_vtext)
-			if(is_regex or match_case):
-				search = search_text
-			else:
-				search = lower_stext
-
-			pos = -1
-			real_pos = CursorPosition(y, pos)
-			visible_line_index = self.get_pre_translation_parameters(lines, real_pos, text_area_width, tab_size, word_wrap, hard_wrap)
-			
-			while(True):
-				if(is_regex):
-					pos = find_regex(corpus[pos+1:], search)
-				elif(whole_words):
-					pos = find_whole_word(corpus[pos+1:], search)
-				else:
-					pos = corpus.find(search, pos+1)
-				
-				if(pos < 0): break
-
-				for i in range(n):
-					real_pos.x = pos + i
-					rendered_pos, _ = self.translate_real_curpos_to_rendered_curpos(lines, real_pos, text_area_width, tab_size, word_wrap, hard_wrap, visible_line_index)
-					visual_pos = self.translate_rendered_to_visual_pos(rendered_pos, gutter_width)
-					self.set_style_single(visual_pos, gc("highlight") | (0 if(self.supports_colors==1) else curses.A_REVERSE))
+			for start, end in pattern.finditer(vtext):
+				if(col_spans == None):
+					col_map = self.get_rendered_column_map(vtext, tab_size)
+					col_spans = self.get_col_spans(lines, y, text_area_width, tab_size, word_wrap, hard_wrap)
+				self.paint_line_range(lines, y, col_map, col_spans, start, end, text_area_width, style)
 
 	# returns a dict() with key=rendered_curpos(sub_line_offset_y, col) and value = real_curpos.x
 	cdef get_correspondence(self, line, int width, int tab_size, bint word_wrap, bint hard_wrap):
@@ -401,7 +454,8 @@ cdef class Screen:
 		cdef int max_col
 
 		try:
-			real_line_index, sub_line_offset = self.mapping_rendered_line_to_real_line[rendered_curpos.y]
+			if(rendered_curpos.y < 0 or rendered_curpos.y >= self.total_rendered_lines): return None
+			real_line_index, sub_line_offset = self.locate_rendered_line(rendered_curpos.y)
 			correspondence = self.get_correspondence(lines[real_line_index], width, tab_size, word_wrap, hard_wrap)
 
 			real_col = correspondence.get((sub_line_offset, rendered_curpos.x))
@@ -421,11 +475,7 @@ cdef class Screen:
 
 	
 	cdef get_subline_offset(self, lines, int width, int tab_size, bint word_wrap, bint hard_wrap, real_curpos):
-		if(self.all_col_spans == None):
-			col_spans = self.reflow(width, lines[real_curpos.y], tab_size, word_wrap, hard_wrap)
-		else:
-			col_spans = self.all_col_spans[real_curpos.y]
-
+		col_spans = self.get_col_spans(lines, real_curpos.y, width, tab_size, word_wrap, hard_wrap)
 		if(len(col_spans)==0): return (0, col_spans)
 
 		cdef int y
@@ -445,11 +495,9 @@ cdef class Screen:
 	# returns the visible-line-index for a line after reflowing: for optimizing translation from real to rendered-curpos (during selection highlighting)
 	cdef get_pre_translation_parameters(self, lines, real_curpos, int text_area_width, int tab_size, bint word_wrap, bint hard_wrap):
 		cdef int visible_line_index = -1, y
+		if(self.unwrapped_layout or self.spans != None): return self.get_rendered_line_index(real_curpos.y) - 1
 		for y in range(real_curpos.y):
-			if(self.all_col_spans == None):
-				col_spans = self.reflow(text_area_width, lines[y], tab_size, word_wrap, hard_wrap)
-			else:
-				col_spans = self.all_col_spans[y]
+			col_spans = self.reflow(text_area_width, lines[y], tab_size, word_wrap, hard_wrap)
 			visible_line_index += (len(col_spans) if len(col_spans) > 0 else 1)
 		return visible_line_index
 		
@@ -457,12 +505,9 @@ cdef class Screen:
 		cdef int y, i, n, rendered_x, rendered_line_col, current_line_length
 
 		if(visible_line_index < 0):
-			visible_line_index = self.mapping_real_line_to_rendered_line[real_curpos.y] - 1
+			visible_line_index = self.get_pre_translation_parameters(lines, real_curpos, text_area_width, tab_size, word_wrap, hard_wrap)
 			
-		if(self.all_col_spans == None):
-			col_spans = self.reflow(text_area_width, lines[real_curpos.y], tab_size, word_wrap, hard_wrap)
-		else:
-			col_spans = self.all_col_spans[real_curpos.y]
+		col_spans = self.get_col_spans(lines, real_curpos.y, text_area_width, tab_size, word_wrap, hard_wrap)
 		rendered_x = self.translate_real_curpos_col_to_rendered_curpos_col(lines[real_curpos.y], tab_size, real_curpos.x)
 		
 		n = len(col_spans)
@@ -524,12 +569,9 @@ cdef class Screen:
 		self.last_gutter_width = gutter_width
 		text_area_width = self.width - gutter_width
 
-		if(forced or self.last_text_area_width != text_area_width or self.last_tab_size != tab_size or self.last_word_wrap != word_wrap or self.last_hard_wrap != hard_wrap):
-			self.reflow_all(text_area_width, self.buffer.lines, tab_size, word_wrap, hard_wrap)
-			self.last_text_area_width = text_area_width
-			self.last_tab_size = tab_size
-			self.last_word_wrap = word_wrap
-			self.last_hard_wrap = hard_wrap
+		# edits are applied to the layout incrementally (see mark_dirty()), so a full reflow
+		# is needed only if the layout parameters have changed
+		self.ensure_layout(text_area_width, tab_size, word_wrap, hard_wrap)
 
 	# render text data to screen buffer
 	def render(self, real_curpos, tab_size, word_wrap, hard_wrap, selection_info, highlight_info, is_in_focus, slave_cursors, stylize = True):
@@ -547,6 +589,7 @@ cdef class Screen:
 		# won't be a problem if you allow line numbers to start from screen-edge: that space will be taken up if user scrolls so much that 1-2 digits are added in the next scroll()
 		
 		#t1 = datetime.datetime.now()
+		self.ensure_layout(self.width - self._get_gutter_width(self.line_end), tab_size, word_wrap, hard_wrap)
 		rendered_curpos = self.scroll(self.buffer.lines, real_curpos, self.width - self._get_gutter_width(self.line_end), tab_size, word_wrap, hard_wrap)
 
 		# set up lines
@@ -564,16 +607,8 @@ cdef class Screen:
 
 		#t2 = datetime.datetime.now()
 		
-		if(self.last_text_area_width != text_area_width or self.last_tab_size != tab_size or self.last_word_wrap != word_wrap or self.last_hard_wrap != hard_wrap):
-			self.all_col_spans = None
-			self.last_text_area_width = text_area_width
-			self.last_tab_size = tab_size
-			self.last_word_wrap = word_wrap
-			self.last_hard_wrap = hard_wrap
-		
 		self.set_gutter_style(gutter_width)
-		if(self.all_col_spans == None):
-			self.reflow_all(text_area_width, self.buffer.lines, tab_size, word_wrap, hard_wrap)
+		self.ensure_layout(text_area_width, tab_size, word_wrap, hard_wrap)
 
 		#t3 = datetime.datetime.now()
 
@@ -617,7 +652,7 @@ cdef class Screen:
 					self.set_style(y, gutter_width-1, gutter_width, gc("gitstatus-A"))
 				
 			text = lines[line_index].expandtabs(tab_size)
-			col_spans = self.all_col_spans[line_index]
+			col_spans = self.get_col_spans(lines, line_index, text_area_width, tab_size, word_wrap, hard_wrap)
 			
 			for i in range( len(col_spans) ):
 				if(y >= self.height): break				
@@ -709,19 +744,45 @@ cdef class Screen:
 			sel_start, sel_end = sel_end, sel_start
 		return(sel_start, sel_end)
 
-	# draw the screen-buffer on screen
+	# forces the next draw() to draw all the rows: to be called whenever the window may have been drawn over
+	def invalidate(self):
+		self.front_valid = False
+		self.front_origin = None
+
+	# checks if row y of the screen buffers is the same as in the front buffers
+	cdef bint is_row_unchanged(self, int y):
+		cdef int x
+		cdef int offset = y * self.width
+		if(self.screen_buffer[y] != self.front_screen_buffer[y]): return False
+		for x in range(offset, offset + self.width):
+			if(self.styles[x] != self.front_styles[x]): return False
+		return True
+
+	# draw the screen-buffer on screen: the rows which are the same as in the last frame drawn are skipped
 	def draw(self, offset_y, offset_x):
 		# optimized drawing routine: call addstr() only if style changes
-		cdef int x, y, last_style_x
+		cdef int x, y, last_style_x, offset
+		cdef long long last_style
+		cdef bint full = (not self.front_valid or self.front_origin != (offset_y, offset_x))
 		for y in range(self.height):
-			last_style = self.style_buffer[y][0]
+			if(not full and self.is_row_unchanged(y)): continue
+			offset = y * self.width
+			text = self.screen_buffer[y]
+			last_style = self.styles[offset]
 			last_style_x = 0
 			for x in range(1, self.width):
-				if(self.style_buffer[y][x] == last_style): continue
-				self.win.addstr(offset_y + y, offset_x + last_style_x, self.screen_buffer[y][last_style_x:x], last_style)
-				last_style = self.style_buffer[y][x]
+				if(self.styles[offset + x] == last_style): continue
+				self.win.addstr(offset_y + y, offset_x + last_style_x, text[last_style_x:x], last_style)
+				last_style = self.styles[offset + x]
 				last_style_x = x
-			self.win.addstr(offset_y + y, offset_x + last_style_x, self.screen_buffer[y][last_style_x:self.width], last_style)
+			self.win.addstr(offset_y + y, offset_x + last_style_x, text[last_style_x:self.width], last_style)
+
+		# what has been drawn becomes the front buffer, and the old front buffer is reused for the next frame
+		self.screen_buffer, self.front_screen_buffer = self.front_screen_buffer, self.screen_buffer
+		self.style_buffer, self.front_style_buffer = self.front_style_buffer, self.style_buffer
+		self.styles, self.front_styles = self.front_styles, self.styles
+		self.front_valid = True
+		self.front_origin = (offset_y, offset_x)
 
 	# <------------------------------- mouse handling functions ----------------------------------->
 	def get_curpos_after_click(self, y, x, lines, width, tab_size, word_wrap, hard_wrap):
@@ -0,0 +1,325 @@
+# SPDX-License-Identifier: GPL-2.0-only
+#
+# /src/ash/core/searchEngine.py
+#
+# Copyright (C) 2022-2022  Akash Nag
+
+# This module implements the search engine used by find/replace and search-highlighting:
+# a search is compiled into a regular expression once, and the compiled searches are cached;
+# project-wide searches run as a SearchJob on a background thread
+
+from ash.core import *
+from ash.core.logger import *
+
+import re
+import collections
+import concurrent.futures
+import functools
+import itertools
+import queue
+import threading
+from array import array
+
+WORD_SEPARATORS		= "[]{}()+-*/%=<>.,/?;:'\"!|&^ "
+SEARCH_READERS		= 4				# threads reading files from disk for a SearchJob
+SEARCH_READ_AHEAD	= 16			# files read ahead of the one being searched
+SEARCH_BATCH_LINES	= 65536			# lines joined into a single text and scanned at a time by find_all()
+
+# returns the compiled SearchPattern for a search, or None if the search is empty or is an invalid regular expression
+@functools.lru_cache(maxsize=16)
+def compile_search(search_text, match_case, whole_words, is_regex):
+	if(search_text == None or len(search_text) == 0): return None
+	try:
+		return SearchPattern(search_text, bool(match_case), bool(whole_words), bool(is_regex))
+	except re.error:
+		return None
+
+# returns a dictionary of line_index -> the line with all its matches (SearchResults, ordered by line and position) replaced
+def replace_matches(lines, search_results, replace_text):
+	new_lines = dict()
+	line_index = -1
+	for index, pos, length in search_results:
+		if(index != line_index):
+			if(line_index > -1):
+				pieces.append(line[last_end:])
+				new_lines[line_index] = "".join(pieces)
+			line_index = index
+			line = lines[index]
+			pieces = list()
+			last_end = 0
+		pieces.append(line[last_end:pos])
+		pieces.append(replace_text)
+		last_end = pos + length
+	if(line_index > -1):
+		pieces.append(line[last_end:])
+		new_lines[line_index] = "".join(pieces)
+	return new_lines
+
+# SearchResults class: the matches of a search in a buffer, kept as compact arrays;
+# iterating over it yields tuple(line_index, col_pos, length)
+class SearchResults:
+	def __init__(self, lines = None):
+		self.lines = lines				# the lines searched, to show the matches in context
+		self.line_indices = array("l")
+		self.positions = array("l")
+		self.lengths = array("l")
+
+	def add(self, line_index, pos, length):
+		self.line_indices.append(line_index)
+		self.positions.append(pos)
+		self.lengths.append(length)
+
+	# appends matches given as parallel lists
+	def extend(self, line_indices, positions, lengths):
+		self.line_indices.extend(line_indices)
+		self.positions.extend(positions)
+		self.lengths.extend(lengths)
+
+	# drops all but the first count matches
+	def truncate(self, count):
+		del self.line_indices[count:]
+		del self.positions[count:]
+		del self.lengths[count:]
+
+	# returns the distinct line indices having a match, in order
+	def get_lines(self):
+		return sorted(set(self.line_indices))
+
+	def __len__(self):
+		return len(self.line_indices)
+
+	def __getitem__(self, index):
+		return (self.line_indices[index], self.positions[index], self.lengths[index])
+
+	def __iter__(self):
+		return zip(self.line_indices, self.positions, self.lengths)
+
+# SearchPattern class: a search (plain text, whole words or regular expression) compiled into a regular expression
+class SearchPattern:
+	def __init__(self, search_text, match_case, whole_words, is_regex):
+		flags = re.MULTILINE | (0 if match_case else re.IGNORECASE)
+		if(is_regex):
+			pattern = search_text
+		else:
+			pattern = re.escape(search_text)
+			if(whole_words):
+				# a whole word must be preceded and followed by a separator or by the start/end of the line
+				separators = "[" + re.escape(WORD_SEPARATORS) + "]"
+				if(search_text[0] not in WORD_SEPARATORS): pattern = "(?:^|(?<=" + separators + "))" + pattern
+				if(search_text[-1] not in WORD_SEPARATORS): pattern = pattern + "(?=" + separators + "|$)"
+
+		self.regex = re.compile(pattern, flags)
+		self.single_line = (not is_regex and "\n" not in search_text)		# matches can never span lines
+		self.search_text = search_text
+		self.is_regex = is_regex
+		self.literal = (search_text if(not is_regex and not whole_words) else None)
+		self.match_case = match_case
+
+	# checks if every match of a longer search must lie on a line where this search matched,
+	# i.e. if the results of this search can be refined instead of searching everything again
+	def can_refine_to(self, pattern):
+		if(self.literal == None or pattern.literal == None or self.match_case != pattern.match_case): return False
+		if(self.match_case):
+			return pattern.literal.startswith(self.literal)
+		else:
+			return pattern.literal.lower().startswith(self.literal.lower())
+
+	# yields tuple(start, end) for every non-empty match in a line, starting at pos
+	def finditer(self, line, pos = 0):
+		for match_obj in self.regex.finditer(line, pos):
+			start, end = match_obj.span()
+			if(start < end): yield (start, end)
+
+	# returns tuple(start, end) of the first match in a line at or after pos, or None
+	def search(self, line, pos = 0):
+		for span in self.finditer(line, pos):
+			return span
+		return None
+
+	# returns tuple(start, end) of the last match in a line starting before end (or anywhere if end is None), or None
+	def search_backward(self, line, end = None):
+		found = None
+		for span in self.finditer(line):
+			if(end != None and span[0] >= end): break
+			found = span
+		return found
+
+	# finds all matches in a list of lines and returns them as SearchResults
+	def find_all(self, lines):
+		results = SearchResults(lines)
+		if(not self.single_line):
+			# a regular expression could match across lines in the joined text: search each line on its own
+			for line_index, line in enumerate(lines):
+				for start, end in self.finditer(line):
+					results.add(line_index, start, end - start)
+			return results
+
+		# scan large batches of lines in one go, so that lines without a match cost nothing
+		line_iter = iter(lines)
+		first_line = 0
+		while(True):
+			batch = list(itertools.islice(line_iter, SEARCH_BATCH_LINES))
+			if(len(batch) == 0): break
+			text = "\n".join(batch)
+			needle = self.literal
+			if(needle != None and not self.match_case):
+				# lowercasing the text is only safe if it keeps every position
+				lower_text = text.lower()
+				if(len(lower_text) == len(text)):
+					text = lower_text
+					needle = needle.lower()
+				else:
+					needle = None
+
+			if(needle != None):
+				self.find_literal(text, needle, first_line, results)
+			else:
+				self.find_pattern(text, first_line, results)
+			first_line += len(batch)
+		return results
+
+	# finds all matches in the given lines only (a sorted list of line indices) and returns them as SearchResults
+	def find_in_lines(self, lines, line_indices):
+		results = SearchResults(lines)
+		needle = self.literal
+		if(needle != None and not self.match_case): needle = needle.lower()
+		n = (0 if needle == None else len(needle))
+		for line_index in line_indices:
+			line = lines[line_index]
+			if(needle != None and not self.match_case):
+				lower_line = line.lower()
+				line = (lower_line if len(lower_line) == len(line) else None)
+			if(needle == None or line == None):
+				for start, end in self.finditer(lines[line_index]):
+					results.add(line_index, start, end - start)
+			else:
+				pos = line.find(needle)
+				while(pos > -1):
+					results.add(line_index, pos, n)
+					pos = line.find(needle, pos + n)
+		return results
+
+	# <------------------- private functions ---------------------->
+
+	# finds a plain string in a text (whose first line is first_line) with str.find(): once a match is found, the rest of its line is searched
+	# and the search then jumps to the next matching line, counting the newlines skipped over
+	def find_literal(self, text, needle, first_line, results):
+		n = len(needle)
+		line_indices = list()
+		positions = list()
+		line_index = first_line
+		line_start = 0
+		pos = text.find(needle)
+		while(pos > -1):
+			line_index += text.count("\n", line_start, pos)
+			line_start = text.rfind("\n", 0, pos) + 1
+			line_end = text.find("\n", pos)
+			if(line_end == -1): line_end = len(text)
+			while(pos > -1):
+				line_indices.append(line_index)
+				positions.append(pos - line_start)
+				pos = text.find(needle, pos + n, line_end)
+			pos = text.find(needle, line_end)
+		results.extend(line_indices, positions, [ n ] * len(positions))
+
+	# finds the matches of the regular expression in a text, counting newlines between matches to find their lines
+	def find_pattern(self, text, first_line, results):
+		line_index = first_line
+		line_start = 0
+		line_end = text.find("\n")
+		for start, end in self.finditer(text):
+			if(start > line_end > -1):
+				line_index += text.count("\n", line_start, start)
+				line_start = text.rfind("\n", 0, start) + 1
+				line_end = text.find("\n", start)
+			results.add(line_index, start - line_start, end - start)
+
+# SearchJob class: runs a search over a number of targets on a background thread, stopping after max_results matches;
+# each target is a tuple(key, lines, line_indices) where line_indices lists the only lines to be searched, or is None;
+# lines can also be a function reading them from disk (returning None if it cannot), which is called on a pool of
+# reader threads a few files ahead of the search. Matches are queued as tuple(key, SearchResults) per target,
+# to be picked up by the UI as they come in
+class SearchJob:
+	def __init__(self, pattern, targets, max_results):
+		self.pattern = pattern
+		self.targets = targets
+		self.max_results = max_results
+		self.results = queue.Queue()
+		self.count = 0
+		self.truncated = False
+		self.cancelled = False
+		self.completed = False			# set once the search has ended, even if it failed
+		self.error = None				# the exception which ended the search, if any
+		self.reading = collections.deque()		# the targets being read ahead, see read_targets()
+		self.thread = threading.Thread(target=self.run, name="ash-search", daemon=True)
+		self.thread.start()
+
+	# stops the search before the next target
+	def cancel(self):
+		self.cancelled = True
+
+	# returns the results found since the last call as a list of tuple(key, SearchResults)
+	def get_results(self):
+		results = list()
+		while(True):
+			try:
+				results.append(self.results.get_nowait())
+			except queue.Empty:
+				return results
+
+	# checks if this job found every match of its search, so that its results can be refined by a longer search
+	def is_complete(self):
+		return (self.completed and not self.truncated and not self.cancelled and self.error == None)
+
+	# <------------------- private functions ---------------------->
+
+	# body of the search thread
+	def run(self):
+		executor = concurrent.futures.ThreadPoolExecutor(SEARCH_READERS, thread_name_prefix="ash-search")
+		try:
+			self.search_targets(executor)
+		except Exception as e:
+			log_error(f"project search failed: {e}")
+			self.error = e
+		finally:
+			for key, lines, line_indices in self.reading:
+				if(isinstance(lines, concurrent.futures.Future)): lines.cancel()
+			executor.shutdown(wait=False)
+			self.completed = True
+
+	def search_targets(self, executor):
+		for key, lines, line_indices in self.read_targets(executor):
+			if(self.cancelled): return
+			if(lines == None): continue
+			if(line_indices == None or len(line_indices) * 2 > len(lines)):
+				# scanning all the lines at once is faster than going through most of them one by one
+				results = self.pattern.find_all(lines)
+			else:
+				results = self.pattern.find_in_lines(lines, line_indices)
+			if(len(results) == 0): continue
+
+			if(self.count + len(results) >= self.max_results):
+				self.truncated = (self.count + len(results) > self.max_results or self.targets[-1][0] != key)
+				results.truncate(self.max_results - self.count)
+				self.count = self.max_results
+				self.results.put( (key, results) )
+				break
+			self.count += len(results)
+			self.results.put( (key, results) )
+
+	# yields the targets with their lines read, keeping up to SEARCH_READ_AHEAD files being read in the background
+	def read_targets(self, executor):
+		pending = self.reading
+		for key, lines, line_indices in self.targets:
+			if(self.cancelled): return
+			if(callable(lines)): lines = executor.submit(lines)
+			pending.append( (key, lines, line_indices) )
+			if(len(pending) >= SEARCH_READ_AHEAD): yield self.get_read_target(pending.popleft())
+		while(len(pending) > 0):
+			yield self.get_read_target(pending.popleft())
+
+	# waits for the lines of a target to be read
+	def get_read_target(self, target):
+		key, lines, line_indices = target
+		if(isinstance(lines, concurrent.futures.Future)): lines = lines.result()
+		return (key, lines, line_indices)
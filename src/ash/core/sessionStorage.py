@@ -37,15 +37,14 @@ class ProjectTabData:
 		return x+y
 
 class ProjectBufferData:
-	def __init__(self, filename, backup_edit_count, undo_edit_count, history, lwt):
+	def __init__(self, filename, undo_edit_count, history, lwt):
 		self.filename = filename
-		self.backup_edit_count = backup_edit_count
 		self.undo_edit_count = undo_edit_count
 		self.history = history
 		self.last_write_time = lwt
 
 	def __str__(self):
-		return f"[ProjectBufferData] filename: {self.filename} bec: {self.backup_edit_count} uec: {self.undo_edit_count}"
+		return f"[ProjectBufferData] filename: {self.filename} uec: {self.undo_edit_count}"
 
 class ProjectData:
 	def __init__(self, active_tab_index, tab_data, buffer_data):
@@ -132,8 +131,14 @@ class SessionStorage:
 		if(not os.path.isfile(ash.SESSION_FILE)): return None
 
 		sfp = open(ash.SESSION_FILE, "rb")
-		session_data = pickle.load(sfp)
-		sfp.close()
+		try:
+			session_data = pickle.load(sfp)
+		except Exception as e:
+			# session saved by an incompatible version
+			log_error("unable to load session: " + str(e))
+			return None
+		finally:
+			sfp.close()
 
 		if(session_data.version != ash.__version__): return None
 		return session_data
\ No newline at end of file
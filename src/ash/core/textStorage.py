@@ -0,0 +1,349 @@
+# SPDX-License-Identifier: GPL-2.0-only
+#
+# /src/ash/core/textStorage.py
+#
+# Copyright (C) 2022-2022  Akash Nag
+
+# This module implements the line-storage engines used by buffers
+
+from ash.core import *
+from ash.core.ashException import *
+from ash.core.chunkedList import *
+from ash.core.logger import *
+
+import bisect
+import collections
+import threading
+from array import array
+
+MAPPED_BLOCK_SIZE		= 64 * 1024		# bytes of a file (at least) covered by each entry of a MappedStorage's line index
+MAPPED_CACHED_BLOCKS	= 32			# decoded blocks kept in memory by a MappedStorage
+MAPPED_READ_SIZE		= 4 * 1024 * 1024	# bytes read at a time while indexing a file for a MappedStorage
+
+# TextStorage class: the list-like interface through which a buffer stores its lines;
+# every edit is funnelled through replace_lines() so that an engine only needs to implement
+# get_line(), splice(), __len__() and to_list(), and so that listeners are notified of every edit
+class TextStorage:
+	def __init__(self):
+		self.listeners = list()
+
+	# returns the number of lines: to be overridden by child
+	def __len__(self):
+		return 0
+
+	# returns the line at the given (non-negative) index: to be overridden by child
+	def get_line(self, index):
+		raise(IndexError("text storage index out of range"))
+
+	# replaces the lines in [start, end) with new_lines without notifying listeners: to be overridden by child
+	def splice(self, start, end, new_lines):
+		pass
+
+	# returns all the lines as a plain list: to be overridden by child
+	def to_list(self):
+		return list()
+
+	# releases the resources held by the storage: to be overridden by child if required
+	def close(self):
+		pass
+
+	# converts a (possibly negative) index into a valid non-negative index
+	def normalize_index(self, index):
+		n = len(self)
+		if(index < 0): index += n
+		if(index < 0 or index >= n): raise(IndexError("text storage index out of range"))
+		return index
+
+	def __getitem__(self, index):
+		if(isinstance(index, slice)):
+			start, stop, step = index.indices(len(self))
+			if(step == 1): return self.get_lines(start, stop)
+			return [ self.get_line(i) for i in range(start, stop, step) ]
+		return self.get_line(self.normalize_index(index))
+
+	def __setitem__(self, index, line):
+		index = self.normalize_index(index)
+		self.replace_lines(index, index + 1, [line])
+
+	def __delitem__(self, index):
+		index = self.normalize_index(index)
+		self.replace_lines(index, index + 1, [])
+
+	def __iter__(self):
+		for i in range(len(self)):
+			yield self.get_line(i)
+
+	def __copy__(self):
+		return self.__class__(self.to_list())
+
+	def __eq__(self, other):
+		if(isinstance(other, TextStorage)): other = other.to_list()
+		return self.to_list() == other
+
+	# registers a function f(start, old_lines, new_lines) to be called after every edit
+	def add_listener(self, listener):
+		if(listener not in self.listeners): self.listeners.append(listener)
+
+	# unregisters a listener
+	def remove_listener(self, listener):
+		if(listener in self.listeners): self.listeners.remove(listener)
+
+	# replaces the lines in [start, end) with new_lines
+	def replace_lines(self, start, end, new_lines):
+		new_lines = list(new_lines)
+		if(len(self.listeners) == 0):
+			self.splice(start, end, new_lines)
+		else:
+			old_lines = self.get_lines(start, end)
+			self.splice(start, end, new_lines)
+			for listener in self.listeners:
+				listener(start, old_lines, new_lines)
+
+	# returns the lines in [start, end) as a list
+	def get_lines(self, start, end):
+		return [ self.get_line(i) for i in range(start, end) ]
+
+	# inserts a line before the given index (same semantics as list.insert())
+	def insert(self, index, line):
+		n = len(self)
+		if(index < 0): index = max([0, index + n])
+		index = min([index, n])
+		self.replace_lines(index, index, [line])
+
+	def append(self, line):
+		n = len(self)
+		self.replace_lines(n, n, [line])
+
+	def extend(self, lines):
+		n = len(self)
+		self.replace_lines(n, n, lines)
+
+	# removes and returns a line
+	def pop(self, index = -1):
+		index = self.normalize_index(index)
+		line = self.get_line(index)
+		self.replace_lines(index, index + 1, [])
+		return line
+
+	# returns an independent copy of this storage
+	def copy(self):
+		return self.__copy__()
+
+	# replaces all the lines
+	def set_lines(self, new_lines):
+		self.replace_lines(0, len(self), new_lines)
+
+	# inserts text into line y at column x
+	def insert_text(self, y, x, text):
+		line = self.get_line(y)
+		self.replace_lines(y, y + 1, [ line[0:x] + text + line[x:] ])
+
+	# deletes count characters from line y starting at column x
+	def delete_text(self, y, x, count = 1):
+		line = self.get_line(y)
+		self.replace_lines(y, y + 1, [ line[0:x] + line[x+count:] ])
+
+	# splits line y at column x, the new line is prefixed with indent
+	def split_line(self, y, x, indent = ""):
+		line = self.get_line(y)
+		self.replace_lines(y, y + 1, [ line[0:x], indent + line[x:] ])
+
+	# joins line y with the line following it
+	def join_lines(self, y):
+		self.replace_lines(y, y + 2, [ self.get_line(y) + self.get_line(y + 1) ])
+
+# ListStorage class: stores lines in a plain python list (O(n) line inserts/deletes)
+class ListStorage(TextStorage):
+	def __init__(self, lines = None):
+		super().__init__()
+		self.lines = (list() if lines == None else list(lines))
+
+	def __len__(self):
+		return len(self.lines)
+
+	def __iter__(self):
+		return iter(self.lines)
+
+	def get_line(self, index):
+		return self.lines[index]
+
+	def get_lines(self, start, end):
+		return self.lines[start:end]
+
+	def splice(self, start, end, new_lines):
+		self.lines[start:end] = new_lines
+
+	def to_list(self):
+		return list(self.lines)
+
+# RopeStorage class: stores lines in a chunked rope (O(log n) line inserts/deletes/lookups)
+class RopeStorage(TextStorage):
+	def __init__(self, lines = None):
+		super().__init__()
+		self.rope = ChunkedList(lines)
+
+	def __len__(self):
+		return len(self.rope)
+
+	def __iter__(self):
+		return iter(self.rope)
+
+	def get_line(self, index):
+		return self.rope[index]
+
+	def get_lines(self, start, end):
+		return self.rope.get_range(start, end)
+
+	def splice(self, start, end, new_lines):
+		self.rope.replace(start, end, new_lines)
+
+	def to_list(self):
+		return self.rope.to_list()
+
+# MappedStorage class: read-only storage which keeps a file open and reads and decodes only the lines asked for.
+# A sparse index of the file is built on a background thread: the file is cut into blocks of whole lines,
+# and the byte offset and first line of every block are recorded; until the index is complete, only the
+# lines indexed so far are visible. The encoding must keep the newline a single "\n" byte (e.g. UTF-8).
+# Blocks are read with os.pread() rather than through a memory-map, so that a file truncated on disk while
+# it is being viewed (e.g. a rotated log) yields short reads instead of killing the process with SIGBUS
+class MappedStorage(TextStorage):
+	def __init__(self, filename, encoding, background = True):
+		super().__init__()
+		self.filename = filename
+		self.encoding = encoding
+		self.fd = os.open(filename, os.O_RDONLY)
+		self.size = os.fstat(self.fd).st_size
+		self.block_offsets = array("q", [ 0 ])		# byte offset at which each block starts (and the last one ends)
+		self.block_lines = array("q", [ 0 ])		# index of the first line of each block (and the number of lines before the last one)
+		self.blocks = collections.OrderedDict()		# block index -> decoded lines, least recently used first
+		self.indexed = False
+		self.closed = False
+
+		# the file is indexed from a separate handle: the first lines are indexed right away, so that there is
+		# something to show, and the rest on a background thread unless background is False
+		self.index_file = open(filename, "rb")
+		self.data = b""					# the data read but not yet indexed
+		self.data_offset = 0			# file offset of data[0]
+		while(len(self.block_offsets) == 1 and self.index_next_chunk()): pass
+		if(self.indexed):
+			self.index_file.close()
+		elif(background):
+			threading.Thread(target=self.build_index, name="ash-mapper", daemon=True).start()
+		else:
+			self.build_index()
+
+	# checks if a file in the given encoding can be viewed through a MappedStorage
+	@staticmethod
+	def supports_encoding(encoding):
+		try:
+			return ("\n".encode(encoding) == b"\n")
+		except LookupError:
+			return False
+
+	def __len__(self):
+		# the last line (following the last newline) is known only once the whole file has been indexed
+		return self.block_lines[-1] + (1 if self.indexed else 0)
+
+	def __iter__(self):
+		n = len(self)
+		for block_index in range(len(self.block_offsets) - 1):
+			for line in self.read_block(block_index)[0]:
+				if(n == 0): return
+				yield line
+				n -= 1
+
+	def get_line(self, index):
+		block_index = min([ bisect.bisect_right(self.block_lines, index), len(self.block_offsets) - 1 ]) - 1
+		return self.get_block(block_index)[index - self.block_lines[block_index]]
+
+	def splice(self, start, end, new_lines):
+		raise(AshException("Error: attempting to edit a read-only file: " + self.filename))
+
+	def to_list(self):
+		return list(self)
+
+	# stops indexing and closes the file
+	def close(self):
+		self.closed = True
+		self.blocks = collections.OrderedDict()
+		if(self.fd == None): return
+		os.close(self.fd)
+		self.fd = None
+
+	# <------------------- private functions ---------------------->
+
+	# body of the indexing thread
+	def build_index(self):
+		while(not self.closed and self.index_next_chunk()): pass
+		self.index_file.close()
+
+	# reads the next chunk of the file and indexes the blocks ending in it; returns False once the whole file is indexed.
+	# Every block ends just after a newline (except the last one, at the end of the file); the file is read in chunks
+	# of MAPPED_READ_SIZE bytes through its own handle, so that the lines themselves are read only when they are needed
+	def index_next_chunk(self):
+		chunk = self.index_file.read(min([ MAPPED_READ_SIZE, self.size - self.data_offset - len(self.data) ]))
+		data = self.data + chunk
+		pos = 0
+		while(True):
+			end = data.find(b"\n", pos + MAPPED_BLOCK_SIZE - 1)
+			if(end == -1): break
+			self.add_block(self.data_offset + end + 1, data.count(b"\n", pos, end + 1))
+			pos = end + 1
+
+		if(len(chunk) == 0):
+			if(pos < len(data)): self.add_block(self.data_offset + len(data), data.count(b"\n", pos))
+			self.data = b""
+			self.indexed = True
+			return False
+
+		self.data = data[pos:]
+		self.data_offset += pos
+		return True
+
+	# records a block which ends at the given file offset and contains count newlines; its lines become
+	# visible (see __len__()) only once its end is known, as the lines may be read on another thread
+	def add_block(self, end, count):
+		self.block_offsets.append(end)
+		self.block_lines.append(self.block_lines[-1] + count)
+
+	# returns the decoded lines of a block, keeping the most recently used blocks in memory
+	def get_block(self, block_index):
+		lines = self.blocks.get(block_index)
+		if(lines == None):
+			lines, complete = self.read_block(block_index)
+			if(not complete): return lines			# not kept, so that it is read again if the file grows back
+			self.blocks[block_index] = lines
+			if(len(self.blocks) > MAPPED_CACHED_BLOCKS): self.blocks.popitem(last=False)
+		else:
+			self.blocks.move_to_end(block_index)
+		return lines
+
+	# reads and decodes the lines of a block, returns tuple(lines, complete); the piece following its last newline is the
+	# last line of the file if the block ends the file. If the file has been truncated (or closed) since it was indexed,
+	# the lines which could not be read are returned empty and complete is False: the file watcher then reports the change
+	def read_block(self, block_index):
+		start = self.block_offsets[block_index]
+		end = self.block_offsets[block_index + 1]
+		count = self.block_lines[block_index + 1] - self.block_lines[block_index] + (0 if end < self.size else 1)
+		try:
+			data = (b"" if self.fd == None else os.pread(self.fd, end - start, start))
+		except OSError as e:
+			log_error(f"unable to read {self.filename}: {e}")
+			data = b""
+		lines = data.decode(self.encoding, errors="replace").split("\n")
+		complete = (len(data) == end - start)
+		if(complete):
+			if(end < self.size): lines.pop()
+		else:
+			lines = lines[0:count] + [""] * max([ 0, count - len(lines) ])
+		return (lines, complete)
+
+TEXT_STORAGE_ENGINES = {
+	"list": ListStorage,
+	"rope": RopeStorage
+}
+
+# creates a storage object using the given engine (defaults to the rope if the engine is unknown)
+def create_text_storage(lines = None, engine = "rope"):
+	storage_class = TEXT_STORAGE_ENGINES.get(engine, RopeStorage)
+	return storage_class(lines)
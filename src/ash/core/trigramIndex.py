@@ -0,0 +1,259 @@
+# SPDX-License-Identifier: GPL-2.0-only
+#
+# /src/ash/core/trigramIndex.py
+#
+# Copyright (C) 2022-2022  Akash Nag
+
+# This module implements the trigram index used to narrow down the files to be read by a project search
+
+from ash.core import *
+from ash.core.logger import *
+from ash.core.fileWatcher import *
+
+import pickle
+import queue
+import threading
+import time
+from array import array
+
+try:
+	import re._parser as sre_parse
+except ImportError:
+	import sre_parse
+
+TRIGRAM_INDEX_VERSION	= 1
+POSTING_SIZE			= 4				# bytes per file-ID in a posting list
+TRIGRAM_OVERHEAD		= 150			# approximate bytes taken by a trigram and its (empty) posting list
+BUILD_PAUSE				= 0.002			# seconds the index builder sleeps between files, to keep the UI responsive
+
+# returns the set of trigrams (as tuples of 3 characters) in a list of lines, ignoring case
+# duplicate lines are indexed once, the trigrams across the joins are never searched for
+def get_trigrams(lines):
+	text = "\n".join(set(lines)).lower()
+	return set(zip(text, text[1:], text[2:]))
+
+# returns the literal strings which every match of a search must contain, or None if there are none;
+# for a regular expression these are the runs of plain characters at its top level (which are all mandatory)
+def get_required_strings(pattern):
+	if(not pattern.is_regex): return [ pattern.search_text ]
+	try:
+		parsed = sre_parse.parse(pattern.search_text)
+	except Exception:
+		return None
+	strings = list()
+	run = ""
+	for op, arg in parsed:
+		if(op == sre_parse.LITERAL):
+			run += chr(arg)
+		else:
+			strings.append(run)
+			run = ""
+	strings.append(run)
+	strings = [ s for s in strings if len(s) >= 3 ]
+	return (strings if len(strings) > 0 else None)
+
+# TrigramIndex class: maps every trigram to the list of files which contain it, so that a search needs to read only
+# the files containing all the trigrams of the search text. A file which changes gets a new ID: the postings of its
+# old ID are left in place and skipped, and are dropped when the index is compacted. Files which are not indexed
+# (because they have changed or the memory limit has been reached) must always be searched.
+# All methods are thread-safe: files are indexed on a background thread, see start_building().
+class TrigramIndex:
+	def __init__(self, root_dir, index_file = None, memory_limit = None):
+		self.root_dir = root_dir
+		self.index_file = index_file
+		self.memory_limit = memory_limit		# in bytes, or None
+		self.files = dict()				# file -> tuple(ID, size, mtime, number of trigrams)
+		self.names = dict()				# ID -> file
+		self.postings = dict()			# trigram -> array of IDs
+		self.posting_count = 0			# total length of the posting lists
+		self.stale_count = 0			# postings of removed files, still in the posting lists
+		self.next_id = 0
+		self.lock = threading.Lock()
+		self.modified = False
+		self.building = False
+		self.pending = queue.Queue()	# files to be indexed by the builder thread
+		self.read_file = None
+
+	# loads a saved index, an empty index is returned if it does not exist or cannot be used
+	@staticmethod
+	def load(root_dir, index_file, memory_limit = None):
+		trigram_index = TrigramIndex(root_dir, index_file, memory_limit)
+		if(not os.path.isfile(index_file)): return trigram_index
+
+		try:
+			with open(index_file, "rb") as ifp:
+				data = pickle.load(ifp)
+			if(data.get("version") == TRIGRAM_INDEX_VERSION and data.get("root_dir") == root_dir):
+				trigram_index.files = data["files"]
+				trigram_index.postings = data["postings"]
+				trigram_index.next_id = data["next_id"]
+				trigram_index.names = { entry[0]: filename for filename, entry in trigram_index.files.items() }
+				trigram_index.posting_count = sum(map(len, trigram_index.postings.values()))
+				trigram_index.stale_count = trigram_index.posting_count - sum(entry[3] for entry in trigram_index.files.values())
+		except Exception as e:
+			log_error("unable to load trigram index: " + str(e))
+		return trigram_index
+
+	# writes the index to its file (after dropping stale postings), if anything has changed since it was loaded
+	def save(self):
+		if(self.index_file == None or not self.modified): return
+		with self.lock:
+			if(self.stale_count > 0): self.compact()
+			data = {
+				"version": TRIGRAM_INDEX_VERSION,
+				"root_dir": self.root_dir,
+				"files": self.files,
+				"postings": self.postings,
+				"next_id": self.next_id
+			}
+			try:
+				temp_file = self.index_file + ".tmp"
+				with open(temp_file, "wb") as ifp:
+					pickle.dump(data, ifp, pickle.HIGHEST_PROTOCOL)
+				os.replace(temp_file, self.index_file)
+				self.modified = False
+			except Exception as e:
+				log_error("unable to save trigram index: " + str(e))
+
+	# indexes the files which are not indexed yet on a background thread, which then goes on to re-index files
+	# as they change; read_file(filename) must return tuple(lines, os.stat_result taken before reading), or None
+	def start_building(self, files, read_file):
+		self.read_file = read_file
+		self.building = True
+		for filename in files: self.pending.put(filename)
+		threading.Thread(target=self.build, name="ash-indexer", daemon=True).start()
+
+	def stop_building(self):
+		self.building = False
+
+	# indexes the lines of a file, as read when its size and mtime were st (an os.stat_result)
+	# returns False if the file could not be added because the memory limit has been reached
+	def add_file(self, filename, lines, st):
+		trigrams = get_trigrams(lines)
+		with self.lock:
+			self.remove_file(filename)
+			if(self.memory_limit != None and self.get_memory_usage() + len(trigrams) * POSTING_SIZE > self.memory_limit):
+				if(self.stale_count > 0): self.compact()
+				if(self.get_memory_usage() + len(trigrams) * POSTING_SIZE > self.memory_limit): return False
+
+			fid = self.next_id
+			self.next_id += 1
+			self.files[filename] = (fid, st.st_size, st.st_mtime, len(trigrams))
+			self.names[fid] = filename
+			for trigram in trigrams:
+				posting = self.postings.get(trigram)
+				if(posting == None):
+					self.postings[trigram] = array("i", (fid,))
+				else:
+					posting.append(fid)
+			self.posting_count += len(trigrams)
+			self.modified = True
+			return True
+
+	# called by the FileWatcher (on its thread) when a file has changed: the file (or all files under a directory)
+	# is forgotten unless it still has the size and mtime it was indexed with, as happens when a buffer is saved
+	def on_file_event(self, event_type, path):
+		with self.lock:
+			if(event_type == FILES_UNKNOWN):
+				for filename in list(self.files): self.remove_file(filename)
+			elif(path in self.files):
+				fid, size, mtime, count = self.files[path]
+				try:
+					st = os.stat(path)
+					if(st.st_size != size or st.st_mtime != mtime):
+						self.remove_file(path)
+						if(self.building): self.pending.put(path)
+				except OSError:
+					self.remove_file(path)
+			elif(event_type != FILE_MODIFIED):
+				prefix = path + "/"
+				for filename in [ f for f in self.files if f.startswith(prefix) ]: self.remove_file(filename)
+
+	# forgets a file which has just been written (e.g. by saving its buffer), and queues it to be indexed afresh
+	# by the builder thread; the file is searched in full until then
+	def reindex_file(self, filename):
+		with self.lock:
+			self.remove_file(filename)
+		if(self.building): self.pending.put(filename)
+
+	# forgets all files whose size or mtime differ from the ones given by a FileIndex
+	def revalidate(self, file_index):
+		with self.lock:
+			for filename, (fid, size, mtime, count) in list(self.files.items()):
+				entry = file_index.files.get(filename)
+				if(entry == None or entry[0] != size or entry[1] != mtime): self.remove_file(filename)
+
+	# checks if a file is indexed
+	def is_indexed(self, filename):
+		return (filename in self.files)
+
+	# returns the set of indexed files which may contain a match for a SearchPattern,
+	# or None if the index cannot narrow down the search (all files must then be searched)
+	def get_candidates(self, pattern):
+		strings = get_required_strings(pattern)
+		if(strings == None): return None
+
+		trigrams = set()
+		for s in strings: trigrams.update(get_trigrams([s]))
+		if(len(trigrams) == 0): return None
+
+		with self.lock:
+			postings = list()
+			for trigram in trigrams:
+				posting = self.postings.get(trigram)
+				if(posting == None): return set()
+				postings.append(posting)
+
+			postings.sort(key=len)
+			fids = set(postings[0])
+			for posting in postings[1:]:
+				if(len(fids) == 0): break
+				fids.intersection_update(posting)
+			return { self.names[fid] for fid in fids if fid in self.names }
+
+	# checks if no more files can be indexed, even after dropping stale postings
+	def is_full(self):
+		return (self.memory_limit != None and self.stale_count == 0 and self.get_memory_usage() >= self.memory_limit)
+
+	# returns the approximate memory taken by the postings, in bytes
+	def get_memory_usage(self):
+		return self.posting_count * POSTING_SIZE + len(self.postings) * TRIGRAM_OVERHEAD
+
+	def __len__(self):
+		return len(self.files)
+
+	# <------------------- private functions ---------------------->
+
+	# body of the index builder thread, files are skipped once the memory limit has been reached
+	def build(self):
+		while(self.building):
+			try:
+				filename = self.pending.get(timeout=1)
+			except queue.Empty:
+				continue
+			if(self.is_indexed(filename) or self.is_full()): continue
+			result = self.read_file(filename)
+			if(result != None): self.add_file(filename, *result)
+			time.sleep(BUILD_PAUSE)
+
+	# removes a file from the index; its postings are dropped by compact(), the lock must be held
+	def remove_file(self, filename):
+		entry = self.files.pop(filename, None)
+		if(entry == None): return
+		del self.names[entry[0]]
+		self.stale_count += entry[3]
+		self.modified = True
+
+	# drops the postings of files which have been removed, the lock must be held
+	def compact(self):
+		live = self.names.keys()
+		postings = dict()
+		count = 0
+		for trigram, posting in self.postings.items():
+			posting = array("i", filter(live.__contains__, posting))
+			if(len(posting) > 0):
+				postings[trigram] = posting
+				count += len(posting)
+		self.postings = postings
+		self.posting_count = count
+		self.stale_count = 0
@@ -8,21 +8,48 @@
 
 from ash.formatting import *
 from ash.formatting.colors import *
+from ash.core.chunkedList import *
 
+import inspect
+import queue
+import threading
 import pygments
 import pygments.lexers
-from pygments.token import Token
+from pygments.lexer import RegexLexer, ExtendedRegexLexer
+from pygments.token import Token, Error, Whitespace, _TokenType
+from collections import deque
+
+# the initial state of the lexer at the beginning of a document
+ROOT_LEXER_STATE		= ("root",)
+
+# the maximum number of lines lexed ahead of a requested line to compute the lexer state at its beginning;
+# beyond this distance, lexing starts afresh (in the root state) this many lines before the requested line
+MAX_LEX_LOOKBEHIND		= 1000
+
+# the number of lines after the requested lines which are made available to the lexer (for tokens spanning multiple lines)
+LEX_LOOKAHEAD			= 100
+
+# the number of up-to-date lines before an edit which are lexed again (an edit can change how a token spanning
+# multiple lines is matched, even if the token begins a few lines before the edit)
+LEX_RESYNC_LINES		= 8
+
+# if more than this many lines need to be lexed to reach a requested line, they are lexed in the background
+# (if a worker is available), along with this many lines after the requested line
+BACKGROUND_LEX_THRESHOLD	= 200
+BACKGROUND_LEX_AHEAD		= 200
 
 # <------------------- style mapping ---------------------->
 style_map = dict()
 
 style_map[Token.Keyword] = "global-keyword"
 style_map[Token.Comment.Single] = "global-comment"
+style_map[Token.Comment.Multiline] = "global-comment"
 style_map[Token.Punctuation] = "global-punctuation"
 style_map[Token.Text] = "global-default"
 style_map[Token.Error] = "global-error"
 style_map[Token.Literal.String.Single] = "global-string"
 style_map[Token.Literal.String.Double] = "global-string"
+style_map[Token.Literal.String.Doc] = "global-string"
 style_map[Token.Name] = "global-variable"
 style_map[Token.Name.Function] = "global-function"
 style_map[Token.Literal.Number.Integer] = "global-integer"
@@ -40,19 +67,91 @@ style_map[Token.Name.Tag] = "global-keyword"
 style_map[Token.Name.Attribute] = "global-function"
 # <----------------------------------------------------------------->
 
-# SyntaxHighlighter class: stylizes text according to its language
+# SyntaxHighlighter class: stylizes text according to its language;
+# for lexers which are state-machines (pygments.lexer.RegexLexer), lines are lexed in the context of the lines
+# before them, so that multi-line tokens (strings, comments) are highlighted correctly. The styles of each line
+# are cached along with the lexer state at its beginning (or None if a token spans across its beginning): an edit
+# only invalidates the lines it touches, lexing resumes from the nearest line before it whose state is known, and
+# stops as soon as the state converges with that of the (unchanged) lines which had been lexed before the edit.
+# If a worker is given, large parts of the document are lexed by it in the background: until the results
+# are applied (see apply_results()), the lines are shown with their old styles, if any.
 class SyntaxHighlighter:
-	def __init__(self, filename):
+	def __init__(self, filename, worker = None):
+		self.worker = worker
+		self.generation = 0				# incremented whenever the cache is invalidated: results of older jobs are discarded
+		self.results = deque()			# tuple(job, entries) for each job completed by the worker
+		self.job_pending = False
 		self.reset_file(filename)
 
 	# sets filename and initializes lexer
 	def reset_file(self, filename):
+		self.filename = filename
 		try:
 			self.lexer = pygments.lexers.get_lexer_for_filename(filename)
 			if(filename.lower().endswith(".txt")): self.lexer = None			
 		except:
 			self.lexer = None
 
+		self.stateful = False
+		self.custom_tokenizer = False
+		if(isinstance(self.lexer, RegexLexer) and not isinstance(self.lexer, ExtendedRegexLexer)):
+			tokenizer = type(self.lexer).get_tokens_unprocessed
+			if(tokenizer is RegexLexer.get_tokens_unprocessed):
+				self.stateful = True
+			elif("stack" in inspect.signature(tokenizer).parameters):
+				# the lexer post-processes the tokens: they are obtained from the lexer itself
+				self.stateful = True
+				self.custom_tokenizer = True
+
+		self.reset_cache()
+
+	# discards all the cached styles
+	def reset_cache(self):
+		self.generation += 1
+		self.cache = None				# ChunkedList of tuple(line, start_state, styles) or None for each line
+		self.anchor = 0					# the entries in [anchor, valid_upto) are up to date, assuming that the
+		self.valid_upto = 0				# lexer is in the root state at the beginning of the anchor line
+		self.region_start = 0			# the entries in [region_start, region_end) were lexed together before the last edit:
+		self.region_end = 0				# they are up to date if lexing reaches region_start in the same state
+
+	# updates the cache after the lines [start, start+removed) have been replaced by 'inserted' new lines
+	def notify_lines_changed(self, start, removed, inserted):
+		if(self.cache == None): return
+		if(len(self.cache) < start + removed):
+			self.reset_cache()
+			return
+		self.cache.replace(start, start + removed, [ None ] * inserted)
+		if(not self.stateful): return
+		self.generation += 1
+
+		delta = inserted - removed
+		end = start + removed
+		if(end <= self.region_start):
+			self.region_start += delta
+			self.region_end += delta
+		elif(start < self.region_end):
+			if(start >= self.region_start):
+				self.region_end = start
+			else:
+				self.region_start = self.region_end = 0
+
+		# lines inserted at the anchor come before it: they must be lexed, so the anchor is not moved past them
+		if(end < self.anchor or (end == self.anchor and removed > 0)):
+			self.anchor += delta
+			self.valid_upto += delta
+		elif(start < self.anchor):
+			self.anchor = self.valid_upto = start
+		elif(start < self.valid_upto):
+			# the up-to-date lines after the edit remain consistent with each other
+			if(end <= self.valid_upto): 
+				self.region_start = start + inserted
+				self.region_end = self.valid_upto + delta
+			self.valid_upto = start
+
+		# a few lines before the edit are lexed again
+		if(start < self.valid_upto + LEX_RESYNC_LINES):
+			self.valid_upto = max([self.anchor, min([self.valid_upto, start - LEX_RESYNC_LINES])])
+
 	# return a list of tuples (index, text, style)
 	# style = gc(SOME_COLOR_PAIR)
 	def format_code(self, line):
@@ -68,10 +167,264 @@ class SyntaxHighlighter:
 
 		return styles
 
+	# returns the styles of lines[line_index] (in the same format as format_code()) from the cache,
+	# lexing the lines before it if required
+	def get_line_styles(self, lines, line_index):
+		if(self.lexer == None): return self.format_code(lines[line_index])
+		if(self.cache == None or len(self.cache) != len(lines)):
+			self.reset_cache()
+			self.cache = ChunkedList([ None ] * len(lines))
+
+		line = lines[line_index]
+		entry = self.cache[line_index]
+		if(entry != None and entry[0] != line):
+			# the cache is out of sync with the document
+			self.reset_cache()
+			self.cache = ChunkedList([ None ] * len(lines))
+			entry = None
+
+		if(not self.stateful):
+			if(entry == None):
+				entry = (line, None, self.format_code(line))
+				self.cache[line_index] = entry
+			return entry[2]
+
+		if(line_index >= self.anchor and line_index < self.valid_upto): return entry[2]
+		if(line_index < self.anchor or line_index - self.valid_upto > MAX_LEX_LOOKBEHIND):
+			self.move_anchor(max([0, line_index - MAX_LEX_LOOKBEHIND]))
+		if(self.worker != None and line_index - self.valid_upto >= BACKGROUND_LEX_THRESHOLD):
+			self.request_lexing(lines, line_index + 1 + BACKGROUND_LEX_AHEAD)
+			return (None if entry == None else entry[2])
+		self.lex_upto(lines, line_index + 1)
+		return self.cache[line_index][2]
+
+	# starts lexing afresh at the given line (in the root state) to reach a line far away from the up-to-date
+	# lines: the up-to-date lines are retained as a region which lexing may converge with later
+	def move_anchor(self, anchor):
+		if(self.valid_upto > self.anchor):
+			self.region_start = self.anchor
+			self.region_end = self.valid_upto
+		self.anchor = self.valid_upto = anchor
+		self.generation += 1
+
+	# returns tuple(start, state): the line from which lexing is resumed to bring the cache up to date, and the
+	# state of the lexer at its beginning; the line just before the first invalid line is always lexed again
+	# as its tokens may extend into the invalid line
+	def get_resume_point(self):
+		cache = self.cache
+		start = max([self.anchor, self.valid_upto - 1])
+		while(start > self.anchor and cache[start][1] == None and self.valid_upto - start < MAX_LEX_LOOKBEHIND):
+			start -= 1
+		state = (ROOT_LEXER_STATE if start == self.anchor or cache[start][1] == None else cache[start][1])
+		return (start, state)
+
+	# brings the entries of all the lines in [anchor, end) up to date
+	def lex_upto(self, lines, end):
+		while(self.valid_upto < end):
+			start, state = self.get_resume_point()
+			self.lex_block(lines, start, end, state)
+
+	# asks the worker to bring the entries of all the lines in [anchor, end) up to date
+	def request_lexing(self, lines, end):
+		if(self.job_pending): return
+		start, state = self.get_resume_point()
+		block = lines[start:min([len(lines), end + LEX_LOOKAHEAD])]
+		self.job_pending = True
+		self.worker.submit(self, (self.generation, start, end, block, state))
+
+	# stores the results of the jobs completed by the worker in the cache (called from the event-loop);
+	# returns True if the lines need to be repainted
+	def apply_results(self):
+		applied = False
+		while(len(self.results) > 0):
+			job, entries = self.results.popleft()
+			self.job_pending = False
+			applied = True
+			generation, start, end, block, state = job
+			if(entries == None or generation != self.generation or self.cache == None): continue
+			self.store_lines(start, end, block, entries)
+		return applied
+
+	# lexes the lines beginning at start (in the given state) and stores their styles in the cache
+	def lex_block(self, lines, start, end, state):
+		block = lines[start:min([len(lines), end + LEX_LOOKAHEAD])]
+		self.store_lines(start, end, block, self.lex_lines(block, state))
+
+	# stores the entries (see lex_lines()) of the lines of the block beginning at start in the cache, and advances
+	# valid_upto: this stops at the first line at or after end whose state is known, or if the state converges
+	# with that of the region lexed before the last edit
+	def store_lines(self, start, end, block, entries):
+		cache = self.cache
+		k = 0
+		for (line_state, styles) in entries:
+			y = start + k
+			if(k > 0 and line_state != None):
+				if(y >= self.region_start and y < self.region_end and cache[y] != None and cache[y][1] == line_state):
+					# converged: the rest of the region is up to date
+					self.valid_upto = self.region_end
+					self.region_start = self.region_end = 0
+					return
+				if(y >= end): break
+			cache[y] = (block[k], line_state, styles)
+			k += 1
+
+		self.valid_upto = max([self.valid_upto, start + k])
+		if(self.region_end <= self.valid_upto):
+			self.region_start = self.region_end = 0
+		elif(self.region_start < self.valid_upto):
+			self.region_start = self.valid_upto
+
+	# lexes the block of lines beginning in the given state, and yields a tuple(start_state, styles) for each line,
+	# where start_state is the state at its beginning (or None if a token spans across it)
+	def lex_lines(self, block, state):
+		text = "\n".join(block) + "\n"
+
+		# offsets of the beginning of each line in the text (and of the end of the text)
+		offsets = list()
+		pos = 0
+		for line in block:
+			offsets.append(pos)
+			pos += len(line) + 1
+		offsets.append(pos)
+
+		k = 0							# index of the current line in the block
+		line_state = state				# state at the beginning of the current line (None if unknown)
+		styles = list()
+		
+		for (index, token_type, value) in self.tokenize(text, state):
+			# move on to the line containing the index: the lines in between begin inside a token
+			while(k < len(block) and index > offsets[k+1]):
+				yield (line_state, styles)
+				k += 1
+				line_state = None
+				styles = list()
+			if(k >= len(block)): return
+
+			if(token_type == None):
+				# a state marker: if it is at the beginning of the next line, that line begins in a known state
+				if(index < offsets[k+1]): continue
+				yield (line_state, styles)
+				k += 1
+				line_state = value
+				styles = list()
+				if(k >= len(block)): return
+				continue
+
+			# split the token across lines
+			while(len(value) > 0 and k < len(block)):
+				if(index >= offsets[k+1]):
+					yield (line_state, styles)
+					k += 1
+					line_state = None
+					styles = list()
+					continue
+				n = offsets[k+1] - 1 - index				# characters of the token before the end of the line
+				if(n > 0): styles.append( (index - offsets[k], self.get_style(token_type), value[0:n]) )
+				consumed = offsets[k+1] - index
+				index += consumed
+				value = value[consumed:]
+			if(k >= len(block)): return
+
+	# runs the state-machine of a RegexLexer over the text starting from the given state, and yields the tokens as
+	# tuple(index, token_type, value) (same as RegexLexer.get_tokens_unprocessed()), interspersed with state markers
+	# tuple(index, None, state) giving the state of the lexer at that index
+	def tokenize(self, text, state):
+		lexer = self.lexer
+		tokendefs = lexer._tokens
+		statestack = list(state)
+		statetokens = tokendefs[statestack[-1]]
+		pos = 0
+		n = len(text)
+
+		if(self.custom_tokenizer):
+			# the tokens are taken from the lexer and only the state markers from the state-machine
+			tokens = lexer.get_tokens_unprocessed(text, stack=state)
+			pending = next(tokens, None)
+
+		while(pos < n):
+			for rexmatch, action, new_state in statetokens:
+				m = rexmatch(text, pos)
+				if(not m): continue
+				if(self.custom_tokenizer):
+					while(pending != None and pending[0] < m.end()):
+						yield pending
+						pending = next(tokens, None)
+				elif(action != None):
+					if(type(action) is _TokenType):
+						yield (pos, action, m.group())
+					else:
+						yield from action(lexer, m)
+				pos = m.end()
+				if(new_state != None):
+					if(isinstance(new_state, tuple)):
+						for st in new_state:
+							if(st == "#pop"):
+								if(len(statestack) > 1): statestack.pop()
+							elif(st == "#push"):
+								statestack.append(statestack[-1])
+							else:
+								statestack.append(st)
+					elif(isinstance(new_state, int)):
+						if(abs(new_state) >= len(statestack)):
+							del statestack[1:]
+						else:
+							del statestack[new_state:]
+					elif(new_state == "#push"):
+						statestack.append(statestack[-1])
+					statetokens = tokendefs[statestack[-1]]
+				break
+			else:
+				# no rule matched: at the end of a line, the lexer is reset to the root state
+				if(self.custom_tokenizer):
+					while(pending != None and pending[0] <= pos):
+						yield pending
+						pending = next(tokens, None)
+				elif(text[pos] == "\n"):
+					yield (pos, Whitespace, "\n")
+				else:
+					yield (pos, Error, text[pos])
+				if(text[pos] == "\n"):
+					statestack = list(ROOT_LEXER_STATE)
+					statetokens = tokendefs["root"]
+				pos += 1
+			yield (pos, None, tuple(statestack))
+
+		if(self.custom_tokenizer):
+			while(pending != None):
+				yield pending
+				pending = next(tokens, None)
+
 	# returns the assigned style for a particular token-type
 	def get_style(self, token_type):
 		style = style_map.get(token_type)
 		if(style == None):
 			return gc("global-default")
 		else:
-			return gc(style)
\ No newline at end of file
+			return gc(style)
+
+# HighlightWorker class: a background thread which lexes blocks of lines on behalf of the syntax-highlighters
+# of all buffers, so that lexing large parts of a document does not hold up the event-loop
+class HighlightWorker:
+	def __init__(self):
+		self.jobs = queue.Queue()
+		self.thread = None
+
+	# queues a job: tuple(generation, start, end, block, state), see SyntaxHighlighter.request_lexing()
+	def submit(self, highlighter, job):
+		if(self.thread == None):
+			self.thread = threading.Thread(target=self.run, daemon=True)
+			self.thread.start()
+		self.jobs.put( (highlighter, job) )
+
+	# processes the jobs one by one, the results are published to the highlighter which submitted the job
+	def run(self):
+		while(True):
+			highlighter, job = self.jobs.get()
+			generation, start, end, block, state = job
+			entries = None
+			if(generation == highlighter.generation):
+				try:
+					entries = list(highlighter.lex_lines(block, state))
+				except Exception:
+					entries = None
+			highlighter.results.append( (job, entries) )
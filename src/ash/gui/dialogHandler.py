@@ -10,6 +10,7 @@ from ash import *
 from ash.gui import *
 
 from ash.core.bufferManager import *
+from ash.core.fileIndex import *
 from ash.gui.modalDialog import *
 from ash.gui.findReplaceDialog import *
 from ash.gui.projectFindReplaceDialog import *
@@ -155,6 +156,8 @@ class DialogHandler:
 	# <----------------------------------- Close Editor/App --------------------------------->
 
 	def invoke_forced_quit(self):
+		self.app.buffers.wait_for_writes()
+		self.app.buffers.discard_unsaved_changes()
 		self.app.session_storage.destroy()
 		self.app.main_window.hide()
 
@@ -163,6 +166,7 @@ class DialogHandler:
 		aed = mw.get_active_editor()
 		am = self.app.app_mode
 
+		self.app.buffers.wait_for_writes()		# saves still running in the background count as saved
 		unsaved_count = self.app.buffers.get_true_unsaved_count()
 		editor_count = mw.get_editor_count()
 		
@@ -180,11 +184,19 @@ class DialogHandler:
 			
 			response = self.app.ask_question(
 				"SAVE/DISCARD ALL", 
-				"One or more unsaved files exist, choose:\nYes: save all filed-changes and quit (unguaranteed in case of errors)\nNo: discard all unsaved changes and quit\nCancel: don't quit", 
+				"One or more unsaved files exist, choose:\nYes: save all filed-changes and quit\nNo: discard all unsaved changes and quit\nCancel: don't quit", 
 				True
 			)
 			if(response == None): return
-			if(response): self.app.buffers.write_all_wherever_possible()
+			if(response):
+				self.app.buffers.write_all_wherever_possible()
+				self.app.buffers.wait_for_writes()
+				failed = self.app.buffers.get_failed_saves()
+				if(len(failed) > 0):
+					# do not quit: the unsaved edits would only be left in the journals
+					self.app.show_error(f"{len(failed)} file(s) could not be saved:\n" + "\n".join(get_file_title(f) for f in failed[0:5]))
+					mw.repaint()
+					return
 			
 			self.invoke_forced_quit()
 			
@@ -512,7 +524,7 @@ class DialogHandler:
 		except:
 			self.app.warn_insufficient_screen_space()
 			return
-		self.app.dlgProjectExplorer = ModalDialog(self.app.main_window, y, x, 20, 80, "PROJECT EXPLORER", self.project_explorer_key_handler)
+		self.app.dlgProjectExplorer = ModalDialog(self.app.main_window, y, x, 20, 80, "PROJECT EXPLORER", self.project_explorer_key_handler, self.project_explorer_idle_handler)
 		
 		lblSearch = Label(self.app.dlgProjectExplorer, 3, 2, "Search:")
 		txtSearchFile = TextField(self.app.dlgProjectExplorer, 3, 3 + len(str(lblSearch)), 75 - len(str(lblSearch)), callback=self.project_explorer_search_text_changed)
@@ -523,6 +535,14 @@ class DialogHandler:
 		self.app.dlgProjectExplorer.add_widget("lstFiles", lstFiles)		
 		self.app.dlgProjectExplorer.show()
 
+	# refreshes the tree when files are created or deleted in the project while the explorer is open
+	def project_explorer_idle_handler(self):
+		self.app.buffers.process_file_events()
+		lstFiles = self.app.dlgProjectExplorer.get_widget("lstFiles")
+		if(lstFiles.file_tree_version == self.app.buffers.file_tree_version): return
+		lstFiles.refresh(True)
+		self.app.dlgProjectExplorer.repaint()
+
 	def project_explorer_search_text_changed(self, ch):
 		lstFiles = self.app.dlgProjectExplorer.get_widget("lstFiles")
 		search_text = str(self.app.dlgProjectExplorer.get_widget("txtSearchFile"))
@@ -701,12 +721,11 @@ class DialogHandler:
 		filename = os.path.dirname(filename)
 		if(os.path.isdir(filename)):
 			lstFiles.clear()
-			all_files = sorted(glob.glob(filename + "/*", recursive=False))
-			for f in all_files:
-				if(os.path.isfile(f) and not should_ignore_file(f)):
-					lstFiles.add_item(get_file_title(f), tag=str(f))
-				elif(os.path.isdir(f) and not should_ignore_directory(f)):
+			for f, is_dir in list_directory(filename):
+				if(is_dir):
 					lstFiles.add_item(f"[{get_file_title(f)}]", tag=str(f), highlight=True)
+				else:
+					lstFiles.add_item(get_file_title(f), tag=str(f))
 			lstFiles.repaint()
 
 	def file_open_key_handler(self, ch):
@@ -916,12 +935,11 @@ class DialogHandler:
 		filename = os.path.dirname(filename)
 		if(os.path.isdir(filename)):
 			lstFiles.clear()
-			all_files = sorted(glob.glob(filename + "/*", recursive=False))
-			for f in all_files:
-				if(os.path.isfile(f) and not should_ignore_file(f)):
-					lstFiles.add_item(get_file_title(f), tag=str(f))
-				elif(os.path.isdir(f) and not should_ignore_directory(f)):
+			for f, is_dir in list_directory(filename):
+				if(is_dir):
 					lstFiles.add_item(f"[{get_file_title(f)}]", tag=str(f), highlight=True)
+				else:
+					lstFiles.add_item(get_file_title(f), tag=str(f))
 			lstFiles.repaint()
 
 	def file_save_as_key_handler(self, ch):
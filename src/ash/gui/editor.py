@@ -16,6 +16,12 @@ from ash.core.editHistory import *
 import pyximport; pyximport.install(language_level=3)
 from ash.core.screen import *
 
+# commands which modify the buffer (or write it out), not available in read-only buffers
+EDITING_COMMANDS = [
+	"DELETE_CHARACTER_LEFT", "DELETE_CHARACTER_RIGHT", "INSERT_TAB", "DECREASE_INDENT", "NEWLINE", "CUT", "PASTE",
+	"SAVE", "SAVE_AS", "SAVE_AND_CLOSE_EDITOR", "INSERT_SNIPPET", "SHOW_FIND_AND_REPLACE", "UNDO", "REDO", "DECODE_UNICODE"
+]
+
 # This is the text editor class
 class Editor(Widget):
 	def __init__(self, parent, area):
@@ -49,6 +55,7 @@ class Editor(Widget):
 		self.find_whole_words = False
 		self.find_regex = False
 		self.find_mode = False
+		self.buffer = None
 		
 		# set default tab size
 		self.reset_preferences()
@@ -59,7 +66,6 @@ class Editor(Widget):
 		# use dummy values
 		self.selection_mode = False
 		self.bid = -1
-		self.buffer = None
 		
 		self.resize(area.y, area.x, area.height, area.width, True)
 		
@@ -92,6 +98,7 @@ class Editor(Widget):
 		self.bid = bid
 		self.buffer = buffer
 		self.buffer.attach_editor(self)
+		self.update_word_wrap()
 		if(self.screen != None): 
 			self.screen.update(self.parent, self.buffer)
 			self.screen.update_git_diff(self.buffer.git_diff_lines)
@@ -102,7 +109,7 @@ class Editor(Widget):
 
 	def reset_preferences(self):
 		self.tab_size = self.app.settings_manager.get_setting("tab_width")
-		self.word_wrap = self.app.settings_manager.get_setting("wrap_text")
+		self.update_word_wrap()
 		self.hard_wrap = self.app.settings_manager.get_setting("hard_wrap")
 		self.should_stylize = self.app.settings_manager.get_setting("syntax_highlighting")
 		self.auto_close = self.app.settings_manager.get_setting("auto_close_matching_pairs")
@@ -151,7 +158,9 @@ class Editor(Widget):
 
 		edit_made = False
 
-		if(KeyBindings.is_key(ch, "RIGHT_CLICK")):
+		if(self.is_read_only() and (self.is_editing_command(ch) or (not KeyBindings.is_mouse(ch) and str(chr(ch)) in self.charset))):
+			beep()
+		elif(KeyBindings.is_key(ch, "RIGHT_CLICK")):
 			edit_made = self.on_right_click()
 		elif(KeyBindings.is_key(ch, "DELETE_CHARACTER_LEFT")):
 			edit_made = self.key_handler.handle_backspace_key(ch)
@@ -185,6 +194,20 @@ class Editor(Widget):
 		if(edit_made): self.buffer.update(self.curpos, self)
 		self.recompute(edit_made)
 			
+	# checks if the buffer being edited is read-only
+	def is_read_only(self):
+		return (self.buffer != None and self.buffer.read_only)
+
+	# checks if a key is bound to a command which modifies the buffer
+	def is_editing_command(self, ch):
+		for command in EDITING_COMMANDS:
+			if(KeyBindings.is_key(ch, command)): return True
+		return False
+
+	# text is not wrapped in read-only buffers, since wrapping has to lay out the whole file
+	def update_word_wrap(self):
+		self.word_wrap = (self.app.settings_manager.get_setting("wrap_text") and not self.is_read_only())
+
 	# <---------------------------- Calls Screen.recompute ---------------------
 
 	def recompute(self, forced=True):
@@ -192,6 +215,10 @@ class Editor(Widget):
 
 	# <------------------- Functions called from BufferManager --------------------->
 
+	# called after the lines [start, start+removed) of the buffer have been replaced by 'inserted' lines
+	def notify_lines_changed(self, start, removed, inserted):
+		if(self.screen != None): self.screen.mark_dirty(start, removed, inserted)
+
 	def notify_update(self):
 		if(self.curpos.y >= len(self.buffer.lines) or self.curpos.x > len(self.buffer.lines[self.curpos.y])):
 			self.curpos.x = 0
@@ -205,6 +232,7 @@ class Editor(Widget):
 	def notify_merge(self, new_bid, new_buffer):
 		self.bid = new_bid
 		self.buffer = new_buffer
+		if(self.screen != None): self.screen.update(self.parent, self.buffer)
 		self.selection_mode = False
 		if(self.curpos.y >= len(self.buffer.lines) or self.curpos.x > len(self.buffer.lines[self.curpos.y])):
 			self.curpos.x = 0
@@ -398,16 +426,17 @@ class Editor(Widget):
 		else:
 			y, x = visual_curpos.y + self.y + 1, visual_curpos.x + self.x + 1
 		
+		read_only = self.is_read_only()
 		popup_menu_items = [
-			(lang_mgr.translate("Undo"), True, self.key_handler.handle_undo),
-			(lang_mgr.translate("Redo"), True, self.key_handler.handle_redo),
+			(lang_mgr.translate("Undo"), not read_only, self.key_handler.handle_undo),
+			(lang_mgr.translate("Redo"), not read_only, self.key_handler.handle_redo),
 			("---", False, None),
-			(lang_mgr.translate("Cut"), self.selection_mode, self.key_handler.handle_cut),
+			(lang_mgr.translate("Cut"), self.selection_mode and not read_only, self.key_handler.handle_cut),
 			(lang_mgr.translate("Copy"), self.selection_mode, self.key_handler.handle_copy),
-			(lang_mgr.translate("Paste"), True, self.key_handler.handle_paste),
+			(lang_mgr.translate("Paste"), not read_only, self.key_handler.handle_paste),
 			("---", False, None),
 			(lang_mgr.translate("Find..."), True, app_dh.invoke_find),
-			(lang_mgr.translate("Find & Replace..."), True, app_dh.invoke_find_and_replace),
+			(lang_mgr.translate("Find & Replace..."), not read_only, app_dh.invoke_find_and_replace),
 			("---", False, None),
 			(lang_mgr.translate("Preferences..."), True, app_dh.invoke_set_preferences)
 		]
@@ -163,21 +163,12 @@ class EditorKeyHandler:
 		
 		if(col == clen):
 			self.cancel_multiple_cursors()
-			ntext = self.ed.buffer.lines[self.ed.curpos.y + 1]
-			self.ed.buffer.lines.pop(self.ed.curpos.y + 1)
-			self.ed.buffer.lines[self.ed.curpos.y] += ntext
+			self.ed.buffer.lines.join_lines(self.ed.curpos.y)
 		else:
-			left = text[0:col] if col > 0 else ""
-			right = text[col+1:] if col < clen-1 else ""
-			self.ed.buffer.lines[self.ed.curpos.y] = left + right
+			self.ed.buffer.lines.delete_text(self.ed.curpos.y, col, 1)
 
 			for sc in self.ed.slave_cursors:
-				text = self.ed.buffer.lines[sc.y]
-				clen = len(text)
-				col = sc.x
-				left = text[0:col] if col > 0 else ""
-				right = text[col+1:] if col < clen-1 else ""
-				self.ed.buffer.lines[sc.y] = left + right
+				if(sc.x < len(self.ed.buffer.lines[sc.y])): self.ed.buffer.lines.delete_text(sc.y, sc.x, 1)
 				
 		return True
 	
@@ -189,7 +180,6 @@ class EditorKeyHandler:
 			self.ed.utility.delete_selected_text()						
 			return True		
 
-		text = self.ed.buffer.lines[self.ed.curpos.y]
 		col = self.ed.curpos.x
 
 		if(col == 0 and self.ed.curpos.y == 0):
@@ -198,23 +188,16 @@ class EditorKeyHandler:
 
 		if(col == 0):
 			self.cancel_multiple_cursors()
-			self.ed.buffer.lines.pop(self.ed.curpos.y)
 			temp = len(self.ed.buffer.lines[self.ed.curpos.y-1])
-			self.ed.buffer.lines[self.ed.curpos.y - 1] += text
+			self.ed.buffer.lines.join_lines(self.ed.curpos.y - 1)
 			self.ed.curpos.x = temp
 			self.ed.curpos.y -= 1
 		else:
-			left = text[0:col-1] if col > 1 else ""
-			right = text[col:] if col < len(text) else ""
-			self.ed.buffer.lines[self.ed.curpos.y] = left + right
+			self.ed.buffer.lines.delete_text(self.ed.curpos.y, col-1, 1)
 			self.ed.curpos.x -= 1
 
 			for sc in self.ed.slave_cursors:
-				text = self.ed.buffer.lines[sc.y]
-				col = sc.x
-				left = text[0:col-1] if col > 1 else ""
-				right = text[col:] if col < len(text) else ""
-				self.ed.buffer.lines[sc.y] = left + right
+				if(sc.x > 0): self.ed.buffer.lines.delete_text(sc.y, sc.x-1, 1)
 				sc.x -= 1
 		
 		return True
@@ -254,21 +237,16 @@ class EditorKeyHandler:
 				return self.ed.shift_selection_left()
 
 		col = self.ed.curpos.x
-		text = self.ed.buffer.lines[self.ed.curpos.y]
 
 		if(KeyBindings.is_key(ch, "INSERT_TAB")):
-			left = text[0:col] if col > 0 else ""
-			right = text[col:] if len(text) > 0 else ""
-			self.ed.buffer.lines[self.ed.curpos.y] = left + "\t" + right
+			self.ed.buffer.lines.insert_text(self.ed.curpos.y, col, "\t")
 			self.ed.curpos.x += 1
 		elif(KeyBindings.is_key(ch, "DECREASE_INDENT")):
 			if(col == 0):
 				beep()
 				return False
 			elif(col == len(self.ed.get_leading_whitespaces(self.ed.curpos.y))):
-				left = text[0:col-1] if col > 1 else ""
-				right = text[col:] if col < len(text) else ""
-				self.ed.buffer.lines[self.ed.curpos.y] = left + right
+				self.ed.buffer.lines.delete_text(self.ed.curpos.y, col-1, 1)
 				self.ed.curpos.x -= 1
 			else:
 				beep()
@@ -281,18 +259,8 @@ class EditorKeyHandler:
 		self.cancel_multiple_cursors()
 		if(self.ed.selection_mode): self.ed.utility.delete_selected_text()
 
-		text = self.ed.buffer.lines[self.ed.curpos.y]
-		col = self.ed.curpos.x
-		left = text[0:col] if col > 0 else ""
-		right = text[col:] if len(text) > 0 else ""
 		whitespaces = self.ed.get_leading_whitespaces(self.ed.curpos.y)
-		right = whitespaces + right
-		self.ed.buffer.lines[self.ed.curpos.y] = left
-
-		if(len(self.ed.buffer.lines) == self.ed.curpos.y + 1):
-			self.ed.buffer.lines.append(right)
-		else:
-			self.ed.buffer.lines.insert(self.ed.curpos.y + 1, right)
+		self.ed.buffer.lines.split_line(self.ed.curpos.y, self.ed.curpos.x, whitespaces)
 		
 		self.ed.curpos.y += 1
 		self.ed.curpos.x = len(whitespaces)
@@ -324,21 +292,11 @@ class EditorKeyHandler:
 
 		if(self.ed.selection_mode): del_text = self.ed.utility.delete_selected_text()
 
-		text = self.ed.buffer.lines[self.ed.curpos.y]
-		col = self.ed.curpos.x
-		left = text[0:col] if col > 0 else ""
-		right = text[col:] if len(text) > 0 else ""
-		
-		self.ed.buffer.lines[self.ed.curpos.y] = left + sch + right
+		self.ed.buffer.lines.insert_text(self.ed.curpos.y, self.ed.curpos.x, sch)
 		self.ed.curpos.x += 1
 
 		for sc in self.ed.slave_cursors:
-			text = self.ed.buffer.lines[sc.y]
-			col = sc.x
-			left = text[0:col] if col > 0 else ""
-			right = text[col:] if len(text) > 0 else ""
-
-			self.ed.buffer.lines[sc.y] = left + sch + right
+			self.ed.buffer.lines.insert_text(sc.y, sc.x, sch)
 			sc.x += 1
 
 		return True
@@ -440,7 +398,7 @@ class EditorKeyHandler:
 	def handle_save(self):
 		if(not self.ed.buffer.save_status):
 			if(self.ed.buffer.filename != None):
-				self.ed.buffer.write_to_disk()
+				self.ed.buffer.save_in_background()
 			else:
 				self.ed.parent.win.app.dialog_handler.invoke_file_save_as(self.ed.buffer)
 
@@ -505,15 +463,11 @@ class EditorKeyHandler:
 			self.ed.buffer.lines[row] = left + data[0] + right
 			self.ed.curpos.x += len(data[0])
 		elif(n == 2):
-			self.ed.buffer.lines[row] = left + data[0]
-			self.ed.buffer.lines.insert(row+1, data[1] + right)
+			self.ed.buffer.lines.replace_lines(row, row+1, [ left + data[0], data[1] + right ])
 			self.ed.curpos.y += 1
 			self.ed.curpos.x = len(data[1])
 		elif(n > 2):
-			self.ed.buffer.lines[row] = left + data[0]
-			self.ed.buffer.lines.insert(row+1, data[n-1] + right)
-			for i in range(n-2, 0, -1):
-				self.ed.buffer.lines.insert(row+1, data[i])
+			self.ed.buffer.lines.replace_lines(row, row+1, [ left + data[0] ] + data[1:n-1] + [ data[n-1] + right ])
 
 		self.ed.recompute()
 		return True
@@ -8,6 +8,7 @@
 
 from ash.gui import *
 from ash.gui.cursorPosition import *
+from ash.core.searchEngine import *
 
 class EditorUtility:
 	def __init__(self, ed):
@@ -20,37 +21,21 @@ class EditorUtility:
 		del_text = ""
 
 		if(start.y == end.y):
-			sel_len = end.x - start.x
 			del_text = self.ed.buffer.lines[start.y][start.x:end.x]
 			if(len(del_text) > 0): self.ed.buffer.add_change(self.ed.curpos)
-			self.ed.buffer.lines[start.y] = self.ed.buffer.lines[start.y][0:start.x] + self.ed.buffer.lines[start.y][end.x:]
+			self.ed.buffer.lines.delete_text(start.y, start.x, end.x - start.x)
 			self.ed.curpos = copy.copy(start)
 		else:
-			del_text = self.ed.buffer.lines[start.y][start.x:] + "\n"
-			if(len(del_text) > 0): self.ed.buffer.add_change(self.ed.curpos)
+			self.ed.buffer.add_change(self.ed.curpos)
+			del_text = self.get_selected_text()
 			
-			# delete entire lines between selection start and end
-			lc = end.y - start.y - 1
-			while(lc > 0):
-				del_text += self.ed.buffer.lines[start.y+1] + "\n"
-				self.ed.buffer.lines.pop(start.y + 1)
-				self.ed.curpos.y -= 1
-				end.y -= 1
-				lc -= 1
-
-			# delete a portion of the selection start line
-			self.ed.buffer.lines[start.y] = self.ed.buffer.lines[start.y][0:start.x]
-
-			# delete a portion of the selection end line
-			del_text += self.ed.buffer.lines[end.y][0:end.x]
-			self.ed.buffer.lines[end.y] = self.ed.buffer.lines[end.y][end.x:]
-
-			# bring the selection end line up towards the end of the selection start line
-			text = self.ed.buffer.lines[end.y]
-			self.ed.buffer.lines.pop(end.y)
+			# bring the remainder of the selection end line up to the selection start line,
+			# replacing all the lines in between in a single edit
+			first = self.ed.buffer.lines[start.y]
+			last = self.ed.buffer.lines[end.y]
+			self.ed.buffer.lines.replace_lines(start.y, end.y + 1, [ first[0:start.x] + last[end.x:] ])
 			self.ed.curpos.y = start.y
-			self.ed.curpos.x = len(self.ed.buffer.lines[start.y])
-			self.ed.buffer.lines[start.y] += text
+			self.ed.curpos.x = start.x
 
 		self.ed.curpos.x = max([0, self.ed.curpos.x])
 		
@@ -86,8 +71,8 @@ class EditorUtility:
 	# increase indent of selected lines
 	def shift_selection_right(self):
 		start, end = self.ed.screen.get_selection_endpoints(self.ed.sel_start, self.ed.sel_end)
-		for i in range(start.y, end.y+1):
-			self.ed.buffer.lines[i] = "\t" + self.ed.buffer.lines[i]
+		block = self.ed.buffer.lines[start.y:end.y+1]
+		self.ed.buffer.lines.replace_lines(start.y, end.y+1, [ "\t" + line for line in block ])
 		self.ed.curpos.x += 1
 		self.ed.sel_start.x += 1
 		self.ed.sel_end.x += 1
@@ -107,8 +92,8 @@ class EditorUtility:
 
 		# decrease indent only if all lines are indented
 		if(has_tab_in_all):
-			for i in range(start.y, end.y+1):
-				self.ed.buffer.lines[i] = self.ed.buffer.lines[i][1:]
+			block = self.ed.buffer.lines[start.y:end.y+1]
+			self.ed.buffer.lines.replace_lines(start.y, end.y+1, [ line[1:] for line in block ])
 			self.ed.curpos.x -= 1
 			self.ed.sel_start.x -= 1
 			self.ed.sel_end.x -= 1			
@@ -154,95 +139,69 @@ class EditorUtility:
 	def find_next(self, s, match_case, whole_words, regex):
 		if(len(s) == 0): return
 
-		lower_s = s.lower()
 		self.find_all(s, match_case, whole_words, regex)
-		n = len(s)
+		pattern = compile_search(s, match_case, whole_words, regex)
+		if(pattern == None): return
 		
 		for y in range(self.ed.curpos.y, len(self.ed.buffer.lines)):
 			start = 0
 			if(y == self.ed.curpos.y): start = self.ed.curpos.x + 1
-			if(match_case):
-				x = self.ed.buffer.lines[y].find(s, start)
-			else:
-				x = self.ed.buffer.lines[y].lower().find(lower_s, start)
-			if(x > -1):
+			span = pattern.search(self.ed.buffer.lines[y], start)
+			if(span != None):
 				self.ed.curpos.y = y
-				self.ed.curpos.x = x
+				self.ed.curpos.x = span[0]
 				return
 
 		for y in range(0, self.ed.curpos.y + 1):
-			if(match_case):
-				x = self.ed.buffer.lines[y].find(s)
-			else:
-				x = self.ed.buffer.lines[y].lower().find(lower_s)
-			if(x > -1):
+			span = pattern.search(self.ed.buffer.lines[y])
+			if(span != None):
 				self.ed.curpos.y = y
-				self.ed.curpos.x = x
+				self.ed.curpos.x = span[0]
 				return
 
 	# moves cursor to previous match
 	def find_previous(self, s, match_case, whole_words, regex):
 		if(len(s) == 0): return
 		
-		lower_s = s.lower()
 		self.find_all(s, match_case, whole_words, regex)
-		n = len(s)
+		pattern = compile_search(s, match_case, whole_words, regex)
+		if(pattern == None): return
 		
 		for y in range(self.ed.curpos.y, -1, -1):
 			if(y == self.ed.curpos.y):
-				portion = self.ed.buffer.lines[y][0:self.ed.curpos.x]
-				if(match_case):
-					x = portion.rfind(s)
-				else:
-					x = portion.lower().rfind(lower_s)
+				span = pattern.search_backward(self.ed.buffer.lines[y], self.ed.curpos.x)
 			else:
-				portion = self.ed.buffer.lines[y]
-				if(match_case):
-					x = portion.rfind(s)
-				else:
-					x = portion.lower().rfind(lower_s)
+				span = pattern.search_backward(self.ed.buffer.lines[y])
 
-			if(x > -1):
+			if(span != None):
 				self.ed.curpos.y = y
-				self.ed.curpos.x = x
+				self.ed.curpos.x = span[0]
 				return
 
 		for y in range(len(self.ed.buffer.lines) - 1, self.ed.curpos.y - 1, -1):
-			if(y == self.ed.curpos.y):
-				portion = self.ed.buffer.lines[y][0:self.ed.curpos.x]
-				if(match_case):
-					x = portion.rfind(s)
-				else:
-					x = portion.lower().rfind(lower_s)
-			else:
-				portion = self.ed.buffer.lines[y]
-				if(match_case):
-					x = portion.rfind(s)
-				else:
-					x = portion.lower().rfind(lower_s)
-
-			if(x > -1):
+			span = pattern.search_backward(self.ed.buffer.lines[y])
+			if(span != None):
 				self.ed.curpos.y = y
-				self.ed.curpos.x = x
+				self.ed.curpos.x = span[0]
 				return
 		
 	# replaces the first occurrence (after last find/replace operation)
 	def replace_next(self, sfind, srep, match_case, whole_words, regex):
-		n = len(sfind)
+		pattern = compile_search(sfind, match_case, whole_words, regex)
+		if(pattern == None): return False
+
 		line = self.ed.buffer.lines[self.ed.curpos.y]
-		if(line[self.ed.curpos.x:self.ed.curpos.x+n] == sfind):
-			prev = line[0:self.ed.curpos.x]
-			next = line[self.ed.curpos.x+n:]
-			self.ed.buffer.lines[self.ed.curpos.y] = prev + srep + next
+		span = pattern.search(line, self.ed.curpos.x)
+		if(span != None and span[0] == self.ed.curpos.x):
+			self.ed.buffer.lines[self.ed.curpos.y] = line[0:span[0]] + srep + line[span[1]:]
 			self.ed.buffer.major_update(self.ed.curpos, self.ed)
-			self.find_next(sfind, match_case)
+			self.find_next(sfind, match_case, whole_words, regex)
 			return True
 		
 		return False
 
+	# replaces all occurrences in the buffer as a single undo step
 	def replace_all(self, sfind, srep, match_case, whole_words, regex):
-		self.find_next(sfind, match_case)
-		count = 0
-		while(self.replace_next(sfind, srep, match_case)):
-			count += 1		
-		if(count > 0): self.ed.buffer.major_update(self.ed.curpos, self.ed, True)
\ No newline at end of file
+		pattern = compile_search(sfind, match_case, whole_words, regex)
+		if(pattern == None): return 0
+		return self.ed.buffer.replace_all(pattern.find_all(self.ed.buffer.lines), srep, self.ed.curpos)
\ No newline at end of file
@@ -10,8 +10,6 @@ from ash import *
 from ash.gui import *
 from ash.gui.window import *
 
-LOAD_STEP		= 1024			# bytes to read in each step
-
 class FileLoader(Window):
 	def __init__(self, parent, filename, encoding):
 		y, x = get_center_coords(parent, 7, 50)
@@ -26,42 +24,34 @@ class FileLoader(Window):
 		self.bytes_read = 0
 		self.total_size = 0
 		
-	# show the window and start the event-loop
+	# show the window and read the file, returns its lines or None if cancelled
 	def load(self):
 		curses.curs_set(False)
 		self.win.keypad(True)
 		self.win.timeout(0)		
 		self.repaint()
 
-		activeFile = codecs.open(self.filename, "r", self.encoding)
 		self.total_size = int(os.stat(self.filename).st_size)
 		self.bytes_read = 0
-		lines = list()
-
-		while(True):
-			curses.napms(ash.SLEEP_MS)
-			ch = self.win.getch()			
-			
-			if(ch > -1 and KeyBindings.is_key(ch, "CANCEL_OPERATION")):
-				activeFile.close()
-				return None
-			else:
-				read_data = activeFile.readline()
-				if(len(read_data) == 0): break
-				self.bytes_read += len(read_data)
-				lines.append(read_data[:-1])
-				self.repaint(True)
+		lines = read_text_lines(self.filename, self.encoding, self.on_progress)
 		
-		activeFile.close()
 		self.win.clear()
 		return lines
+
+	# called after every chunk read: shows the progress, returns False if the user has cancelled loading
+	def on_progress(self, bytes_read, total_size):
+		ch = self.win.getch()
+		if(ch > -1 and KeyBindings.is_key(ch, "CANCEL_OPERATION")): return False
+		self.bytes_read = bytes_read
+		self.repaint(True)
+		return True
 		
 	# draw the window
 	def repaint(self, partial=False):
 		if(self.win == None): return
 
 		if(not partial):
-			self.win.clear()
+			self.win.erase()
 			self.win.attron(self.border_theme)
 			self.win.border()
 			self.win.addstr(2, 0, BORDER_SPLIT_RIGHT, self.theme)
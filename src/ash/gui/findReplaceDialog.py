@@ -195,7 +195,7 @@ class FindReplaceDialog(Window):
 	def repaint(self):
 		if(self.win == None): return
 
-		self.win.clear()
+		self.win.erase()
 		self.win.attron(self.theme)
 		self.win.border()
 		self.win.attroff(self.theme)
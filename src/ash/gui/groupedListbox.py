@@ -193,15 +193,22 @@ class GroupedListBox(Widget):
 
 	def display(self, search_results, buffers):
 		# data must be a dictionary indexed by buffer-IDs
-		# each item contains a list of tuples(line_index, col_pos)
-		app = self.parent.parent.app
+		# each item contains SearchResults, i.e. a sequence of tuples(line_index, col_pos, length)
+		self.clear()
+		if(search_results != None): self.add_results(search_results.items(), buffers)
+
+	# removes all items
+	def clear(self):
 		self.items = list()
-		if(search_results == None):
-			self.render()
-			self.repaint()
-			return
+		self.sel_index = -1
+		self.render()
+		self.repaint()
 
-		for bid, data in search_results.items():
+	# appends groups to the list, without rebuilding the existing ones
+	# results must be a list of tuple(buffer-ID, SearchResults)
+	def add_results(self, results, buffers):
+		app = self.parent.parent.app
+		for bid, data in results:
 			buffer = buffers.get_buffer_by_id(bid)
 			name = buffer.get_name()
 			if(app.app_mode == APP_MODE_PROJECT):
@@ -212,12 +219,9 @@ class GroupedListBox(Widget):
 
 			disp_name += " (" + str(len(data)) + " occurrences)"
 			gli = GroupedListItem(disp_name, name)
-			for d in data:
-				line_index = d[0]
-				col_pos = d[1]
-
-				line_length = len(buffer.lines[line_index])
-				context = buffer.lines[line_index][ max(0,col_pos-self.width) : min(line_length, col_pos+self.width) ]
+			for line_index, col_pos, length in data:
+				line = data.lines[line_index]
+				context = line[ max(0,col_pos-self.width) : min(len(line), col_pos+self.width) ]
 				context = context.replace("\t", " ").replace("\n", " ").replace("\r","")
 				disp_child = f"Line {line_index+1}, Col {col_pos+1}: {context}"
 				gli.add_child(disp_child, line_index, col_pos)
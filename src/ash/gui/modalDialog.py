@@ -10,12 +10,13 @@ from ash.gui import *
 from ash.gui.window import *
 
 class ModalDialog(Window):
-	def __init__(self, parent, y, x, height, width, title, handler_func):
+	def __init__(self, parent, y, x, height, width, title, handler_func, idle_handler = None):
 		title = parent.app.localisation_manager.translate(title)
 		super().__init__(y, x, height, width, title)
 		self.parent = parent
 		self.theme = gc("outer-border")
 		self.handler_func = handler_func
+		self.idle_handler = idle_handler
 		self.win = None
 		self.mouse_drag_start = False
 
@@ -31,7 +32,9 @@ class ModalDialog(Window):
 		while(self.win != None):
 			curses.napms(ash.SLEEP_MS)
 			ch = self.win.getch()
-			if(ch == -1): continue
+			if(ch == -1): 
+				if(self.idle_handler != None): self.idle_handler()
+				continue
 			
 			if(self.handler_func != None):
 				ch = self.handler_func(ch)
@@ -128,7 +131,7 @@ class ModalDialog(Window):
 	def repaint(self):
 		if(self.win == None): return
 
-		self.win.clear()
+		self.win.erase()
 		self.win.attron(self.theme)
 		self.win.border()
 		self.win.attroff(self.theme)
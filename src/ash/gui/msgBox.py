@@ -111,7 +111,7 @@ class MessageBox(Window):
 	def repaint(self):
 		if(self.win == None): return
 
-		self.win.clear()
+		self.win.erase()
 		self.win.attron(self.border_theme)
 		self.win.border()
 		self.win.addstr(2, 0, BORDER_SPLIT_RIGHT, self.theme)
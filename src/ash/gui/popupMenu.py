@@ -142,7 +142,7 @@ class PopupMenu:
 
 		style_name = ("dropdown" if self.is_dropdown else "popup")
 
-		self.win.clear()
+		self.win.erase()
 		self.win.attron(gc(style_name + "-border") | (0 if self.supports_colors else curses.A_REVERSE))
 		self.win.border()
 		self.win.attroff(gc(style_name + "-border") | (0 if self.supports_colors else curses.A_REVERSE))
@@ -11,6 +11,11 @@ from ash.gui.window import *
 from ash.gui.groupedListbox import *
 from ash.gui.textfield import *
 from ash.gui.checkbox import *
+from ash.core.searchEngine import *
+
+import time
+
+SEARCH_DELAY		= 0.15			# seconds to wait after the last keypress before searching
 
 class ProjectFindReplaceDialog(Window):
 	def __init__(self, parent, y, x, buffers, replace = False):
@@ -21,6 +26,11 @@ class ProjectFindReplaceDialog(Window):
 		self.win = None
 		self.replace = replace
 		self.mouse_drag_start = False
+		self.search_job = None			# the SearchJob running or last run
+		self.search_results = dict()	# buffer-ID -> SearchResults, from search_job
+		self.search_params = None		# tuple(search_text, match_case, whole_words, is_regex) last searched for
+		self.search_due = None			# time at which the next search should start
+		self.shown_status = None		# the search status last drawn, see get_search_status()
 		
 		self.txtFind = TextField(self, 4, 2, 66)
 		if(self.replace): self.txtReplace = TextField(self, 6, 2, 66)
@@ -51,7 +61,9 @@ class ProjectFindReplaceDialog(Window):
 		while(self.win != None):
 			curses.napms(ash.SLEEP_MS)
 			ch = self.win.getch()
-			if(ch == -1): continue
+			if(ch == -1):
+				self.handle_idle()
+				continue
 			
 			if(self.active_widget_index < 0 or not self.get_active_widget().does_handle_tab()):
 				if(KeyBindings.is_key(ch, "FOCUS_NEXT") or KeyBindings.is_key(ch, "FOCUS_PREVIOUS")):
@@ -87,6 +99,7 @@ class ProjectFindReplaceDialog(Window):
 			if(self.replace): replace_text = str(self.txtReplace)
 
 			if(KeyBindings.is_key(ch, "CLOSE_WINDOW")):
+				self.cancel_search()
 				self.hide()
 				self.parent.repaint()
 				return
@@ -109,6 +122,7 @@ class ProjectFindReplaceDialog(Window):
 								break
 
 						if((not widget_found) and is_enclosed(y, x, (self.y + 1, self.x + self.width - 3, 1, 1) )):
+							self.cancel_search()
 							self.hide()
 							self.parent.repaint()
 							return
@@ -125,10 +139,8 @@ class ProjectFindReplaceDialog(Window):
 					aw =self.get_active_widget()
 					aw.perform_action(ch)
 				
-				if(self.replace and aw != self.txtReplace and aw != self.lstResults):
-					self.handle_find_all(str(self.txtFind))
-				elif(aw != self.lstResults):
-					self.handle_find_all(str(self.txtFind))				
+				if(aw != self.lstResults and (not self.replace or aw != self.txtReplace)):
+					self.schedule_search()
 					
 			self.parent.repaint()
 			self.repaint()
@@ -158,16 +170,77 @@ class ProjectFindReplaceDialog(Window):
 		self.win.mvwin(self.y, self.x)
 		self.parent.repaint()
 
-	def handle_find_all(self, search_text):
-		if(len(search_text.strip()) == 0):
-			search_results = None
+	# returns the search parameters currently entered
+	def get_search_params(self):
+		return (str(self.txtFind), self.chkMatchCase.is_checked(), self.chkWholeWords.is_checked(), self.chkRegex.is_checked())
+
+	# starts a new search once no key has been pressed for SEARCH_DELAY, if the search parameters have changed
+	def schedule_search(self):
+		if(self.get_search_params() == self.search_params and self.search_job != None and not self.search_job.cancelled):
+			self.search_due = None
+			return
+		self.cancel_search()
+		self.search_due = time.time() + SEARCH_DELAY
+
+	# stops the running search, if any
+	def cancel_search(self):
+		if(self.search_job != None): self.search_job.cancel()
+		self.search_due = None
+
+	# called when there are no keypresses: starts a scheduled search, and displays the results which have come in
+	def handle_idle(self):
+		if(self.search_due != None and time.time() >= self.search_due):
+			self.search_due = None
+			self.handle_find_all(*self.get_search_params())
+
+		if(self.search_job != None and not self.search_job.cancelled):
+			results = self.search_job.get_results()
+			if(len(results) > 0):
+				for bid, search_results in results: self.search_results[bid] = search_results
+				self.lstResults.add_results(results, self.parent.app.buffers)
+				self.repaint()
+
+		# the search may have completed (or been cut short) without sending any more results
+		if(self.get_search_status() != self.shown_status): self.repaint()
+
+	# starts searching in the background, files which have not been opened yet are read from disk; if the
+	# previous search found every match of a shorter prefix of the search text, only the lines matched by it
+	# are searched again
+	def handle_find_all(self, search_text, match_case, whole_words, is_regex):
+		old_job = self.search_job
+		old_results = self.search_results
+		self.search_job = None
+		self.search_results = dict()
+		self.search_params = (search_text, match_case, whole_words, is_regex)
+		self.lstResults.clear()
+		self.repaint()
+
+		pattern = (None if len(search_text.strip()) == 0 else compile_search(search_text, match_case, whole_words, is_regex))
+		if(pattern == None): return
+
+		if(old_job != None and old_job.is_complete() and old_job.pattern.can_refine_to(pattern)):
+			for bid, search_results in old_job.get_results(): old_results[bid] = search_results
+			targets = [ (bid, search_results.lines, search_results.get_lines()) for bid, search_results in old_results.items() ]
 		else:
-			search_results = self.buffers.find_all(search_text, self.chkMatchCase.is_checked(), self.chkWholeWords.is_checked(), self.chkRegex.is_checked())
-		self.lstResults.display(search_results, self.parent.app.buffers)
+			targets = self.buffers.get_search_targets(pattern)
+
+		max_results = self.parent.app.settings_manager.get_setting("project_search_max_results")
+		self.search_job = SearchJob(pattern, targets, max_results)
 		
 	def handle_replace_all(self, search_text, replace_text):
-		c, fc = self.buffers.replace_all(search_text, replace_text, self.chkMatchCase.is_checked(), self.chkWholeWords.is_checked(), self.chkRegex.is_checked())
-		self.parent.app.show_error(f"{c} occurrences were replaced in {fc} buffers", False)
+		self.cancel_search()
+		c, modified_buffers = self.buffers.replace_all(search_text, replace_text, self.chkMatchCase.is_checked(), self.chkWholeWords.is_checked(), self.chkRegex.is_checked())
+		# the results of the last search hold the lines as they were before the replacement, and must not be refined
+		self.search_job = None
+		self.search_results = dict()
+		self.search_params = None
+		self.schedule_search()
+
+		msg = f"{c} occurrences were replaced in {len(modified_buffers)} buffers"
+		if(self.parent.app.settings_manager.get_setting("save_after_project_replace")):
+			failed = self.buffers.save_buffers(modified_buffers)
+			if(len(failed) > 0): msg += f"\n{len(failed)} files could not be saved"
+		self.parent.app.show_error(msg, False)
 
 	def handle_fileopen(self, filename, curpos):			# called from groupedlistbox
 		highlight_info = {
@@ -176,15 +249,30 @@ class ProjectFindReplaceDialog(Window):
 			"whole_words": self.chkWholeWords.is_checked(),
 			"is_regex": self.chkRegex.is_checked()
 		}
+		self.cancel_search()
 		self.parent.open_in_new_tab(filename, curpos, highlight_info)
 		self.hide()
 		self.parent.repaint()
 
+	# returns the progress of the search to be shown next to the search box, or None
+	def get_search_status(self):
+		job = self.search_job
+		if(job == None or job.cancelled):
+			return None
+		elif(not job.completed):
+			return "Searching..."
+		elif(job.error != None):
+			return "Search failed"
+		elif(job.truncated):
+			return f"First {job.count} matches"
+		else:
+			return None
+
 	# draw the window
 	def repaint(self):
 		if(self.win == None): return
 
-		self.win.clear()
+		self.win.erase()
 		self.win.attron(self.theme)
 		self.win.border()
 		self.win.attroff(self.theme)
@@ -197,6 +285,9 @@ class ProjectFindReplaceDialog(Window):
 		self.win.addstr(1, self.width-3, CLOSE_BUTTON, curses.A_BOLD | self.theme)
 
 		self.win.addstr(3, 2, "Find:", self.theme)
+		status = self.get_search_status()
+		self.shown_status = status
+		if(status != None): self.win.addstr(3, self.width - len(status) - 2, status, gc("disabled"))
 		if(self.replace): self.win.addstr(5, 2, "Replace with:", self.theme)
 		
 		# active widget must be repainted last, to correctly position cursor
@@ -26,6 +26,7 @@ class TopLevelWindow(Window):
 		self.win = stdscr
 		self.handler_func = handler_func
 		self.app_name = self.app.get_app_name()		
+		self.last_layout = None
 
 		self.window_manager = WindowManager(self.app, self)
 		self.init_menu_bar()
@@ -54,17 +55,20 @@ class TopLevelWindow(Window):
 		file_size = ""
 		unsaved_file_count = ""
 		encoding = ""
+		undo_info = ""
 
 		if(aed != None):
 			lines, sloc = aed.buffer.get_loc()
-			loc_count = str(lines) + " lines (" + str(sloc) + " sloc)"
+			loc_count = str(lines) + " lines" + ("" if sloc == None else " (" + str(sloc) + " sloc)")
 			
 			if(aed.buffer.filename != None):
 				if(os.path.isfile(aed.buffer.filename)): file_size = aed.buffer.get_file_size()
 				
 				language = get_textfile_mimetype(aed.buffer.filename)
 				
-				if(aed.buffer.save_status):
+				if(aed.buffer.read_only):
+					editor_state = "read-only"
+				elif(aed.buffer.save_status):
 					editor_state = "saved"
 				else:
 					editor_state = "modified"
@@ -75,6 +79,9 @@ class TopLevelWindow(Window):
 			cursor_position = str(aed.get_cursor_position()) + aed.get_selection_length_as_string()
 			encoding = aed.buffer.encoding
 			tab_size = str(aed.tab_size)
+
+			undo_count, redo_count, undo_size = aed.buffer.history.get_stats()
+			undo_info = "↶" + str(undo_count) + " ↷" + str(redo_count) + " (" + get_size_as_string(undo_size) + ")  "
 		
 		unsaved_file_count = str(self.app.buffers.get_unsaved_count()) + "*"
 		
@@ -82,6 +89,11 @@ class TopLevelWindow(Window):
 			if(GitRepo.has_repo_in_dir(self.app.project_dir)):
 				editor_state = GitRepo.get_active_branch_name(self.app.project_dir)
 
+		if(aed != None and aed.buffer.is_saving()):
+			editor_state = "saving..."
+		elif(aed != None and aed.buffer.save_error != None):
+			editor_state = "save failed"
+
 		self.status.set(0, editor_state)
 		self.status.set(1, language)
 		self.status.set(2, encoding)
@@ -89,7 +101,7 @@ class TopLevelWindow(Window):
 		self.status.set(4, file_size)		
 		self.status.set(5, unsaved_file_count)
 		self.status.set(6, tab_size)
-		self.status.set(7, cursor_position, "right")
+		self.status.set(7, undo_info + cursor_position, "right")
 				
 		if(aed != None):
 			self.set_title(self.app.get_app_title(aed))
@@ -106,7 +118,13 @@ class TopLevelWindow(Window):
 		while(self.win != None):
 			curses.napms(ash.SLEEP_MS)
 			ch = self.win.getch()
-			if(ch == -1): continue
+			if(ch == -1):
+				# repaint if styles lexed in the background have become available, files were saved, or files changed on disk
+				repaint = self.app.buffers.apply_highlighting_results()
+				if(self.app.buffers.apply_write_results()): repaint = True
+				if(self.app.buffers.process_file_events()): repaint = True
+				if(repaint): self.repaint()
+				continue
 			
 			# send Ctrl/Fn keypresses to main handler first
 			if(self.handler_func != None):
@@ -161,13 +179,22 @@ class TopLevelWindow(Window):
 			
 			self.repaint()
 	
-	# repaint background
-	def repaint_background(self):
+	# repaint background: if full is False, only the title-bar and the status-bar are repainted
+	def repaint_background(self, full = True):
 		self.win.addstr(0, 0, " " * self.width, gc("titlebar"))
-		for i in range(1, self.height-1):
-			self.win.addstr(i, 0, " " * self.width, gc("background"))
+		if(full):
+			for i in range(1, self.height-1):
+				self.win.addstr(i, 0, " " * self.width, gc("background"))
 		self.win.addstr(self.height-1, 0, " " * (self.width - 1), gc("background"))
 
+	# returns the arrangement of the editors on the screen: as long as this does not change between two
+	# repaints, everything in the window other than the title-bar, status-bar and editors stays the same
+	def get_layout(self):
+		editors = tuple( (id(ed), ed.get_bounds(), ed.buffer == None) for ed in self.window_manager.get_editors_in_active_tab() )
+		active_editor = self.get_active_editor()
+		return (self.height, self.width, self.menu_bar_visible, self.window_manager.active_tab_index, self.window_manager.show_filenames, 
+				(None if active_editor == None else id(active_editor)), editors)
+
 	# draws the window
 	def repaint(self, error_msg = None, caller=None):
 		curses.curs_set(False)
@@ -175,8 +202,19 @@ class TopLevelWindow(Window):
 		
 		self.update_status()
 		self.readjust()
-		self.win.clear()
-		self.repaint_background()
+
+		# the window is erased (not cleared) so that curses only sends the cells which have changed to the terminal;
+		# unless the layout has changed, the background under the editors is not repainted, and each editor
+		# only draws the rows which have changed since the last frame
+		layout = self.get_layout()
+		if(layout != self.last_layout):
+			self.last_layout = layout
+			self.win.erase()
+			self.repaint_background()
+			for ed in self.window_manager.get_editors_in_active_tab():
+				if(ed.screen != None): ed.screen.invalidate()
+		else:
+			self.repaint_background(False)
 
 		if(error_msg == None):
 			if(self.status != None): self.status.repaint(self.win, self.width-1, self.height-1, 0)
@@ -205,7 +243,10 @@ class TopLevelWindow(Window):
 		except:
 			raise
 		
-		self.win.refresh()
+		# dialogs/menus drawn over this window since the last frame are only erased if all its lines are copied over
+		self.win.touchwin()
+		self.win.noutrefresh()
+		curses.doupdate()
 
 	# driver function
 	def addstr(self, y, x, text, style):
@@ -229,6 +270,7 @@ class TopLevelWindow(Window):
 		self.window_manager.readjust()
 
 	def invoke_activate_editor(self, buffer_id, buffer, new_tab=False):
+		if(not self.app.buffers.load_buffer(buffer)): return
 		aed = self.get_active_editor()
 		if(new_tab or aed == None):
 			self.add_tab_with_buffer(buffer_id, buffer)
@@ -257,6 +299,7 @@ class TopLevelWindow(Window):
 
 		self.menu_bar = MenuBar(self, self.win, 0, 0, supports_colors=self.app.supports_colors)
 		has_editor = (True if aed != None else False)
+		can_edit = (has_editor and not aed.is_read_only())
 
 		file_menu_items = [
 			("New File...", True, adh.invoke_file_new),
@@ -264,9 +307,9 @@ class TopLevelWindow(Window):
 			("Recent files...", True, adh.invoke_recent_files),
 			("Reload from disk", has_editor, self.reload_active_buffer_from_disk),
 			("---", True, None),
-			("Save", has_editor, self.save_active_editor),
-			("Save As...", has_editor, (adh.invoke_file_save_as, aed_buffer) if has_editor else None),
-			("Save & Close", has_editor, self.save_and_close_active_editor),
+			("Save", can_edit, self.save_active_editor),
+			("Save As...", can_edit, (adh.invoke_file_save_as, aed_buffer) if has_editor else None),
+			("Save & Close", can_edit, self.save_and_close_active_editor),
 			("Save all", True, adh.handle_save_all),
 			("---", True, None),
 			("Close", has_editor, self.close_active_editor),
@@ -275,12 +318,12 @@ class TopLevelWindow(Window):
 		]
 
 		edit_menu_items = [
-			("Undo", has_editor, (aedkh.handle_undo if has_editor else None)),
-			("Redo", has_editor, (aedkh.handle_redo if has_editor else None)),
+			("Undo", can_edit, (aedkh.handle_undo if has_editor else None)),
+			("Redo", can_edit, (aedkh.handle_redo if has_editor else None)),
 			("---", True, None),
-			("Cut", has_editor and aed.selection_mode, (aedkh.handle_cut if has_editor else None)),
+			("Cut", can_edit and aed.selection_mode, (aedkh.handle_cut if has_editor else None)),
 			("Copy", has_editor and aed.selection_mode, (aedkh.handle_copy if has_editor else None)),
-			("Paste", has_editor, (aedkh.handle_paste if has_editor else None)),
+			("Paste", can_edit, (aedkh.handle_paste if has_editor else None)),
 			("---", True, None),
 			("Select all", has_editor, (aedkh.handle_select_all if has_editor else None)),
 			("Select line", has_editor, (aedkh.handle_select_line if has_editor else None)),			
@@ -289,14 +332,14 @@ class TopLevelWindow(Window):
 			("Project Settings", self.app.app_mode == APP_MODE_PROJECT, adh.invoke_project_settings),
 			("Global Settings", True, adh.invoke_global_settings),
 			("---", True, None),
-			("Insert snippet...", has_editor, adh.invoke_insert_snippet)
+			("Insert snippet...", can_edit, adh.invoke_insert_snippet)
 		]
 
 		search_menu_items = [
 			("Go to line...", has_editor, adh.invoke_go_to_line),
 			("---", True, None),
 			("Find...", has_editor, adh.invoke_find),
-			("Find & Replace...", has_editor, adh.invoke_find_and_replace),
+			("Find & Replace...", can_edit, adh.invoke_find_and_replace),
 			("Find in all files...", True, adh.invoke_project_find),
 			("Find & Replace in all files...", True, adh.invoke_project_find_and_replace)
 		]
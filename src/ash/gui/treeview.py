@@ -11,6 +11,7 @@ from ash.gui import *
 from ash.gui.listbox import *
 from ash.core.bufferManager import *
 from ash.core.gitRepo import *
+from ash.core.fileIndex import *
 from ash.utils.utils import *
 
 from send2trash import send2trash
@@ -18,10 +19,11 @@ from send2trash import send2trash
 INDENT_SIZE		= 4
 
 class TreeNode:
-	def __init__(self, parent, path):
+	def __init__(self, parent, path, is_dir = None):
 		self.parent = parent
 		self.path = path
-		self.type = "f" if os.path.isfile(self.path) else "d"
+		if(is_dir == None): is_dir = not os.path.isfile(self.path)
+		self.type = "d" if is_dir else "f"
 		self.expanded = None
 		if(self.type == "d"): self.expanded = True
 		if(self.type == "f"):
@@ -106,48 +108,35 @@ class TreeView(Widget):
 		self.refresh_glob()
 		self.tree_root = self.form_tree()
 		self.form_list_items()
-		if(not maintain_selindex): self.sel_index = 0
+		if(not maintain_selindex or self.sel_index >= len(self.items)): self.sel_index = 0
 		self.start = 0
 		self.end = min([self.row_count, len(self.items)])
 		self.repaint()
 	
 	# finds all files and subdirectories in the tree
 	def refresh_glob(self):
-		self.files = list()
-		self.dirs = list()				
-		all_files = glob.glob(self.project_dir + "/**/*", recursive=True)
-		
-		for f in all_files:
-			if(not os.path.isfile(f)): continue
-			if(not should_ignore_file(f)): self.files.append(f)
-			dir_list = get_relative_subdirectories(self.project_dir, f)
-
-			for d in dir_list:
-				if(d not in self.dirs and not should_ignore_directory(d)):
-					self.dirs.append(d)
-		
-		for d in os.walk(self.project_dir):
-			if(d[0] not in self.dirs and not should_ignore_directory(d[0])):
-				self.dirs.append(d[0])
+		self.file_tree_version = self.buffer_manager.file_tree_version
+		file_index = self.buffer_manager.file_index
+		if(file_index == None or file_index.root_dir != self.project_dir): file_index = FileIndex(self.project_dir)
+		self.file_index = file_index.scan()
 	
 	# form the tree-root and add subnodes recursively
 	def form_tree(self):
-		root_node = TreeNode(None, self.project_dir)
+		root_node = TreeNode(None, self.project_dir, True)
 		self.form_children(root_node)
 		return root_node
 
 	# add subnodes recursively
 	def form_children(self, root_node):
-		sub_dirs = sorted(filter_child_directories(root_node.path, self.dirs))
-		sub_files = sorted(filter_child_directories(root_node.path, self.files))
+		sub_dirs, sub_files = self.file_index.get_children(root_node.path)
 		
 		for d in sub_dirs:
-			sd_node = TreeNode(root_node, d)
+			sd_node = TreeNode(root_node, d, True)
 			root_node.add_child_node(sd_node)
 			self.form_children(sd_node)
 
 		for f in sub_files:
-			sf_node = TreeNode(root_node, f)
+			sf_node = TreeNode(root_node, f, False)
 			root_node.add_child_node(sf_node)
 
 	# form the root display-node and add its children recursively
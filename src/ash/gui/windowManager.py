@@ -114,6 +114,7 @@ class TabNode:
 		ed = Editor(self, self.area)
 		if(bid == None): bid, buffer = self.tab.manager.app.buffers.create_new_buffer()
 		if(bid != None and buffer == None): buffer = self.tab.manager.app.buffers.get_buffer_by_id(bid)
+		if(not self.tab.manager.app.buffers.load_buffer(buffer)): bid, buffer = self.tab.manager.app.buffers.create_new_buffer()
 		ed.set_buffer(bid, buffer)
 		return ed
 
@@ -12,6 +12,8 @@ import time
 import signal
 
 from ash.core.bufferManager import *
+from ash.core.fileIndex import *
+from ash.core.trigramIndex import *
 from ash.core.logger import *
 
 from ash.utils.utils import *
@@ -47,6 +49,7 @@ class AshEditorApp:
 		if(not os.path.exists(APP_PLUGINS_DIR)): os.mkdir(APP_PLUGINS_DIR)
 		if(not os.path.exists(APP_KEYMAPS_DIR)): os.mkdir(APP_KEYMAPS_DIR)
 		if(not os.path.exists(APP_THEMES_DIR)): os.mkdir(APP_THEMES_DIR)
+		if(not os.path.exists(APP_JOURNAL_DIR)): os.mkdir(APP_JOURNAL_DIR)
 
 		log_init()
 			
@@ -61,20 +64,27 @@ class AshEditorApp:
 		# add project path to recent record
 		self.session_storage.add_opened_file_to_record(self.project_dir)
 
-		# find all files
-		all_files = glob.glob(self.project_dir + "/**/*", recursive=True)
-
 		# reset the settings
 		self.recreate_manager_objects()
 
+		# find all files: the index saved by the previous session only needs to be revalidated
+		if(self.buffers.file_index != None): self.buffers.file_index.save()
+		index_file = os.path.join(self.project_dir, PROJECT_SETTINGS_DIR_NAME, PROJECT_FILE_INDEX_NAME)
+		file_index = FileIndex.load(self.project_dir, index_file).scan()
+		self.buffers.file_index = file_index
+		all_files = file_index.get_files()
+
+		# watch all directories of the project for changes
+		for dirname in file_index.dirs: self.buffers.file_watcher.watch_directory(dirname)
+
 		# create buffers for each file
+		text_files = list()
 		for i, f in enumerate(all_files):
-			if(not os.path.isfile(f)): continue
-			if(should_ignore_file(f)): continue
-			if(BufferManager.is_binary(f, self)): continue
+			if(file_index.is_binary(f, self)): continue
+			text_files.append(f)
 			has_backup = BufferManager.backup_exists(f)
 			if(not self.buffers.does_file_have_its_own_buffer(f)):
-				self.buffers.create_new_buffer(filename=f, has_backup=has_backup)
+				self.buffers.create_new_buffer(filename=f, encoding=file_index.get_encoding(f), has_backup=has_backup, lazy=True)		# files are read when first shown or searched
 			if(progress_handler != None): 
 				progress = ( ( i / len(all_files) ) * 100 )
 				progress_handler("Loading...", progress)
@@ -84,7 +94,21 @@ class AshEditorApp:
 			if(self.ask_question("RESTORE SESSION", "Do you want to restore the session for this project?")):
 				self.session_storage.set_project_session(self.project_dir)
 
+		# read every file up front if asked to, instead of on first use
+		if(self.settings_manager.get_setting("preload_project_files")): self.load_all_buffers(progress_handler)
+
+		# the trigram index narrows down the files read by project searches: files changed since it was saved are
+		# dropped from it, and the files not in it are indexed in the background
+		self.buffers.set_trigram_index(None)
+		if(self.settings_manager.get_setting("trigram_index")):
+			trigram_index_file = os.path.join(self.project_dir, PROJECT_SETTINGS_DIR_NAME, PROJECT_TRIGRAM_INDEX_NAME)
+			memory_limit = int(self.settings_manager.get_setting("trigram_index_memory_limit_mb") * 1024 * 1024)
+			trigram_index = TrigramIndex.load(self.project_dir, trigram_index_file, memory_limit)
+			trigram_index.revalidate(file_index)
+			self.buffers.set_trigram_index(trigram_index, text_files)
+
 		# complete load process
+		file_index.save()
 		if(progress_handler != None): progress_handler("Ready", None)
 		
 	def open_files_from_commandline_args(self, progress_handler = None):
@@ -215,6 +239,19 @@ class AshEditorApp:
 			progress_line = PROGRESS_BAR_THIN_LINE * int((progress/100) * (self.screen_width - 9 - len(msg)))
 			self.main_window.repaint(f"{int(progress)}% {progress_line} {msg}")	
 
+	# polls the keyboard while a long operation runs on the UI thread: True if it should be cancelled
+	def is_operation_cancelled(self):
+		self.main_window.win.timeout(0)
+		ch = self.main_window.win.getch()
+		return (ch > -1 and KeyBindings.is_key(ch, "CANCEL_OPERATION"))
+
+	# reads all files of the project which have not been read yet, returns False if cancelled by the user
+	def load_all_buffers(self, progress_handler = None):
+		if(progress_handler == None): progress_handler = self.progress_handler
+		result = self.buffers.load_all(progress_handler, self.is_operation_cancelled)
+		progress_handler("Ready" if result else "Loading cancelled", None)
+		return result
+
 	# called on app_exit
 	def __destroy(self):
 		self.buffers.destroy()		
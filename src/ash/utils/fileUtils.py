@@ -10,6 +10,14 @@ import ash
 from ash.utils import *
 from ash.utils.utils import *
 
+import itertools
+import locale
+import stat
+import uuid
+
+READ_CHUNK_SIZE		= 1024 * 1024		# bytes read at a time by read_text_lines()
+WRITE_BATCH_LINES	= 8192				# lines joined and encoded at a time by write_text_lines()
+
 def normalized_path(path):
 	if(path == None): return None
 	return os.path.abspath(os.path.expanduser(path))
@@ -83,31 +91,94 @@ def predict_file_encoding(filename, n = 20):
 	enc = chardet.detect(rawdata)["encoding"].lower()
 	return ("utf-8" if enc == "ascii" else enc)		# assume UTF-8
 
+# reads a text file in large binary chunks, decoding them incrementally, and returns its lines (without the newlines)
+# progress(bytes_read, total_size) is called after every chunk: if it returns False, reading stops and None is returned
+def read_text_lines(filename, encoding, progress = None):
+	if(encoding == None): encoding = locale.getpreferredencoding(False)		# as open() does
+	decoder = codecs.getincrementaldecoder(encoding)()
+	lines = list()
+	tail = ""
+	with open(filename, "rb") as f:
+		total_size = os.fstat(f.fileno()).st_size
+		bytes_read = 0
+		while(True):
+			data = f.read(READ_CHUNK_SIZE)
+			bytes_read += len(data)
+			text = tail + decoder.decode(data, len(data) == 0)
+			chunk_lines = text.split("\n")
+			tail = chunk_lines.pop()		# the last line may go on in the next chunk
+			lines.extend(chunk_lines)
+			if(len(data) == 0): break
+			if(progress != None and progress(bytes_read, total_size) == False): return None
+	lines.append(tail)
+	return lines
+
+# writes lines (separated by newlines) to a text file, encoding them in large batches; the text is written to a
+# temporary file next to the file, which is flushed to disk and then renamed over it, so that the file is never left
+# half-written. The permissions of the file are kept, and if it is a symbolic link, the file it points to is replaced
+def write_text_lines(filename, lines, encoding):
+	if(encoding == None): encoding = locale.getpreferredencoding(False)		# as open() does
+	filename = os.path.realpath(filename)
+	dirname = os.path.dirname(filename)
+	temp_file = os.path.join(dirname, "." + get_file_title(filename) + "." + uuid.uuid4().hex[:8] + ".tmp")
+	encoder = codecs.getincrementalencoder(encoding)()
+
+	try:
+		with os.fdopen(os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666), "wb") as f:
+			line_iter = iter(lines)
+			separator = ""
+			while(True):
+				batch = list(itertools.islice(line_iter, WRITE_BATCH_LINES))
+				if(len(batch) == 0): break
+				f.write(encoder.encode(separator + "\n".join(batch)))
+				separator = "\n"
+			f.write(encoder.encode("", True))
+			f.flush()
+			os.fsync(f.fileno())
+		if(os.path.isfile(filename)): os.chmod(temp_file, stat.S_IMODE(os.stat(filename).st_mode))
+		os.replace(temp_file, filename)
+	except:
+		if(os.path.isfile(temp_file)): os.remove(temp_file)
+		raise
+
+	# make the rename itself durable
+	try:
+		dir_fd = os.open(dirname, os.O_RDONLY)
+		try:
+			os.fsync(dir_fd)
+		finally:
+			os.close(dir_fd)
+	except OSError:
+		pass
+
 # returns the size of a filename formatted in units
 def get_file_size(filename):
 	if(filename == None): 
 		return None
 	else:
-		bytes = os.stat(filename).st_size
-		if(bytes < 1000): return str(bytes) + " bytes"
-		kb = bytes / 1024
-		if(kb >= 1000):
-			mb = kb / 1024
-			if(mb >= 1000):
-				gb = mb / 1024
-				if(gb >= 1000):
-					tb = gb / 1024
-					if(tb >= 1000):
-						pb = tb / 1024
-						return str(round(pb,2)) + " PB"
-					else:
-						return str(round(tb,2)) + " KB"
+		return get_size_as_string(os.stat(filename).st_size)
+
+# returns a size (in bytes) formatted in units
+def get_size_as_string(bytes):
+	if(bytes < 1000): return str(bytes) + " bytes"
+	kb = bytes / 1024
+	if(kb >= 1000):
+		mb = kb / 1024
+		if(mb >= 1000):
+			gb = mb / 1024
+			if(gb >= 1000):
+				tb = gb / 1024
+				if(tb >= 1000):
+					pb = tb / 1024
+					return str(round(pb,2)) + " PB"
 				else:
-					return str(round(gb,2)) + " GB"
+					return str(round(tb,2)) + " TB"
 			else:
-				return str(round(mb,2)) + " MB"
+				return str(round(gb,2)) + " GB"
 		else:
-			return str(round(kb,2)) + " KB"
+			return str(round(mb,2)) + " MB"
+	else:
+		return str(round(kb,2)) + " KB"
 
 # get the mime-type of a file
 def get_textfile_mimetype(filename):
@@ -44,6 +44,13 @@ class SettingsManager:
 			"wrap_text"					: False,
 			"hard_wrap"					: True,
 			"syntax_highlighting"		: True,
+			"background_highlighting"	: True,
+			"preload_project_files"		: False,
+			"project_search_max_results"	: 1000,
+			"save_after_project_replace"	: False,
+			"read_only_file_size_mb"		: 256,
+			"trigram_index"				: False,
+			"trigram_index_memory_limit_mb"	: 128,
 			"auto_close_matching_pairs"	: False,
 			"git_diff"					: True,
 			"supported_mime_types"		: [
@@ -53,7 +60,10 @@ class SettingsManager:
 			],
 			"supported_file_types"		: [
 											"pyx"
-			]
+			],
+			"text_storage_engine"		: "rope",
+			"undo_memory_limit_mb"		: 16,
+			"total_undo_memory_limit_mb"	: 64
 		}
 		return settings
 